@@ -126,6 +126,14 @@ def load_report_data(base_name):
     raw_path_pattern = os.path.join(PREPROC_DIR, f"{base_name}*_cleaned_with_sentiment.jsonl")
     found_files = glob.glob(raw_path_pattern)
     if found_files:
+        # Resumen parcial publicado por sentiment_node tras cada lote (puntuación progresiva)
+        partial_file = found_files[0].replace(".jsonl", "_partial.json")
+        if os.path.exists(partial_file):
+            try:
+                with open(partial_file, 'r', encoding='utf-8') as f:
+                    data["sentiment_progress"] = json.load(f)
+            except (OSError, ValueError):
+                pass
         raw_rows = []
         with open(found_files[0], 'r', encoding='utf-8') as f:
             for line in f:
@@ -234,6 +242,11 @@ if 'current_base_name' in st.session_state:
     # --- TAB 2: SENTIMIENTO Y EVIDENCIA (RESTAURADA) ---
     with tab2:
         df_raw = data.get("raw_df")
+        progress = data.get("sentiment_progress")
+        if progress and not progress.get("complete"):
+            st.progress(progress.get("fraction", 0.0))
+            st.caption(f"⏳ Puntuación en curso ({progress.get('priority')}): {progress.get('processed')} posts listos "
+                       f"({progress.get('fraction', 0.0):.0%}). Los gráficos muestran los de mayor prioridad primero.")
         if df_raw is not None and not df_raw.empty:
             
             col_chart1, col_chart2 = st.columns(2)
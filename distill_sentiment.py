@@ -0,0 +1,279 @@
+# distill_sentiment.py
+# Destilación de los modelos de producción (maestros RoBERTa-base) a alumnos más
+# chicos para CPU: se conservan capas repartidas del maestro y el alumno aprende de
+# las probabilidades suaves del maestro (KL con temperatura) + las etiquetas reales.
+# El alumno queda en models/students/<maestro> y se usa con SENTIMENT_BACKEND=student.
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import numpy as np
+import torch
+import torch.nn.functional as F
+from datasets import load_dataset, load_from_disk
+from transformers import (
+    AutoConfig,
+    AutoTokenizer,
+    AutoModelForSequenceClassification,
+    TrainingArguments,
+    Trainer,
+    DataCollatorWithPadding
+)
+
+from train_sentiment import tokenize_split
+from src.agents.sentiment.sentiment_hf import _model_name_for, _model_revision, student_dir
+
+# --- CONFIGURACIÓN ---
+# Datos de destilación por idioma (los mismos que usan los maestros)
+DISTILL_DATA = {
+    "es": ("cardiffnlp/tweet_sentiment_multilingual", "spanish"),
+    "en": ("cardiffnlp/tweet_eval", "sentiment"),
+}
+DEFAULT_LAYERS = 6          # de 12 en RoBERTa-base → ~2x más rápido en CPU
+DEFAULT_TEMPERATURE = 2.0
+DEFAULT_ALPHA = 0.7         # peso de la pérdida de destilación vs. etiquetas reales
+DISTILL_CACHE_DIR = "./data/cache/distill"
+# ---------------------
+
+
+# ---------------------------------------------------------
+# ALUMNO: capas repartidas del maestro
+# ---------------------------------------------------------
+def pick_layers(n_teacher: int, n_student: int):
+    """Índices de capas del maestro que hereda el alumno (primera y última incluidas)."""
+    if n_student >= n_teacher:
+        return list(range(n_teacher))
+    if n_student == 1:
+        return [n_teacher - 1]
+    return [round(i * (n_teacher - 1) / (n_student - 1)) for i in range(n_student)]
+
+
+def build_student(teacher, n_layers: int):
+    keep = pick_layers(teacher.config.num_hidden_layers, n_layers)
+    config = AutoConfig.from_pretrained(teacher.name_or_path, num_hidden_layers=len(keep))
+    student = AutoModelForSequenceClassification.from_config(config)
+
+    t_state = teacher.state_dict()
+    layer_re = re.compile(r"\.layer\.(\d+)\.")
+    state = {}
+    for name in student.state_dict():
+        m = layer_re.search(name)
+        src = layer_re.sub(f".layer.{keep[int(m.group(1))]}.", name, count=1) if m else name
+        state[name] = t_state[src].clone()
+    student.load_state_dict(state)
+    print(f"   🧬 Alumno: {len(keep)} capas del maestro {keep}")
+    return student
+
+
+# ---------------------------------------------------------
+# ETIQUETAS SUAVES DEL MAESTRO (cacheadas en disco)
+# ---------------------------------------------------------
+def _teacher_logits(teacher, tokenized, collator, batch_size=64):
+    """Logits del maestro por ejemplo, en lotes ordenados por longitud (poco padding)."""
+    order = np.argsort(tokenized["length"])
+    out = np.zeros((len(tokenized), teacher.config.num_labels), dtype=np.float32)
+    cols = ["input_ids", "attention_mask"]
+    teacher.eval()
+    with torch.inference_mode():
+        for i in range(0, len(order), batch_size):
+            idx = order[i:i + batch_size]
+            feats = [{c: tokenized[int(j)][c] for c in cols} for j in idx]
+            batch = collator(feats)
+            out[idx] = teacher(**batch).logits.float().numpy()
+    return out
+
+
+def soft_labeled(split_ds, tokenizer, teacher, collator, num_proc):
+    tokenized = tokenize_split(split_ds, tokenizer, "fast", num_proc)
+    ident = {"teacher": teacher.name_or_path, "revision": _model_revision(teacher.name_or_path),
+             "dataset": tokenized._fingerprint}
+    key = hashlib.sha1(json.dumps(ident, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(DISTILL_CACHE_DIR, key)
+    if os.path.isdir(path):
+        print(f"   ♻️ Etiquetas suaves desde caché: {path}")
+        return load_from_disk(path)
+
+    print("   👩‍🏫 Calculando etiquetas suaves del maestro...")
+    logits = _teacher_logits(teacher, tokenized, collator)
+    labeled = tokenized.add_column("teacher_logits", logits.tolist())
+    tmp = f"{path}.tmp{os.getpid()}"
+    labeled.save_to_disk(tmp)
+    os.replace(tmp, path)
+    return load_from_disk(path)
+
+
+# ---------------------------------------------------------
+# ENTRENAMIENTO
+# ---------------------------------------------------------
+class DistillTrainer(Trainer):
+    """Pérdida = alpha · KL(alumno/T ‖ maestro/T) · T² + (1 - alpha) · CE(etiquetas)."""
+
+    def __init__(self, *args, temperature=DEFAULT_TEMPERATURE, alpha=DEFAULT_ALPHA, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.temperature = temperature
+        self.alpha = alpha
+
+    def compute_loss(self, model, inputs, return_outputs=False, **kwargs):
+        teacher_logits = inputs.pop("teacher_logits")
+        labels = inputs.pop("labels")
+        inputs.pop("length", None)
+        outputs = model(**inputs)
+        T = self.temperature
+        kd = F.kl_div(
+            F.log_softmax(outputs.logits / T, dim=-1),
+            F.softmax(teacher_logits / T, dim=-1),
+            reduction="batchmean",
+        ) * (T * T)
+        ce = F.cross_entropy(outputs.logits, labels)
+        loss = self.alpha * kd + (1 - self.alpha) * ce
+        return (loss, outputs) if return_outputs else loss
+
+
+def distill(lang, layers=DEFAULT_LAYERS, temperature=DEFAULT_TEMPERATURE, alpha=DEFAULT_ALPHA,
+            epochs=3, max_train_samples=None, num_proc=None):
+    teacher_name = _model_name_for(lang)
+    out_dir = student_dir(teacher_name)
+    num_proc = num_proc or min(4, os.cpu_count() or 1)
+    print(f"🚀 Destilando {os.path.basename(teacher_name)} → {layers} capas ({lang})...")
+
+    dataset_id, subset = DISTILL_DATA[lang]
+    train_ds = load_dataset(dataset_id, subset, split="train", trust_remote_code=True)
+    if max_train_samples:
+        train_ds = train_ds.select(range(min(max_train_samples, len(train_ds))))
+
+    tokenizer = AutoTokenizer.from_pretrained(teacher_name)
+    teacher = AutoModelForSequenceClassification.from_pretrained(teacher_name)
+    collator = DataCollatorWithPadding(tokenizer=tokenizer)
+
+    train = soft_labeled(train_ds, tokenizer, teacher, collator, num_proc)
+    student = build_student(teacher, layers)
+    del teacher
+
+    args = TrainingArguments(
+        output_dir=out_dir,
+        learning_rate=5e-5,           # el alumno arranca más lejos del óptimo que en un fine-tune
+        per_device_train_batch_size=32,
+        num_train_epochs=epochs,
+        weight_decay=0.01,
+        save_strategy="no",
+        group_by_length=True,
+        length_column_name="length",
+        remove_unused_columns=False,  # teacher_logits no es argumento del modelo
+        report_to=[],
+    )
+    trainer = DistillTrainer(
+        model=student,
+        args=args,
+        train_dataset=train,
+        tokenizer=tokenizer,
+        data_collator=collator,
+        temperature=temperature,
+        alpha=alpha,
+    )
+    t0 = time.perf_counter()
+    trainer.train()
+    train_s = time.perf_counter() - t0
+
+    tmp = f"{out_dir}.tmp{os.getpid()}"
+    trainer.save_model(tmp)
+    tokenizer.save_pretrained(tmp)
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.replace(tmp, out_dir)
+    print(f"💾 Alumno guardado en: {out_dir}")
+    return {"lang": lang, "layers": layers, "train_samples": len(train),
+            "train_s": round(train_s, 1), "path": out_dir}
+
+
+# ---------------------------------------------------------
+# REPORTE: precisión vs. latencia (datasets de sentiment_eval_hf)
+# ---------------------------------------------------------
+def _latency(lang, backend, texts, batch_size=32):
+    from src.agents.sentiment.sentiment_hf import (
+        predict_english, predict_english_batch, predict_spanish, predict_spanish_batch,
+    )
+    one, many = (predict_english, predict_english_batch) if lang == "en" else (predict_spanish, predict_spanish_batch)
+    one(texts[0], backend=backend)  # carga + warm-up
+    lat = []
+    for t in texts[:200]:
+        t0 = time.perf_counter()
+        one(t, backend=backend)
+        lat.append(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    many(texts, batch_size=batch_size, backend=backend)
+    batch_s = time.perf_counter() - t0
+    return {
+        "p50_ms": round(1000 * float(np.percentile(lat, 50)), 2),
+        "p95_ms": round(1000 * float(np.percentile(lat, 95)), 2),
+        "batch_texts_per_s": round(len(texts) / batch_s, 1),
+    }
+
+
+def tradeoff_report(lang, eval_samples=1000, backends=("torch", "student")):
+    from src.agents.sentiment.sentiment_eval_hf import DATASETS, dataset_config, _eval_dataset, _load_examples
+
+    report = {}
+    for name, base in DATASETS.items():
+        if base["lang_hint"] != lang:
+            continue
+        cfg = dataset_config(name, None, "test", eval_samples)
+        texts, _ = _load_examples(cfg["dataset_id"], cfg["subset"], cfg["split"], cfg["text_field"],
+                                  cfg["label_field"], cfg["label_mapping"], cfg["max_samples"])
+        if not texts:
+            # split vacío o sin etiquetas mapeables: no hay con qué medir
+            print(f"   ⚠️ {name}: sin ejemplos en '{cfg['split']}', se omite del reporte.")
+            continue
+        per_backend = {}
+        for b in backends:
+            res = _eval_dataset(**cfg, backend=b)
+            per_backend[b] = {
+                **{k: res[k] for k in ("n", "accuracy", "macro_f1", "mcc", "ci")},
+                **_latency(lang, b, texts),
+            }
+        ref, stu = per_backend[backends[0]], per_backend[backends[-1]]
+        per_backend["delta"] = {
+            "macro_f1": round(stu["macro_f1"] - ref["macro_f1"], 4),
+            "speedup_single": round(ref["p50_ms"] / stu["p50_ms"], 2) if stu["p50_ms"] else None,
+            "speedup_batch": round(stu["batch_texts_per_s"] / ref["batch_texts_per_s"], 2)
+            if ref["batch_texts_per_s"] else None,
+        }
+        report[name] = per_backend
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Destila los modelos de sentimiento ES/EN a alumnos chicos para CPU")
+    ap.add_argument("--lang", choices=["es", "en", "both"], default="both")
+    ap.add_argument("--layers", type=int, default=DEFAULT_LAYERS, help="Capas del alumno (de 12 del maestro)")
+    ap.add_argument("--temperature", type=float, default=DEFAULT_TEMPERATURE)
+    ap.add_argument("--alpha", type=float, default=DEFAULT_ALPHA)
+    ap.add_argument("--epochs", type=int, default=3)
+    ap.add_argument("--max_train_samples", type=int, default=None)
+    ap.add_argument("--num_proc", type=int, default=None)
+    ap.add_argument("--report_only", action="store_true", help="No entrena: solo compara maestro vs alumno")
+    ap.add_argument("--eval_samples", type=int, default=1000)
+    ap.add_argument("--report_out", default=None, help="Ruta JSON del reporte")
+    args = ap.parse_args()
+
+    langs = ["es", "en"] if args.lang == "both" else [args.lang]
+    report = {}
+    for lang in langs:
+        entry = {}
+        if not args.report_only:
+            entry["distill"] = distill(lang, args.layers, args.temperature, args.alpha,
+                                       args.epochs, args.max_train_samples, args.num_proc)
+        entry["tradeoff"] = tradeoff_report(lang, args.eval_samples)
+        report[lang] = entry
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.report_out:
+        os.makedirs(os.path.dirname(args.report_out) or ".", exist_ok=True)
+        with open(args.report_out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,17 @@ import json
 from langchain_core.messages import ToolMessage
 from src.agents.state import AgentState
 from src.utils.text_cleaning import basic_clean
+from src.utils.lang_id import annotate_records, detect_batch
 
 # --- IMPORTACIONES DE TU LÓGICA AVANZADA (TESIS) ---
 try:
     from src.agents.sentiment.chunker import chunk_text
     from src.agents.sentiment.sentiment_precise import SentimentPrecise
-    from src.agents.sentiment.sentiment_aggregator import aggregate_post
+    from src.agents.sentiment.sentiment_aggregator import aggregate_post, aggregate_posts
+    from src.agents.sentiment.sentiment_cache import SentimentCache
+    from src.agents.sentiment.sentiment_checkpoint import CheckpointedWriter, iter_jsonl_offsets
+    from src.agents.sentiment.sentiment_progress import PartialAggregate, prioritized_rows, priority_key
+    from src.agents.sentiment.sentiment_sampling import SamplePlan, estimate_label_distribution
     ADVANCED_MODE = True
     print("   🎓 MODO TESIS: Componentes avanzados (Chunker/Precise/Aggregator) cargados.")
 except ImportError as e:
@@ -24,10 +29,24 @@ _ANALYZER = None
 def get_analyzer():
     global _ANALYZER
     if _ANALYZER is None and ADVANCED_MODE:
+        # Servidor explícito o daemon de modelos ya corriendo (python -m src.model_daemon start)
+        from src.model_daemon import FallbackAnalyzer, discover
         # SentimentPrecise ya maneja la carga de modelos HF internamente
-        _ANALYZER = SentimentPrecise()
+        # Caché persistente por chunk: los reruns de un tema casi no cuestan (SENTIMENT_CACHE=0 la apaga)
+        local = lambda: SentimentPrecise(cache=SentimentCache.from_env())
+        server_url = os.getenv("SENTIMENT_SERVER_URL") or discover()
+        if server_url:
+            # Servidor local con micro-batching: no cargamos modelos en este proceso
+            # (si deja de responder, el analizador vuelve a modelos locales)
+            print(f"   🛰️ Usando servidor de sentimiento: {server_url}")
+            _ANALYZER = FallbackAnalyzer(server_url, local)
+        else:
+            _ANALYZER = local()
     return _ANALYZER
 
+# Posts por lote de identificación de idioma en la limpieza
+LANGID_BLOCK = int(os.getenv("LANGID_BLOCK", "50000"))
+
 # --- NODO DE LIMPIEZA (Se mantiene igual, robusto) ---
 def cleaning_node(state: AgentState):
     print("\n--- 🧹 INICIANDO NODO DE LIMPIEZA (GRADO MILITAR) ---")
@@ -62,7 +81,16 @@ def cleaning_node(state: AgentState):
     
     count = 0
     kept = 0
-    
+    block = []
+
+    def _flush():
+        # Idioma por post en lote (n-gramas de caracteres); sin evidencia queda
+        # el search_lang del colector. Los posts mixtos llevan lang_mixed.
+        for clean_obj in annotate_records(block):
+            json.dump(clean_obj, fout)
+            fout.write('\n')
+        block.clear()
+
     try:
         with open(input_path, 'r', encoding='utf-8') as fin, open(output_path, 'w', encoding='utf-8') as fout:
             for line in fin:
@@ -84,13 +112,20 @@ def cleaning_node(state: AgentState):
                             "post_id": obj.get("id", "N/A"),
                             "lang": obj.get("lang", "es"),
                             "timestamp": obj.get("created_utc", ""),
+                            # Engagement para la puntuación priorizada (SENTIMENT_PRIORITY)
+                            "score": (obj.get("metadata") or {}).get("score", obj.get("score")),
+                            "num_comments": (obj.get("metadata") or {}).get("num_comments", obj.get("num_comments")),
+                            # Estrato del modo muestreo (SENTIMENT_SAMPLE_MARGIN)
+                            "subreddit": (obj.get("metadata") or {}).get("subreddit", obj.get("subreddit")),
                             "source_file": input_path
                         }
-                        json.dump(clean_obj, fout)
-                        fout.write('\n')
+                        block.append(clean_obj)
                         kept += 1
+                        if len(block) >= LANGID_BLOCK:
+                            _flush()
                     count += 1
                 except: continue
+            _flush()
         
         print(f"   ✨ Limpieza completada: {kept} documentos útiles (de {count} originales).")
         ctx["last_cleaned_path"] = output_path
@@ -101,6 +136,146 @@ def cleaning_node(state: AgentState):
 
 
 # --- NODO DE SENTIMIENTO ---
+# Micro-batching entre posts: se chunkea un bloque de posts completo y todos sus
+# chunks se puntúan juntos en lotes homogéneos por idioma (analyze_batch).
+# SENTIMENT_MICROBATCH=0 vuelve al recorrido post a post / chunk a chunk.
+MICROBATCH = os.getenv("SENTIMENT_MICROBATCH", "1") != "0"
+MICROBATCH_POSTS = int(os.getenv("SENTIMENT_MICROBATCH_POSTS", "2000"))
+
+# Modo de chunking: "words" (tokens por espacios) o "subword" (tokenizer del modelo
+# ruteado; cada chunk cabe exacto en max_position_embeddings y se puntúa entero)
+CHUNK_MODE = os.getenv("SENTIMENT_CHUNK_MODE", "words").lower()
+SUBWORD_OVERLAP = int(os.getenv("SENTIMENT_SUBWORD_OVERLAP", "16"))
+
+# Checkpoints: la salida se confirma por segmentos (<salida>.ckpt) y
+# SENTIMENT_RESUME=1 retoma un job caído sin repetir los post_id ya escritos.
+RESUME = os.getenv("SENTIMENT_RESUME", "0") == "1"
+CHECKPOINT_EVERY = int(os.getenv("SENTIMENT_CHECKPOINT_EVERY", "500"))
+
+# Prioridad: "none" (orden del archivo), "engagement", "recency" o "field:<campo>"
+# (ctx["sentiment_priority"] lo pisa y también acepta una función obj → float).
+# Tras cada lote se publica <salida>_partial.json con los agregados parciales.
+PRIORITY = os.getenv("SENTIMENT_PRIORITY", "none")
+
+# Muestreo: con SENTIMENT_SAMPLE_MARGIN > 0 (p. ej. 0.02 = ±2 pp) solo se puntúa una
+# muestra estratificada por subreddit × idioma × ventana (SENTIMENT_SAMPLE_BUCKET) y
+# cada post lleva "sample" para estimar la distribución con IC. score_remaining_node
+# puntúa después el resto sobre la misma salida.
+SAMPLE_MARGIN = float(os.getenv("SENTIMENT_SAMPLE_MARGIN", "0"))
+SAMPLE_CONFIDENCE = float(os.getenv("SENTIMENT_SAMPLE_CONFIDENCE", "0.95"))
+SAMPLE_BUCKET = os.getenv("SENTIMENT_SAMPLE_BUCKET", "week")
+SAMPLE_SEED = int(os.getenv("SENTIMENT_SAMPLE_SEED", "13"))
+
+def _post_key(obj):
+    pid = obj.get("post_id")
+    return None if pid in (None, "", "N/A") else str(pid)
+
+def _chunk_post(analyzer, original_obj):
+    # PASO 1: CHUNKING (Divide y Vencerás)
+    text = original_obj.get("text_norm", "")
+    if CHUNK_MODE == "subword":
+        if original_obj.get("lang_mixed"):
+            # post mixto: sus chunks pueden ir a cualquiera de los dos modelos → la ventana menor
+            tok, budget = min((analyzer.tokenizer_for(l) for l in ("es", "en")), key=lambda tb: tb[1])
+        else:
+            tok, budget = analyzer.tokenizer_for(original_obj.get("lang"))
+        return chunk_text(text, max_tokens=budget, overlap=SUBWORD_OVERLAP, tokenizer=tok)
+    # Usamos tu script chunker.py para romper textos largos
+    # max_tokens=300, overlap=50 (para no perder contexto en cortes)
+    return chunk_text(text, max_tokens=300, overlap=50)
+
+def _chunk_langs(posts, per_post):
+    """
+    Idioma de cada chunk: el del post, salvo en posts mixtos (lang_mixed), donde
+    se detecta por chunk (un solo lote para todo el bloque) para que cada chunk
+    vaya a su modelo.
+    """
+    out = [[obj.get("lang")] * len(chunks) for obj, chunks in zip(posts, per_post)]
+    mixed = [(k, i) for k, (obj, chunks) in enumerate(zip(posts, per_post))
+             if obj.get("lang_mixed") for i in range(len(chunks))]
+    if mixed:
+        found = detect_batch([per_post[k][i][0] for k, i in mixed])
+        for (k, i), lang in zip(mixed, found):
+            if lang:
+                out[k][i] = lang
+    return out
+
+def _analyzed_chunk(i, chunk, analysis, lang):
+    chunk_txt, start, end = chunk
+    return {
+        "chunk_index": i,
+        "text": chunk_txt,
+        "span_tokens": [start, end],
+        "sentiment": analysis,
+        "lang": lang
+    }
+
+def _build_output(original_obj, analyzed_chunks, final_result=None):
+    # PASO 3: AGREGACIÓN (Reduce)
+    # Usamos tu sentiment_aggregator.py para ponderar por longitud
+    # (en micro-batch llega ya calculado por el motor columnar de todo el bloque)
+    if final_result is None:
+        final_result = aggregate_post(analyzed_chunks)
+
+    # PASO 4: ESTRUCTURAR SALIDA
+    # Combinamos la metadata original con el resultado científico
+    return {
+        **original_obj,
+        "sentiment": {
+            "label": final_result["label_final"],
+            "confidence": final_result["score_final"],
+            # Guardamos el chunk decisivo para trazabilidad (evidencia)
+            "decider_snippet": final_result.get("decider_chunk", {}).get("text_snippet")
+        },
+        "analysis_meta": {
+            "total_chunks": final_result["total_chunks"],
+            "method": "chunking_weighted_aggregation"
+        }
+    }
+
+def _score_post(analyzer, original_obj):
+    """Ruta clásica: un forward por chunk."""
+    chunks = _chunk_post(analyzer, original_obj)
+    langs = _chunk_langs([original_obj], [chunks])[0]
+    analyzed_chunks = []
+    # PASO 2: INFERENCIA POR CHUNK (Map)
+    for i, (chunk, lang) in enumerate(zip(chunks, langs)):
+        # Le pasamos el hint del idioma del post original (o del chunk si es mixto)
+        analysis = analyzer.analyze(chunk[0], lang_hint=lang)
+        analyzed_chunks.append(_analyzed_chunk(i, chunk, analysis, lang))
+    return _build_output(original_obj, analyzed_chunks)
+
+def _score_block(analyzer, block):
+    """
+    Ruta micro-batch: chunkea todos los posts del bloque, puntúa todos los chunks
+    en lotes grandes y los reagrupa por post antes de agregar.
+    """
+    per_post = [_chunk_post(analyzer, obj) for obj in block]
+    per_post_langs = _chunk_langs(block, per_post)
+    texts, hints = [], []
+    for chunks, langs in zip(per_post, per_post_langs):
+        for chunk, lang in zip(chunks, langs):
+            texts.append(chunk[0])
+            hints.append(lang)
+
+    analyses = analyzer.analyze_batch(texts, hints)
+
+    analyzed = []
+    pos = 0
+    for chunks, langs in zip(per_post, per_post_langs):
+        analyzed.append([
+            _analyzed_chunk(i, chunk, analyses[pos + i], lang)
+            for i, (chunk, lang) in enumerate(zip(chunks, langs))
+        ])
+        pos += len(chunks)
+
+    # Agregación de todo el bloque en una pasada (NumPy)
+    finals = aggregate_posts(analyzed)
+    return [
+        _build_output(obj, analyzed_chunks, final_result)
+        for obj, analyzed_chunks, final_result in zip(block, analyzed, finals)
+    ]
+
 def sentiment_node(state: AgentState):
     print("\n--- 🧠 INICIANDO NODO DE SENTIMIENTO (Arquitectura Avanzada) ---")
     ctx = dict(state.get("context", {}))
@@ -118,69 +293,117 @@ def sentiment_node(state: AgentState):
         return {"context": ctx}
 
     processed_count = 0
+    priority = ctx.get("sentiment_priority", PRIORITY)
+    prio_name = priority if isinstance(priority, str) else getattr(priority, "__name__", "custom")
+
+    def _write(writer, partial, output_objs, offset, last_obj):
+        nonlocal processed_count
+        writer.write(output_objs, offset)
+        processed_count += len(output_objs)
+        partial.update(output_objs, input_offset=offset,
+                       threshold=prio_fn(last_obj) if prio_fn else None)
+        print(f"   Processing {processed_count}...", end="\r")
+
+    def _publish(writer, partial):
+        writer.commit()  # el resumen parcial solo cuenta lo que ya está en disco
+        partial.publish()
     
+    # "Puntuar el resto después": misma salida, se saltan los post_id ya escritos
+    fill = bool(ctx.get("sentiment_score_remaining"))
+    sampling = ctx.get("sentiment_sample") if fill else None
+    margin = 0.0 if fill else float(ctx.get("sentiment_sample_margin", SAMPLE_MARGIN) or 0)
+
     try:
-        with open(input_path, 'r', encoding='utf-8') as fin, \
-             open(output_path, 'w', encoding='utf-8') as fout:
-            
-            for line in fin:
-                original_obj = json.loads(line)
-                text = original_obj.get("text_norm", "")
-                
-                # PASO 1: CHUNKING (Divide y Vencerás)
-                # Usamos tu script chunker.py para romper textos largos
-                # max_tokens=300, overlap=50 (para no perder contexto en cortes)
-                chunks_data = chunk_text(text, max_tokens=300, overlap=50)
-                
-                analyzed_chunks = []
-                
-                # PASO 2: INFERENCIA POR CHUNK (Map)
-                for i, (chunk_txt, start, end) in enumerate(chunks_data):
-                    # Usamos tu SentimentPrecise para predecir
-                    # Le pasamos el hint del idioma del post original
-                    analysis = analyzer.analyze(chunk_txt, lang_hint=original_obj.get("lang"))
-                    
-                    analyzed_chunks.append({
-                        "chunk_index": i,
-                        "text": chunk_txt,
-                        "span_tokens": [start, end],
-                        "sentiment": analysis,
-                        "lang": original_obj.get("lang")
-                    })
-
-                # PASO 3: AGREGACIÓN (Reduce)
-                # Usamos tu sentiment_aggregator.py para ponderar por longitud
-                final_result = aggregate_post(analyzed_chunks)
-                
-                # PASO 4: ESTRUCTURAR SALIDA
-                # Combinamos la metadata original con el resultado científico
-                output_obj = {
-                    **original_obj,
-                    "sentiment": {
-                        "label": final_result["label_final"],
-                        "confidence": final_result["score_final"],
-                        # Guardamos el chunk decisivo para trazabilidad (evidencia)
-                        "decider_snippet": final_result.get("decider_chunk", {}).get("text_snippet")
-                    },
-                    "analysis_meta": {
-                        "total_chunks": final_result["total_chunks"],
-                        "method": "chunking_weighted_aggregation"
-                    }
-                }
-
-                json.dump(output_obj, fout)
-                fout.write('\n')
-                processed_count += 1
-                
-                if processed_count % 10 == 0: print(f"   Processing {processed_count}...", end="\r")
+        prio_fn = priority_key(priority)
+        plan = None
+        if sampling:
+            plan = SamplePlan(input_path, sampling["margin"], confidence=sampling["confidence"],
+                              bucket=sampling["time_bucket"], seed=sampling["seed"], key=prio_fn)
+        elif margin > 0:
+            plan = SamplePlan(input_path, margin, confidence=SAMPLE_CONFIDENCE,
+                              bucket=SAMPLE_BUCKET, seed=SAMPLE_SEED, key=prio_fn)
+
+        writer = CheckpointedWriter(output_path, input_path, resume=RESUME or fill,
+                                    key=_post_key, every=CHECKPOINT_EVERY)
+        finished = False
+        partial = None
+        try:
+            if plan is not None:
+                # Igual que con prioridad: fuera del orden del archivo el offset queda en 0
+                objs = plan.remaining() if fill else plan.rows()
+                total = plan.population if fill else plan.n
+                partial = PartialAggregate(output_path, priority=prio_name, total=total)
+                rows = writer.pending((0, obj) for obj in objs)
+                if fill:
+                    print(f"   🧩 Completando la muestra: {plan.population - plan.n} posts restantes.")
+                else:
+                    print(f"   🎲 Muestreo: {plan.n} de {plan.population} posts en {len(plan.sizes)} estratos "
+                          f"(±{plan.margin:.1%} al {plan.confidence:.0%}, "
+                          f"previsto ±{plan.planned_margin:.1%}).")
+            elif prio_fn is None:
+                partial = PartialAggregate(output_path, input_path=input_path)
+                partial.input_offset = writer.offset
+                rows = writer.pending(iter_jsonl_offsets(input_path, writer.offset))
+            else:
+                # Fuera del orden del archivo el offset de entrada no sirve: queda en 0
+                # y la reanudación se apoya solo en los post_id ya escritos
+                total, objs = prioritized_rows(input_path, prio_fn)
+                partial = PartialAggregate(output_path, priority=prio_name, total=total)
+                rows = writer.pending((0, obj) for obj in objs)
+                print(f"   🎯 Prioridad '{prio_name}': {total} posts, primero los de más señal.")
+            if writer.written:
+                partial.load_existing()
+
+            if MICROBATCH:
+                block, offset = [], writer.offset
+                for offset, obj in rows:
+                    block.append(obj)
+                    if len(block) >= MICROBATCH_POSTS:
+                        _write(writer, partial, _score_block(analyzer, block), offset, block[-1])
+                        _publish(writer, partial)
+                        block = []
+                if block:
+                    _write(writer, partial, _score_block(analyzer, block), offset, block[-1])
+            else:
+                for offset, obj in rows:
+                    _write(writer, partial, [_score_post(analyzer, obj)], offset, obj)
+                    if processed_count % MICROBATCH_POSTS == 0:
+                        _publish(writer, partial)
+            finished = True
+        finally:
+            writer.close(finished)
+            if partial is not None:
+                partial.publish(complete=finished)
 
         print(f"\n   ✅ Análisis Científico completado: {processed_count} documentos.")
+        if writer.written > processed_count:
+            print(f"   ♻️ Reanudado: {writer.written - processed_count} documentos ya estaban escritos.")
         print(f"   💾 Guardado en: {os.path.basename(output_path)}")
+        if getattr(analyzer, "cache", None) is not None:
+            print(f"   🗃️ Caché de sentimiento: {analyzer.cache.stats()}")
         ctx["last_sentiment_path"] = output_path
+        ctx["sentiment_partial_path"] = partial.path
+        if plan is not None:
+            with open(output_path, "r", encoding="utf-8") as f:
+                estimate = estimate_label_distribution(
+                    (json.loads(line) for line in f if line.strip()), plan.confidence
+                )
+            shares = ", ".join(f"{l} {v['share']:.1%} [{v['ci_low']:.1%}–{v['ci_high']:.1%}]"
+                               for l, v in estimate["labels"].items())
+            print(f"   📐 Distribución estimada: {shares} (margen logrado ±{estimate['margin_achieved']:.1%})")
+            ctx["sentiment_sample"] = {**plan.summary(), "seed": sampling["seed"] if sampling else SAMPLE_SEED}
+            ctx["sentiment_label_estimate"] = estimate
+        ctx.pop("sentiment_score_remaining", None)
         
     except Exception as e:
         print(f"   ❌ Error crítico en pipeline de sentimiento: {e}")
         import traceback
         traceback.print_exc()
 
-    return {"context": ctx}
\ No newline at end of file
+    return {"context": ctx}
+
+
+def score_remaining_node(state: AgentState):
+    """Hook "puntuar el resto después": completa una corrida muestreada de sentiment_node."""
+    ctx = {**state.get("context", {}), "sentiment_score_remaining": True}
+    return sentiment_node({**state, "context": ctx})
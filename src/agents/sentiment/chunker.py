@@ -1,10 +1,14 @@
 # src/agents/sentiment/chunker.py
 from __future__ import annotations
 import os, json, re
+from bisect import bisect_right
+from functools import partial
+from itertools import islice
 from typing import Dict, List, Iterable, Tuple, Optional
 
 DEFAULT_MAX_TOKENS = 320     # tamaño objetivo del chunk
 DEFAULT_OVERLAP    = 40      # solapamiento entre chunks (tokens)
+DEFAULT_SUBWORD_OVERLAP = 16 # solapamiento en modo subword (tokens del modelo)
 CHUNK_PREFIX       = "ck"    # prefijo para id de chunk
 
 # Tokenización ligera (sin deps)
@@ -31,42 +35,196 @@ def _split_sentences(text: str) -> List[str]:
         return [text.strip()]
     return [p.strip() for p in parts if p and p.strip()]
 
-# Lógica de chunking
-def _greedy_pack(sentences: List[str], max_tokens: int) -> Tuple[str, int]:
-    """
-    Empaca oraciones hasta llegar (o aproximarse) a max_tokens.
-    Devuelve: texto_chunk, tokens_consumidos.
-    """
-    packed: List[str] = []
-    cur_tokens = 0
-    for s in sentences:
-        s_tokens = _count_tokens(s)
-        if cur_tokens == 0 and s_tokens >= max_tokens:
+# Lógica de chunking (lineal)
+# Cada oración se tokeniza una sola vez; el empaque, el avance y el solapamiento
+# se resuelven con sumas prefijas + bisect. Produce los mismos chunks que la
+# implementación original (ver chunk_text_legacy en chunker_bench.py), que era cuadrática.
+def _pack_sentences(
+    sentences: List[str],
+    max_tokens: int,
+    overlap: int,
+) -> List[Tuple[str, int, int]]:
+    sent_toks = [_simple_tokenize(s) for s in sentences]
+    prefix = [0]
+    for toks in sent_toks:
+        prefix.append(prefix[-1] + len(toks))
+
+    n = len(sentences)
+    chunks: List[Tuple[str, int, int]] = []
+    consumed_global = 0
+    sent_idx = 0
+
+    while sent_idx < n:
+        base = prefix[sent_idx]
+        first = prefix[sent_idx + 1] - base
+        if first >= max_tokens:
             # oraciones gigantes: recorta por tokens
-            toks = _simple_tokenize(s)
-            take = max_tokens
-            text = " ".join(toks[:take])
-            return text, take
-        if cur_tokens + s_tokens <= max_tokens:
-            packed.append(s)
-            cur_tokens += s_tokens
+            used_tokens = max_tokens
+            chunk_text_str = " ".join(sent_toks[sent_idx][:max_tokens])
+        else:
+            # greedy: todas las oraciones cuyo acumulado cabe en max_tokens
+            m = bisect_right(prefix, base + max_tokens, sent_idx + 1) - 1 - sent_idx
+            used_tokens = prefix[sent_idx + m] - base
+            chunk_text_str = " ".join(sentences[sent_idx:sent_idx + m])
+        if not chunk_text_str or used_tokens == 0:
+            break
+
+        start = consumed_global
+        end   = consumed_global + used_tokens
+        chunks.append((chunk_text_str, start, end))
+
+        # oraciones completas cubiertas por used_tokens (mínimo 1)
+        advanced = bisect_right(prefix, base + used_tokens, sent_idx) - 1 - sent_idx
+        if advanced == 0:
+            advanced = 1
+        win_end = sent_idx + advanced
+
+        # solapamiento: menor sufijo de la ventana con >= overlap tokens
+        i = bisect_right(prefix, prefix[win_end] - overlap, sent_idx, win_end) - 1
+        if i >= sent_idx:
+            back_sents = win_end - i - 1
+            tmp = prefix[win_end] - prefix[i]
         else:
+            back_sents = 0
+            tmp = 0
+
+        sent_idx = win_end - back_sents
+        consumed_global = end - (tmp if back_sents > 0 else 0)
+
+        if sent_idx >= n:
             break
-    return (" ".join(packed), cur_tokens)
+
+    return chunks
+
+# Chunking por subwords (tokenizer del modelo ruteado)
+# El texto se tokeniza una sola vez con offsets; los cortes caen en bordes de
+# palabra (o de token, si una sola palabra no cabe en la ventana).
+_FAST_TOKENIZERS: Dict[str, object] = {}
+
+def _offsets_tokenizer(tokenizer):
+    """Versión rápida del tokenizer (los offsets solo existen ahí); se carga una vez."""
+    if getattr(tokenizer, "is_fast", False):
+        return tokenizer
+    name = tokenizer.name_or_path
+    if name not in _FAST_TOKENIZERS:
+        from transformers import AutoTokenizer
+        _FAST_TOKENIZERS[name] = AutoTokenizer.from_pretrained(name, use_fast=True)
+    return _FAST_TOKENIZERS[name]
+
+def _n_subwords(tokenizer, text: str) -> int:
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+def _word_starts(text: str, offsets: List[Tuple[int, int]]) -> List[int]:
+    """Índice del primer token de cada palabra (los tokens de solo espacio van con la anterior)."""
+    starts: List[int] = []
+    prev_blank = True
+    for k, (s, e) in enumerate(offsets):
+        blank = not text[s:e].strip()
+        if not blank and (prev_blank or not text[offsets[k - 1][1]:s].strip() and s > offsets[k - 1][1]):
+            starts.append(k)
+        prev_blank = blank
+    return starts or [0]
+
+def _split_word(text: str, offsets: List[Tuple[int, int]], tokenizer, a: int, b: int,
+                max_tokens: int) -> List[Tuple[str, int, int]]:
+    """Parte una palabra más larga que la ventana (URL, emojis, hashtag) en bordes de token."""
+    pieces: List[Tuple[str, int, int]] = []
+    p = a
+    while p < b:
+        q = min(b, p + max_tokens)
+        while True:
+            # no cortar dentro de un carácter (emojis = varios tokens byte-level)
+            while q - p > 1 and q < b and offsets[q][0] < offsets[q - 1][1]:
+                q -= 1
+            piece = text[offsets[p][0]:offsets[q - 1][1]]
+            # suelto, el pedazo se re-tokeniza distinto en sus bordes: se verifica
+            if q - p <= 1 or _n_subwords(tokenizer, piece) <= max_tokens:
+                break
+            q -= 1
+        pieces.append((piece, p, q))
+        p = q
+    return pieces
+
+def _chunk_text_subword(
+    text: str,
+    tokenizer,
+    max_tokens: int,
+    overlap: int,
+) -> List[Tuple[str, int, int]]:
+    """
+    Ventanas de palabras que caben en max_tokens subwords del tokenizer.
+    El solapamiento se cuenta en subwords. Los spans devueltos están en subwords
+    de la tokenización del texto completo.
+    """
+    text = text.strip()
+    if not text:
+        return []
+    tok = _offsets_tokenizer(tokenizer)
+    offsets = [tuple(o) for o in tok(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]]
+    if not offsets:
+        return []
+    starts = _word_starts(text, offsets)
+    ends = starts[1:] + [len(offsets)]
+
+    # Al abrir un chunk su primera palabra pierde el espacio previo y puede
+    # tokenizarse distinto: solo esa palabra se re-tokeniza (con caché)
+    first_cache: Dict[str, int] = {}
+    def first_extra(w: int) -> int:
+        word = text[offsets[starts[w]][0]:offsets[ends[w] - 1][1]].strip()
+        if word not in first_cache:
+            first_cache[word] = _n_subwords(tok, word)
+        return first_cache[word] - (ends[w] - starts[w])
+
+    chunks: List[Tuple[str, int, int]] = []
+    i, last_j = 0, -1
+    n_words = len(starts)
+    while i < n_words:
+        a = starts[i]
+        extra = first_extra(i)
+        if ends[i] - a + extra > max_tokens:
+            chunks.extend(_split_word(text, offsets, tok, a, ends[i], max_tokens))
+            i, last_j = i + 1, i + 1
+            continue
+        # empaque greedy: última palabra cuyo fin cabe en la ventana
+        j = bisect_right(ends, a + max_tokens - extra, i)
+        if j <= last_j:
+            # la ventana solapada no llega más lejos que la anterior: sin solape
+            i = last_j
+            continue
+        b = ends[j - 1]
+        chunks.append((text[offsets[a][0]:offsets[b - 1][1]], a, b))
+        if j >= n_words:
+            break
+        last_j = j
+
+        # retroceso para solapar ~overlap subwords (siempre avanzando)
+        k = j
+        while k - 1 > i and b - starts[k - 1] <= overlap:
+            k -= 1
+        i = k
+
+    return chunks
 
 def chunk_text(
     text: str,
     *,
     max_tokens: int = DEFAULT_MAX_TOKENS,
-    overlap: int   = DEFAULT_OVERLAP
+    overlap: int   = DEFAULT_OVERLAP,
+    tokenizer = None,
 ) -> List[Tuple[str, int, int]]:
     """
     Divide un texto en chunks aproximados por tokens.
     Devuelve lista de tuplas: (chunk_text, token_start, token_end)
+
+    Si se pasa `tokenizer` (HF), max_tokens y overlap se cuentan en subwords
+    del modelo y cada chunk cabe entero en su ventana de contexto.
     """
     if not text:
         return []
 
+    if tokenizer is not None:
+        return _chunk_text_subword(text, tokenizer, max_tokens, overlap)
+
     # estrategia por oraciones con fallback a stream de tokens
     sentences = _split_sentences(text)
 
@@ -85,57 +243,7 @@ def chunk_text(
         return chunks
 
     # pack por oraciones
-    chunks: List[Tuple[str, int, int]] = []
-    consumed_global = 0
-    sent_idx = 0
-
-    while sent_idx < len(sentences):
-        chunk_text_str, used_tokens = _greedy_pack(sentences[sent_idx:], max_tokens)
-        if not chunk_text_str or used_tokens == 0:
-            break
-
-        start = consumed_global
-        end   = consumed_global + used_tokens
-        chunks.append((chunk_text_str, start, end))
-
-        # mover sent_idx según tokens aproximados consumidos
-        advanced = 0
-        used = 0
-        for k in range(sent_idx, len(sentences)):
-            stoks = _count_tokens(sentences[k])
-            if used + stoks <= used_tokens:
-                used += stoks
-                advanced += 1
-            else:
-                break
-        if advanced == 0:
-            # seguridad: evitar loop infinito
-            advanced = 1
-            used = _count_tokens(sentences[sent_idx])
-
-        # aplicar solapamiento en términos de oraciones
-        back_tokens = overlap
-        back_sents = 0
-        tmp = 0
-        for k in range(advanced):
-            idx = sent_idx + advanced - 1 - k
-            if idx < sent_idx:
-                break
-            tmp += _count_tokens(sentences[idx])
-            if tmp >= back_tokens:
-                back_sents = k  # retroceder k oraciones
-                break
-
-        sent_idx = sent_idx + advanced - back_sents
-        consumed_global = end - (tmp if back_sents > 0 else 0)
-
-        # clamps
-        if sent_idx <= 0:
-            sent_idx = 0
-        if sent_idx >= len(sentences):
-            break
-
-    return chunks
+    return _pack_sentences(sentences, max_tokens, overlap)
 
 # Construcción de objetos-chunk
 def build_chunk_records(
@@ -197,6 +305,12 @@ def build_chunk_records(
         return out
 
     total_chunks = len(chunks)
+    chunk_langs = [lang] * total_chunks
+    if item.get("lang_mixed") and total_chunks > 1:
+        # post con español e inglés: cada chunk lleva su idioma para rutearlo a su modelo
+        from src.utils.lang_id import detect_batch
+        chunk_langs = detect_batch([c[0] for c in chunks], default=lang)
+
     for idx, (c_text, t_start, t_end) in enumerate(chunks, start=1):
         ck_tokens = _count_tokens(c_text)
 
@@ -207,7 +321,7 @@ def build_chunk_records(
 
             "timestamp": timestamp,
             "channel": item.get("channel") or "reddit",
-            "lang": lang,
+            "lang": chunk_langs[idx - 1],
 
             "text": c_text,
             "span_tokens": [int(t_start), int(t_end)],
@@ -252,20 +366,114 @@ def _write_jsonl(path: str, records: Iterable[Dict]) -> None:
         for r in records:
             f.write(json.dumps(r, ensure_ascii=False) + "\n")
 
+def _write_jsonl_tokens(path: str, records: Iterable[Dict]) -> Dict[str, int]:
+    """Como _write_jsonl, pero además guarda los token ids de cada chunk en el sidecar."""
+    from src.agents.sentiment.sentiment_tokens import TokenStoreWriter, chunk_token_ids
+    out_dir = os.path.dirname(path) or "."
+    os.makedirs(out_dir, exist_ok=True)
+    with open(path, "wb") as f:
+        store = TokenStoreWriter(path)
+        for r in records:
+            f.write((json.dumps(r, ensure_ascii=False) + "\n").encode("utf-8"))
+            store.add(f.tell(), *chunk_token_ids(r))
+    return store.close()
+
+def _chunk_line(line: str, max_tokens: int, overlap: int, token_store: bool = False) -> Optional[List]:
+    """
+    Worker del modo paralelo: una línea JSONL → chunks ya serializados (None si se descarta).
+    Con token_store cada chunk va como (línea, ruta, token ids).
+    """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        item = json.loads(line)
+    except:
+        return None
+    chunks = build_chunk_records(item, max_tokens=max_tokens, overlap=overlap)
+    if token_store:
+        from src.agents.sentiment.sentiment_tokens import chunk_token_ids
+        return [(json.dumps(c, ensure_ascii=False) + "\n", *chunk_token_ids(c)) for c in chunks]
+    return [json.dumps(c, ensure_ascii=False) + "\n" for c in chunks]
+
+def _chunk_file_parallel(
+    input_path: str,
+    output_path: str,
+    max_tokens: int,
+    overlap: int,
+    workers: int,
+    window: int,
+    token_store: bool = False,
+) -> Dict[str, int]:
+    """
+    Streaming en ventanas de `window` líneas repartidas en un pool de procesos.
+    Memoria acotada (una ventana a la vez) y salida en el mismo orden que la entrada.
+    Con token_store los workers también tokenizan (cada uno carga su tokenizer).
+    """
+    import multiprocessing as mp
+
+    total_items = 0
+    total_chunks = 0
+    fn = partial(_chunk_line, max_tokens=max_tokens, overlap=overlap, token_store=token_store)
+    out_dir = os.path.dirname(output_path) or "."
+    os.makedirs(out_dir, exist_ok=True)
+
+    store = None
+    if token_store:
+        from src.agents.sentiment.sentiment_tokens import TokenStoreWriter
+        store = TokenStoreWriter(output_path)
+
+    with mp.get_context("spawn").Pool(workers) as pool, \
+         open(input_path, "r", encoding="utf-8") as fin, \
+         open(output_path, "wb") as fout:
+        while True:
+            lines = list(islice(fin, window))
+            if not lines:
+                break
+            chunksize = max(1, len(lines) // (workers * 4))
+            for serialized in pool.imap(fn, lines, chunksize=chunksize):
+                if serialized is None:
+                    continue
+                total_items += 1
+                total_chunks += len(serialized)
+                if store is None:
+                    fout.write("".join(serialized).encode("utf-8"))
+                    continue
+                for text, route, ids in serialized:
+                    fout.write(text.encode("utf-8"))
+                    store.add(fout.tell(), route, ids)
+
+    stats = {"items": total_items, "chunks": total_chunks}
+    if store is not None:
+        stats["tokens"] = store.close()["tokens"]
+    return stats
+
 def chunk_file(
     input_path: str,
     output_path: str,
     *,
     max_tokens: int = DEFAULT_MAX_TOKENS,
-    overlap: int   = DEFAULT_OVERLAP
+    overlap: int   = DEFAULT_OVERLAP,
+    workers: int = 1,
+    window: int = 20000,
+    token_store: bool = False,
 ) -> Dict[str, int]:
     """
     Lee el JSONL preprocesado y escribe un JSONL de chunks.
     Devuelve contadores.
+    Con workers > 1 procesa el archivo en streaming con un pool de procesos
+    (para entradas de varios GB); el resultado es idéntico al modo serial.
+    Con token_store además escribe los token ids de cada chunk para el modelo
+    al que se rutea (sidecar <salida>.tokens.bin/.npz, ver sentiment_tokens);
+    el runner de sentimiento los usa en vez de volver a tokenizar.
     """
     if not os.path.exists(input_path):
         raise FileNotFoundError(f"Input not found: {input_path}")
 
+    if workers > 1:
+        return _chunk_file_parallel(input_path, output_path, max_tokens, overlap, workers, max(1, window),
+                                    token_store)
+
     total_items = 0
     total_chunks = 0
 
@@ -278,6 +486,9 @@ def chunk_file(
             for c in chunks:
                 yield c
 
+    if token_store:
+        tokens = _write_jsonl_tokens(output_path, _gen())["tokens"]
+        return {"items": total_items, "chunks": total_chunks, "tokens": tokens}
     _write_jsonl(output_path, _gen())
     return {"items": total_items, "chunks": total_chunks}
 
@@ -289,12 +500,17 @@ if __name__ == "__main__":
     ap.add_argument("--out", dest="output_path", required=True, help="Ruta del JSONL de chunks")
     ap.add_argument("--max_tokens", type=int, default=DEFAULT_MAX_TOKENS)
     ap.add_argument("--overlap", type=int, default=DEFAULT_OVERLAP)
+    ap.add_argument("--workers", type=int, default=1, help="Procesos para el modo streaming paralelo")
+    ap.add_argument("--token_store", action="store_true",
+                    help="Guarda también los token ids del modelo ruteado (sidecar .tokens.bin/.npz)")
     args = ap.parse_args()
 
     stats = chunk_file(
         args.input_path,
         args.output_path,
         max_tokens=args.max_tokens,
-        overlap=args.overlap
+        overlap=args.overlap,
+        workers=args.workers,
+        token_store=args.token_store,
     )
     print(f"✅ Chunking OK → {args.output_path} | items={stats['items']} chunks={stats['chunks']}")
@@ -0,0 +1,166 @@
+# src/agents/sentiment/chunker_bench.py
+"""
+Benchmark del chunker sobre self-posts largos sintéticos (estilo Reddit).
+Compara la implementación lineal actual contra la original (cuadrática),
+que se conserva aquí como referencia de equivalencia.
+"""
+from __future__ import annotations
+import argparse
+import json
+import random
+import time
+from typing import List, Tuple
+
+from src.agents.sentiment.chunker import (
+    DEFAULT_MAX_TOKENS, DEFAULT_OVERLAP,
+    _simple_tokenize, _count_tokens, _split_sentences, chunk_text,
+)
+
+# ---------------------------------------------------------
+# REFERENCIA: implementación original de chunk_text
+# ---------------------------------------------------------
+def _greedy_pack_legacy(sentences: List[str], max_tokens: int) -> Tuple[str, int]:
+    packed: List[str] = []
+    cur_tokens = 0
+    for s in sentences:
+        s_tokens = _count_tokens(s)
+        if cur_tokens == 0 and s_tokens >= max_tokens:
+            toks = _simple_tokenize(s)
+            take = max_tokens
+            text = " ".join(toks[:take])
+            return text, take
+        if cur_tokens + s_tokens <= max_tokens:
+            packed.append(s)
+            cur_tokens += s_tokens
+        else:
+            break
+    return (" ".join(packed), cur_tokens)
+
+def chunk_text_legacy(
+    text: str,
+    *,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    overlap: int = DEFAULT_OVERLAP,
+) -> List[Tuple[str, int, int]]:
+    if not text:
+        return []
+    sentences = _split_sentences(text)
+    if len(sentences) <= 1:
+        toks = _simple_tokenize(text)
+        chunks = []
+        i = 0
+        while i < len(toks):
+            j = min(i + max_tokens, len(toks))
+            chunks.append((" ".join(toks[i:j]), i, j))
+            next_i = j - overlap
+            i = next_i if next_i > i else j
+        return chunks
+
+    chunks: List[Tuple[str, int, int]] = []
+    consumed_global = 0
+    sent_idx = 0
+    while sent_idx < len(sentences):
+        chunk_text_str, used_tokens = _greedy_pack_legacy(sentences[sent_idx:], max_tokens)
+        if not chunk_text_str or used_tokens == 0:
+            break
+        start = consumed_global
+        end = consumed_global + used_tokens
+        chunks.append((chunk_text_str, start, end))
+
+        advanced = 0
+        used = 0
+        for k in range(sent_idx, len(sentences)):
+            stoks = _count_tokens(sentences[k])
+            if used + stoks <= used_tokens:
+                used += stoks
+                advanced += 1
+            else:
+                break
+        if advanced == 0:
+            advanced = 1
+
+        back_sents = 0
+        tmp = 0
+        for k in range(advanced):
+            idx = sent_idx + advanced - 1 - k
+            if idx < sent_idx:
+                break
+            tmp += _count_tokens(sentences[idx])
+            if tmp >= overlap:
+                back_sents = k
+                break
+
+        sent_idx = sent_idx + advanced - back_sents
+        consumed_global = end - (tmp if back_sents > 0 else 0)
+        if sent_idx <= 0:
+            sent_idx = 0
+        if sent_idx >= len(sentences):
+            break
+    return chunks
+
+# ---------------------------------------------------------
+# CORPUS SINTÉTICO
+# ---------------------------------------------------------
+_VOCAB = (
+    "the government economy price people think really just like market news "
+    "el gobierno economía precio gente creo realmente solo como mercado noticias "
+    "edit: update lol tbh imo https://example.com ¿por qué? ¡increíble!"
+).split()
+
+def synthetic_post(rng: random.Random, n_words: int) -> str:
+    """Self-post largo: oraciones de longitud muy variable, saltos de línea y listas."""
+    out: List[str] = []
+    written = 0
+    while written < n_words:
+        # mezcla de oraciones cortas y párrafos sin puntuación (muy comunes en Reddit)
+        k = int(rng.choice([rng.randint(3, 25), rng.randint(40, 400)]))
+        k = min(k, n_words - written)
+        words = [rng.choice(_VOCAB) for _ in range(k)]
+        sep = rng.choice([". ", "! ", "? ", ".\n\n", "\n- ", " "])
+        out.append(" ".join(words) + sep)
+        written += k
+    return "".join(out)
+
+def run_benchmark(n_posts: int, min_words: int, max_words: int, max_tokens: int,
+                  overlap: int, seed: int, legacy: bool) -> dict:
+    rng = random.Random(seed)
+    posts = [synthetic_post(rng, rng.randint(min_words, max_words)) for _ in range(n_posts)]
+    words = sum(_count_tokens(p) for p in posts)
+
+    t0 = time.perf_counter()
+    new = [chunk_text(p, max_tokens=max_tokens, overlap=overlap) for p in posts]
+    t_new = time.perf_counter() - t0
+
+    report = {
+        "posts": n_posts,
+        "words": words,
+        "chunks": sum(len(c) for c in new),
+        "linear_s": round(t_new, 4),
+        "linear_words_per_s": round(words / max(1e-9, t_new)),
+    }
+    if legacy:
+        t0 = time.perf_counter()
+        old = [chunk_text_legacy(p, max_tokens=max_tokens, overlap=overlap) for p in posts]
+        t_old = time.perf_counter() - t0
+        report.update({
+            "legacy_s": round(t_old, 4),
+            "speedup": round(t_old / max(1e-9, t_new), 2),
+            "identical": old == new,
+        })
+    return report
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark del chunker en self-posts largos")
+    ap.add_argument("--posts", type=int, default=200)
+    ap.add_argument("--min_words", type=int, default=2000)
+    ap.add_argument("--max_words", type=int, default=20000)
+    ap.add_argument("--max_tokens", type=int, default=300)
+    ap.add_argument("--overlap", type=int, default=50)
+    ap.add_argument("--seed", type=int, default=13)
+    ap.add_argument("--no_legacy", action="store_true", help="No medir la implementación original")
+    args = ap.parse_args()
+
+    print(json.dumps(run_benchmark(
+        args.posts, args.min_words, args.max_words, args.max_tokens,
+        args.overlap, args.seed, legacy=not args.no_legacy,
+    ), indent=2))
@@ -1,9 +1,16 @@
 # src/agents/sentiment/sentiment_aggregator.py
 from __future__ import annotations
 import argparse
+import hashlib
+import heapq
 import json
+import os
+import shutil
+import tempfile
 from collections import defaultdict, Counter
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
 
 LABELS = ("negative", "neutral", "positive")
 
@@ -12,8 +19,9 @@ def _read_jsonl(path: str):
         for line in f:
             if line.strip():
                 try:
-                    yield json.loads(line)
-                except: continue
+                    row = json.loads(line)
+                except Exception: continue
+                yield row
 
 def _label_to_idx(label: str) -> int:
     if label in LABELS: return LABELS.index(label)
@@ -69,7 +77,88 @@ def _length_weighted(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
         "decider_chunk": best_chunk_data
     }
 
-def aggregate_post(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+# ---------------------------------------------------------
+# MOTOR COLUMNAR (NumPy): todos los posts de una corrida en una pasada
+# ---------------------------------------------------------
+def aggregate_columnar(
+    post_idx: np.ndarray,
+    span_len: np.ndarray,
+    label_idx: np.ndarray,
+    conf: np.ndarray,
+    n_posts: int,
+    probs: Optional[np.ndarray] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Versión vectorizada de _length_weighted sobre arrays planos (un elemento por chunk).
+    Devuelve por post: totals (n_posts×3), total_w, winner, score y decider
+    (posición del chunk decisivo en los arrays de entrada, -1 si el post no tiene chunks).
+    Con probs (n_chunks×3) añade probs_mean: el vector de probabilidades ponderado por longitud.
+    Reproduce exactamente el orden de suma y los desempates del camino por dicts.
+    """
+    post_idx = np.asarray(post_idx, dtype=np.int64)
+    w = np.maximum(1, np.asarray(span_len, dtype=np.int64)).astype(np.float64)
+    conf = np.asarray(conf, dtype=np.float64)
+    label_idx = np.asarray(label_idx, dtype=np.int64)
+    score = conf * w
+
+    totals = np.zeros((n_posts, 3), dtype=np.float64)
+    np.add.at(totals, (post_idx, label_idx), score)
+    total_w = np.zeros(n_posts, dtype=np.float64)
+    np.add.at(total_w, post_idx, w)
+
+    # winner: primer máximo (mismo desempate que max(range(3)))
+    winner = np.argmax(totals, axis=1)
+    final = np.where(total_w > 0, totals[np.arange(n_posts), winner] / np.where(total_w > 0, total_w, 1), 0.0)
+
+    # decider: primer chunk (en orden de entrada) con el mayor conf * w de su post
+    best = np.full(n_posts, -1.0)
+    np.maximum.at(best, post_idx, score)
+    pos = np.arange(len(post_idx), dtype=np.int64)
+    cand = np.where(score == best[post_idx], pos, len(post_idx))
+    decider = np.full(n_posts, len(post_idx), dtype=np.int64)
+    np.minimum.at(decider, post_idx, cand)
+    decider[decider == len(post_idx)] = -1
+
+    out = {"totals": totals, "total_w": total_w, "winner": winner, "score": final, "decider": decider}
+    if probs is not None:
+        acc = np.zeros((n_posts, 3), dtype=np.float64)
+        np.add.at(acc, post_idx, np.asarray(probs, dtype=np.float64) * w[:, None])
+        out["probs_mean"] = acc / np.where(total_w > 0, total_w, 1)[:, None]
+    return out
+
+def _columnar_results(posts: Sequence[Sequence[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """label_final / score_final / decider_chunk de muchos posts a la vez (como _length_weighted)."""
+    flat: List[Dict[str, Any]] = [c for chunks in posts for c in chunks]
+    post_idx = np.repeat(np.arange(len(posts)), [len(chunks) for chunks in posts])
+    spans = [c.get("span_tokens") for c in flat]
+    span_len = [(sp[1] - sp[0]) if (sp and len(sp)==2) else 1 for sp in spans]
+    results = [c.get("sentiment") or {} for c in flat]
+    lab_ids = {lab: i for i, lab in enumerate(LABELS)}
+    label_idx = [lab_ids.get(r.get("label", "neutral"), 1) for r in results]
+    conf = [float(r.get("confidence", 0.0)) for r in results]
+
+    agg = aggregate_columnar(post_idx, span_len, label_idx, conf, len(posts))
+
+    out: List[Dict[str, Any]] = []
+    for tw, win, sc, dec in zip(agg["total_w"].tolist(), agg["winner"].tolist(),
+                                agg["score"].tolist(), agg["decider"].tolist()):
+        if tw <= 0:
+            out.append({"label_final": "neutral", "score_final": 0.0})
+            continue
+        d = flat[dec]
+        out.append({
+            "label_final": LABELS[win],
+            "score_final": sc,
+            "decider_chunk": {
+                "chunk_index": d.get("chunk_index"),
+                "text_snippet": d.get("text", "")[:50] + "...",
+                "label": results[dec].get("label", "neutral"),
+                "score": conf[dec],
+            },
+        })
+    return out
+
+def aggregate_post(chunks: List[Dict[str, Any]], agg_res: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     if not chunks: return {}
     
     # 1. Reconstruir Texto Completo (Ordenando por índice de chunk)
@@ -79,14 +168,15 @@ def aggregate_post(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
     # 2. Metadatos base (del primer chunk)
     base = chunks[0]
     
-    # 3. Calcular Sentimiento Agregado
-    agg_res = _length_weighted(chunks)
+    # 3. Calcular Sentimiento Agregado (salvo que venga del motor columnar)
+    if agg_res is None:
+        agg_res = _length_weighted(chunks)
     
     # 4. Estadísticas de Idioma y Rutas
     langs = [c.get("lang") or "unknown" for c in chunks]
     sources = [(c.get("sentiment") or {}).get("source", "unknown") for c in chunks]
 
-    return {
+    post = {
         "post_id": base.get("parent_post_id") or base.get("post_id"),
         "timestamp": base.get("timestamp"),
         "channel": base.get("channel"),
@@ -102,25 +192,209 @@ def aggregate_post(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
         "lang_counts": dict(Counter(langs)),
         "route_counts": dict(Counter(sources))
     }
+    # Metadatos del modo muestreo (estrato y tamaño) para la estimación en sentiment_report
+    if base.get("sample"):
+        post["sample"] = base["sample"]
+    return post
+
+def aggregate_posts(posts: Sequence[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Versión en lote de aggregate_post: mismo resultado por post, pero el
+    ponderado por longitud de toda la tanda se calcula con el motor columnar.
+    """
+    nonempty = [chunks for chunks in posts if chunks]
+    agg = iter(_columnar_results(nonempty))
+    return [aggregate_post(chunks, next(agg)) if chunks else {} for chunks in posts]
+
+def _row_pid(row: Dict[str, Any]) -> Optional[str]:
+    pid = row.get("parent_post_id") or row.get("post_id")
+    return str(pid) if pid else None
+
+def _dump(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
 
-def run_aggregator(input_path: str, output_path: str):
+# ---------------------------------------------------------
+# MODO MEMORIA (original): todo el archivo en un dict
+# ---------------------------------------------------------
+def _aggregate_in_memory(input_path: str, output_path: str) -> int:
     buckets = defaultdict(list)
     # Agrupar chunks por Post ID
     for row in _read_jsonl(input_path):
-        pid = row.get("parent_post_id") or row.get("post_id")
-        if pid: buckets[str(pid)].append(row)
+        pid = _row_pid(row)
+        if pid: buckets[pid].append(row)
 
     # Procesar y escribir
     with open(output_path, "w", encoding="utf-8") as out:
-        for pid, rows in buckets.items():
-            record = aggregate_post(rows)
-            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        for record in aggregate_posts(list(buckets.values())):
+            out.write(_dump(record))
+    return len(buckets)
+
+# ---------------------------------------------------------
+# MODO AGRUPADO: chunks contiguos por post (como los emite el chunker)
+# ---------------------------------------------------------
+class NotGrouped(Exception):
+    """El input no viene agrupado por parent_post_id."""
+
+class _ClosedPosts:
+    """
+    Filtro de Bloom de tamaño fijo con los posts ya cerrados.
+    Un falso positivo solo manda al modo spill (más lento, mismo resultado).
+    """
+
+    def __init__(self, bits: int = 1 << 27, hashes: int = 4):
+        self.bits = bits
+        self.hashes = hashes
+        self._arr = bytearray(bits // 8)
+
+    def _positions(self, pid: str) -> List[int]:
+        d = hashlib.blake2b(pid.encode("utf-8"), digest_size=8 * self.hashes).digest()
+        return [int.from_bytes(d[8 * k:8 * k + 8], "little") % self.bits for k in range(self.hashes)]
+
+    def add(self, pid: str) -> None:
+        for p in self._positions(pid):
+            self._arr[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, pid: str) -> bool:
+        return all(self._arr[p >> 3] & (1 << (p & 7)) for p in self._positions(pid))
+
+GROUPED_BLOCK_POSTS = 1024  # posts cerrados por llamada al motor columnar
+
+def _aggregate_grouped(input_path: str, output_path: str) -> int:
+    """Agrega al vuelo; lanza NotGrouped si un post reaparece tras cerrarse."""
+    closed = _ClosedPosts()
+    n = 0
+    cur_pid: Optional[str] = None
+    cur_rows: List[Dict[str, Any]] = []
+    ready: List[List[Dict[str, Any]]] = []
+    with open(output_path, "w", encoding="utf-8") as out:
+        for row in _read_jsonl(input_path):
+            pid = _row_pid(row)
+            if not pid:
+                continue
+            if pid != cur_pid:
+                if pid in closed:
+                    raise NotGrouped(pid)
+                if cur_rows:
+                    ready.append(cur_rows)
+                    closed.add(cur_pid)
+                    if len(ready) >= GROUPED_BLOCK_POSTS:
+                        out.writelines(_dump(r) for r in aggregate_posts(ready))
+                        n += len(ready)
+                        ready = []
+                cur_pid, cur_rows = pid, []
+            cur_rows.append(row)
+        if cur_rows:
+            ready.append(cur_rows)
+        out.writelines(_dump(r) for r in aggregate_posts(ready))
+        n += len(ready)
+    return n
+
+# ---------------------------------------------------------
+# MODO SPILL: particiones en disco por hash del post + merge ordenado
+# ---------------------------------------------------------
+DEFAULT_SPILL_BUCKETS = 64
+
+def _bucket_of(pid: str, n: int) -> int:
+    return int.from_bytes(hashlib.blake2b(pid.encode("utf-8"), digest_size=4).digest(), "little") % n
+
+def _read_run(path: str) -> Iterator[Tuple[int, str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            first, rec = line.split("\t", 1)
+            yield int(first), rec
+
+def _aggregate_spill(input_path: str, output_path: str, buckets: int = DEFAULT_SPILL_BUCKETS,
+                     tmp_dir: Optional[str] = None) -> int:
+    """
+    1) Reparte las filas en `buckets` archivos por hash(post), con su nº de línea.
+    2) Cada bucket (cabe en memoria) se agrupa y agrega; cada post se guarda con
+       la línea de su primer chunk, ordenado.
+    3) Merge de los runs por esa línea: mismo orden que el modo memoria.
+    """
+    buckets = max(1, int(buckets))
+    work = tempfile.mkdtemp(prefix="agg_spill_", dir=tmp_dir or os.path.dirname(os.path.abspath(output_path)))
+    n = 0
+    try:
+        parts = [open(os.path.join(work, f"b{i:04d}.jsonl"), "w", encoding="utf-8") for i in range(buckets)]
+        try:
+            for line_no, row in enumerate(_read_jsonl(input_path)):
+                pid = _row_pid(row)
+                if pid:
+                    parts[_bucket_of(pid, buckets)].write(json.dumps([line_no, row], ensure_ascii=False) + "\n")
+        finally:
+            for f in parts:
+                f.close()
+
+        runs: List[str] = []
+        for i in range(buckets):
+            part = os.path.join(work, f"b{i:04d}.jsonl")
+            groups: Dict[str, Tuple[int, List[Dict[str, Any]]]] = {}
+            with open(part, "r", encoding="utf-8") as f:
+                for line in f:
+                    line_no, row = json.loads(line)
+                    pid = _row_pid(row)
+                    if pid not in groups:
+                        groups[pid] = (line_no, [])
+                    groups[pid][1].append(row)
+            os.remove(part)
+            if not groups:
+                continue
+            run = os.path.join(work, f"r{i:04d}.tsv")
+            ordered = sorted(groups.values(), key=lambda g: g[0])
+            records = aggregate_posts([rows for _, rows in ordered])
+            with open(run, "w", encoding="utf-8") as f:
+                for (first, _), record in zip(ordered, records):
+                    f.write(f"{first}\t{_dump(record)}")
+            n += len(records)
+            runs.append(run)
+
+        with open(output_path, "w", encoding="utf-8") as out:
+            for _, rec in heapq.merge(*(_read_run(r) for r in runs)):
+                out.write(rec)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return n
+
+# ---------------------------------------------------------
+# API
+# ---------------------------------------------------------
+AGG_MODES = ("auto", "grouped", "spill", "memory")
+
+def run_aggregator(
+    input_path: str,
+    output_path: str,
+    mode: str = "auto",
+    spill_buckets: int = DEFAULT_SPILL_BUCKETS,
+) -> Dict[str, Any]:
+    """
+    Agrega chunks → posts. Salida idéntica en todos los modos:
+      - memory:  agrupa todo en memoria (original)
+      - grouped: al vuelo, para inputs con los chunks de cada post contiguos
+      - spill:   particiones en disco + merge (memoria acotada, cualquier orden)
+      - auto:    grouped y, si el input resulta no estar agrupado, spill
+    """
+    if mode not in AGG_MODES:
+        raise ValueError(f"Modo de agregación desconocido: {mode} (opciones: {AGG_MODES})")
+
+    if mode == "memory":
+        return {"posts": _aggregate_in_memory(input_path, output_path), "mode": mode}
+    if mode == "spill":
+        return {"posts": _aggregate_spill(input_path, output_path, spill_buckets), "mode": mode}
+    try:
+        return {"posts": _aggregate_grouped(input_path, output_path), "mode": "grouped"}
+    except NotGrouped as e:
+        if mode == "grouped":
+            raise ValueError(f"El input no está agrupado por post (reaparece {e}); usa mode='spill'") from None
+        print("   ↪️ Input no agrupado por post: usando agregación con spill a disco.")
+        return {"posts": _aggregate_spill(input_path, output_path, spill_buckets), "mode": "spill"}
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--in", dest="input_path", required=True)
     ap.add_argument("--out", dest="output_path", required=True)
+    ap.add_argument("--mode", choices=AGG_MODES, default="auto")
+    ap.add_argument("--spill_buckets", type=int, default=DEFAULT_SPILL_BUCKETS)
     args = ap.parse_args()
     
-    run_aggregator(args.input_path, args.output_path)
-    print(f"✅ Agregación completada. Resultados en: {args.output_path}")
\ No newline at end of file
+    stats = run_aggregator(args.input_path, args.output_path, args.mode, args.spill_buckets)
+    print(f"✅ Agregación completada ({stats['mode']}, {stats['posts']} posts). Resultados en: {args.output_path}")
\ No newline at end of file
@@ -0,0 +1,269 @@
+# src/agents/sentiment/sentiment_bench.py
+"""
+Benchmark de throughput del stack de sentimiento.
+Etapas: chunk_text, SentimentPrecise.analyze / analyze_batch, aggregate_post y
+sentiment_node completo, sobre corpus sintéticos ES/EN de tamaño y distribución
+de longitudes configurables. Reporta JSON con p50/p95, throughput, RSS pico y
+tiempo de carga de modelos, etiquetado con commit y backend para comparar.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Sequence
+
+# ---------------------------------------------------------
+# CORPUS SINTÉTICO
+# ---------------------------------------------------------
+_VOCAB = {
+    "es": (
+        "el gobierno la economía precio gente creo que realmente solo como mercado "
+        "noticias país presidente trabajo bueno malo excelente terrible nunca siempre "
+        "quito guayaquil ecuador luz apagones seguridad ¿por qué? ¡increíble! jaja"
+    ).split(),
+    "en": (
+        "the government economy price people think really just like market news "
+        "country president work good bad great terrible never always power outage "
+        "security why? amazing! lol tbh imo edit: update https://example.com"
+    ).split(),
+}
+
+def _length(rng: random.Random, dist: str, mean_words: int, max_words: int) -> int:
+    if dist == "fixed":
+        n = mean_words
+    elif dist == "uniform":
+        n = rng.randint(1, 2 * mean_words)
+    else:
+        # "reddit": lognormal, la mayoría comentarios cortos y una cola de self-posts largos
+        n = int(rng.lognormvariate(0, 1.1) * mean_words / 1.83)
+    return max(3, min(max_words, n))
+
+def _synthetic_text(rng: random.Random, lang: str, n_words: int) -> str:
+    vocab = _VOCAB[lang]
+    out: List[str] = []
+    written = 0
+    while written < n_words:
+        k = min(rng.randint(4, 30), n_words - written)
+        out.append(" ".join(rng.choice(vocab) for _ in range(k)) + rng.choice([". ", "! ", "? ", ".\n"]))
+        written += k
+    return "".join(out).strip()
+
+def synthetic_corpus(n_docs: int, es_ratio: float, dist: str, mean_words: int,
+                     max_words: int, seed: int) -> List[Dict[str, Any]]:
+    """Docs con el esquema de la salida de cleaning_node (text_norm, post_id, lang)."""
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n_docs):
+        lang = "es" if rng.random() < es_ratio else "en"
+        docs.append({
+            "text_norm": _synthetic_text(rng, lang, _length(rng, dist, mean_words, max_words)),
+            "post_id": f"bench{i}",
+            "lang": lang,
+            "timestamp": "",
+        })
+    return docs
+
+# ---------------------------------------------------------
+# MEDICIÓN
+# ---------------------------------------------------------
+def _peak_rss_mb() -> float:
+    # ru_maxrss: KB en Linux, bytes en macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+def _pct(values: Sequence[float], q: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(q * (len(s) - 1))))]
+
+def _time_each(fn: Callable[[Any], Any], items: Sequence[Any]) -> Dict[str, Any]:
+    """Llama fn(item) por cada item: latencias p50/p95 (ms) e items/s."""
+    lat: List[float] = []
+    t_start = time.perf_counter()
+    for it in items:
+        t0 = time.perf_counter()
+        fn(it)
+        lat.append(time.perf_counter() - t0)
+    total = time.perf_counter() - t_start
+    return {
+        "n": len(items),
+        "total_s": round(total, 4),
+        "p50_ms": round(1000 * _pct(lat, 0.50), 3),
+        "p95_ms": round(1000 * _pct(lat, 0.95), 3),
+        "per_s": round(len(items) / max(1e-9, total), 2),
+    }
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+# ---------------------------------------------------------
+# ETAPAS
+# ---------------------------------------------------------
+def run_benchmark(args) -> Dict[str, Any]:
+    # La config por env se fija antes de importar el stack (sentiment_hf la lee al importar)
+    if args.backend:
+        os.environ["SENTIMENT_BACKEND"] = args.backend
+    if not args.cache:
+        os.environ["SENTIMENT_CACHE"] = "0"
+
+    from src.agents.sentiment.chunker import chunk_text
+    from src.agents.sentiment.sentiment_aggregator import aggregate_post
+    from src.agents.sentiment.sentiment_hf import SENTIMENT_BACKEND, padding_report
+    from src.agents.sentiment.sentiment_precise import SentimentPrecise
+
+    docs = synthetic_corpus(args.docs, args.es_ratio, args.dist, args.mean_words,
+                            args.max_words, args.seed)
+    stages = set(args.stages.split(","))
+    report: Dict[str, Any] = {
+        "commit": _git_commit(),
+        "backend": SENTIMENT_BACKEND,
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "corpus": {
+            "docs": len(docs),
+            "words": sum(len(d["text_norm"].split()) for d in docs),
+            "es": sum(1 for d in docs if d["lang"] == "es"),
+        },
+        "stages": {},
+    }
+
+    # 0. Identificación de idioma (un lote para todo el corpus, sin modelos)
+    if "langid" in stages:
+        from src.utils.lang_id import detect_posts
+        t0 = time.perf_counter()
+        found = detect_posts([d["text_norm"] for d in docs])
+        total = time.perf_counter() - t0
+        report["stages"]["langid"] = {
+            "n": len(docs),
+            "total_s": round(total, 4),
+            "docs_per_min": round(60 * len(docs) / max(1e-9, total)),
+            "accuracy": round(sum(l == d["lang"] for (l, _), d in zip(found, docs)) / max(1, len(docs)), 4),
+        }
+
+    # 1. Chunking
+    per_doc_chunks = [chunk_text(d["text_norm"], max_tokens=300, overlap=50) for d in docs]
+    if "chunk" in stages:
+        report["stages"]["chunk_text"] = _time_each(
+            lambda d: chunk_text(d["text_norm"], max_tokens=300, overlap=50), docs
+        )
+    pairs = [(c[0], d["lang"]) for d, cs in zip(docs, per_doc_chunks) for c in cs]
+    report["corpus"]["chunks"] = len(pairs)
+
+    # 2. Carga de modelos (primera inferencia por ruta)
+    sp = SentimentPrecise(batch_size=args.batch_size, tau1=args.tau1, tau2=args.tau2)
+    load = {}
+    for lang in ("en", "es"):
+        t0 = time.perf_counter()
+        sp.analyze("ok", lang_hint=lang)
+        load[lang] = round(time.perf_counter() - t0, 3)
+    report["model_load_s"] = load
+
+    # 3. Inferencia
+    sample = pairs[: args.analyze_limit] if args.analyze_limit else pairs
+    analyses: List[Dict[str, Any]] = []
+    if "analyze" in stages:
+        report["stages"]["analyze"] = _time_each(lambda p: sp.analyze(p[0], lang_hint=p[1]), sample)
+    if "batch" in stages:
+        bs = max(1, args.batch_size)
+        blocks = [pairs[i:i + bs] for i in range(0, len(pairs), bs)]
+        ids = None
+        if args.pretokenized:
+            # como el sidecar del chunker: tokenizado una vez, fuera de la medición
+            from src.agents.sentiment.sentiment_tokens import route_for, tokenize
+            t0 = time.perf_counter()
+            ids = [tokenize(t.strip(), route_for(l)) for t, l in pairs]
+            report["pretokenize_s"] = round(time.perf_counter() - t0, 3)
+        starts = range(0, len(pairs), bs)
+
+        def _one(k):
+            block = blocks[k]
+            extra = {"token_ids": ids[starts[k]:starts[k] + bs]} if ids is not None else {}
+            analyses.extend(sp.analyze_batch([t for t, _ in block], [l for _, l in block], **extra))
+
+        stats = _time_each(_one, list(range(len(blocks))))
+        stats["chunks_per_s"] = round(len(pairs) / max(1e-9, stats["total_s"]), 2)
+        stats["padding"] = padding_report()
+        report["stages"]["analyze_batch"] = stats
+
+    # 4. Agregación (con resultados reales si hubo batch; si no, neutros)
+    if "aggregate" in stages:
+        pos = 0
+        per_doc: List[List[Dict[str, Any]]] = []
+        for d, cs in zip(docs, per_doc_chunks):
+            analyzed = []
+            for i, (c_txt, start, end) in enumerate(cs):
+                res = analyses[pos + i] if analyses else {"label": "neutral", "confidence": 0.5, "source": "bench"}
+                analyzed.append({"chunk_index": i, "text": c_txt, "span_tokens": [start, end],
+                                 "sentiment": res, "lang": d["lang"]})
+            pos += len(cs)
+            per_doc.append(analyzed)
+        report["stages"]["aggregate_post"] = _time_each(aggregate_post, per_doc)
+
+    # 5. Nodo completo (lee/escribe JSONL como en el grafo)
+    if "node" in stages:
+        from src.agents import nodes
+        nodes._ANALYZER = sp
+        with tempfile.TemporaryDirectory() as tmp:
+            inp = os.path.join(tmp, "bench_cleaned.jsonl")
+            with open(inp, "w", encoding="utf-8") as f:
+                for d in docs:
+                    f.write(json.dumps(d, ensure_ascii=False) + "\n")
+            t0 = time.perf_counter()
+            nodes.sentiment_node({"context": {"last_cleaned_path": inp}, "messages": []})
+            total = time.perf_counter() - t0
+        report["stages"]["sentiment_node"] = {
+            "n": len(docs),
+            "total_s": round(total, 4),
+            "docs_per_s": round(len(docs) / max(1e-9, total), 2),
+            "chunks_per_s": round(len(pairs) / max(1e-9, total), 2),
+        }
+
+    report["peak_rss_mb"] = _peak_rss_mb()
+    return report
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de throughput del stack de sentimiento")
+    ap.add_argument("--docs", type=int, default=500)
+    ap.add_argument("--es_ratio", type=float, default=0.7, help="Fracción de docs en español")
+    ap.add_argument("--dist", choices=["reddit", "uniform", "fixed"], default="reddit",
+                    help="Distribución de longitudes (palabras por doc)")
+    ap.add_argument("--mean_words", type=int, default=120)
+    ap.add_argument("--max_words", type=int, default=5000)
+    ap.add_argument("--seed", type=int, default=13)
+    ap.add_argument("--stages", default="langid,chunk,analyze,batch,aggregate,node")
+    ap.add_argument("--analyze_limit", type=int, default=200,
+                    help="Chunks para la etapa analyze (uno a uno); 0 = todos")
+    ap.add_argument("--batch_size", type=int, default=32)
+    ap.add_argument("--backend", default=None, help="torch | torch-mmap | torch-bf16 | torch-int8 | onnx | onnx-int8 | student (default: SENTIMENT_BACKEND)")
+    ap.add_argument("--tau1", type=float, default=None)
+    ap.add_argument("--tau2", type=float, default=None)
+    ap.add_argument("--cache", action="store_true", help="Usa la caché persistente (apagada por defecto)")
+    ap.add_argument("--pretokenized", action="store_true",
+                    help="La etapa batch recibe token ids ya calculados (como con el sidecar del chunker)")
+    ap.add_argument("--out", default=None, help="Ruta JSON donde guardar el reporte")
+    args = ap.parse_args()
+
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+if __name__ == "__main__":
+    main()
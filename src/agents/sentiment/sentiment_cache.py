@@ -0,0 +1,154 @@
+# src/agents/sentiment/sentiment_cache.py
+from __future__ import annotations
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Iterable, Optional
+
+# ---------------------------------------------------------
+# CONFIGURACIÓN
+# ---------------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+DEFAULT_CACHE_PATH = os.path.join(BASE_DIR, "data", "cache", "sentiment_cache.sqlite")
+DEFAULT_MAX_ENTRIES = 1_000_000
+
+_SQL_BATCH = 500  # límite de parámetros por sentencia (SQLite acepta ~999)
+
+def text_hash(text: str) -> str:
+    """Mismo hash de contenido que usa preprocess_posts (sha256 utf-8)."""
+    return hashlib.sha256((text or "").encode("utf-8", errors="ignore")).hexdigest()
+
+class SentimentCache:
+    """
+    Caché persistente (SQLite) de resultados de sentimiento por chunk.
+    Clave: sha256(texto) + id de modelo + revisión del modelo.
+    Evicción LRU acotada por número de entradas y contadores de hits/misses.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sentiment_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sentiment_cache_lru ON sentiment_cache(last_used)")
+        # Cota superior de las entradas (los REPLACE también suman): el COUNT(*)
+        # exacto solo se hace cuando esta cota pasa max_entries
+        (self._count_bound,) = self._conn.execute("SELECT COUNT(*) FROM sentiment_cache").fetchone()
+
+    @classmethod
+    def from_env(cls) -> Optional["SentimentCache"]:
+        """SENTIMENT_CACHE=0 lo desactiva; SENTIMENT_CACHE_PATH / SENTIMENT_CACHE_MAX_ENTRIES lo configuran."""
+        if os.getenv("SENTIMENT_CACHE", "1") == "0":
+            return None
+        return cls(
+            path=os.getenv("SENTIMENT_CACHE_PATH", DEFAULT_CACHE_PATH),
+            max_entries=int(os.getenv("SENTIMENT_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES))),
+        )
+
+    @staticmethod
+    def make_key(text: str, model_id: str, revision: str) -> str:
+        return f"{text_hash(text)}:{model_id}@{revision}"
+
+    # ---------------------------------------------------------
+    # Lectura / escritura
+    # ---------------------------------------------------------
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, Dict[str, Any]] = {}
+        if not keys:
+            return found
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), _SQL_BATCH):
+                part = keys[i:i + _SQL_BATCH]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM sentiment_cache WHERE key IN ({marks})", part
+                ).fetchall()
+                for k, v in rows:
+                    found[k] = json.loads(v)
+                if rows:
+                    # toque LRU
+                    self._conn.execute(
+                        f"UPDATE sentiment_cache SET last_used = ? WHERE key IN ({','.join('?' * len(rows))})",
+                        [now, *[k for k, _ in rows]],
+                    )
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, Dict[str, Any]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = [(k, json.dumps(v, ensure_ascii=False), now) for k, v in items.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO sentiment_cache (key, value, last_used) VALUES (?, ?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._count_bound += len(rows)
+            if self._count_bound > self.max_entries:
+                self._evict()
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        self.put_many({key: value})
+
+    def _evict(self) -> None:
+        """
+        Si se supera max_entries borra las menos usadas hasta un 95% del máximo,
+        para que el siguiente COUNT(*) no llegue hasta ~5% de inserciones después.
+        """
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM sentiment_cache").fetchone()
+        excess = count - (self.max_entries - self.max_entries // 20)
+        if count > self.max_entries and excess > 0:
+            self._conn.execute(
+                "DELETE FROM sentiment_cache WHERE key IN ("
+                " SELECT key FROM sentiment_cache ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+        self._count_bound = count - max(0, excess) if count > self.max_entries else count
+
+    # ---------------------------------------------------------
+    # Estadísticas
+    # ---------------------------------------------------------
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM sentiment_cache").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": count,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,204 @@
+# src/agents/sentiment/sentiment_checkpoint.py
+from __future__ import annotations
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# ---------------------------------------------------------
+# CONFIGURACIÓN
+# ---------------------------------------------------------
+DEFAULT_CHECKPOINT_EVERY = 1000  # registros por segmento confirmado
+
+KeyFn = Callable[[Dict[str, Any]], Optional[str]]
+
+def chunk_key(rec: Dict[str, Any]) -> Optional[str]:
+    return rec.get("chunk_id")
+
+# ---------------------------------------------------------
+# LECTURA CON OFFSETS
+# ---------------------------------------------------------
+def iter_jsonl_offsets(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Lee un JSONL desde el byte `start` y devuelve (offset tras la línea, dict).
+    Con `end` solo lee las líneas que empiezan en [start, end).
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        while end is None or f.tell() < end:
+            raw = f.readline()
+            if not raw:
+                break
+            line = raw.decode("utf-8", errors="replace").strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except Exception:
+                continue
+            yield f.tell(), obj
+
+def iter_jsonl_starts(path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(byte donde empieza la línea, dict): para releer un registro con seek."""
+    with open(path, "rb") as f:
+        while True:
+            start = f.tell()
+            raw = f.readline()
+            if not raw:
+                break
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                yield start, json.loads(line)
+            except Exception:
+                continue
+
+def _last_newline(path: str) -> int:
+    """Tamaño del prefijo del archivo que termina en una línea completa."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        pos = size
+        while pos > 0:
+            step = min(1 << 16, pos)
+            f.seek(pos - step)
+            buf = f.read(step)
+            k = buf.rfind(b"\n")
+            if k >= 0:
+                return pos - step + k + 1
+            pos -= step
+    return 0
+
+# ---------------------------------------------------------
+# ESCRITOR CON CHECKPOINTS
+# ---------------------------------------------------------
+class CheckpointedWriter:
+    """
+    Escritor JSONL reanudable.
+    Los registros se confirman en segmentos: se escriben, se hace fsync y solo
+    entonces se reemplaza (atómicamente) el checkpoint <out>.ckpt con el offset
+    de entrada y el número de registros escritos.
+    Al reanudar se descarta la cola no confirmada, se recuperan los ids ya
+    escritos y la lectura sigue desde el offset guardado.
+    """
+
+    def __init__(
+        self,
+        out_path: str,
+        input_path: str,
+        *,
+        resume: bool = False,
+        start: int = 0,
+        end: Optional[int] = None,
+        key: KeyFn = chunk_key,
+        every: int = DEFAULT_CHECKPOINT_EVERY,
+    ):
+        self.out_path = out_path
+        self.ckpt_path = out_path + ".ckpt"
+        self.key = key
+        self.every = max(1, int(every))
+        self._ident = {"input": os.path.abspath(input_path), "start": start, "end": end}
+
+        self.offset = start    # byte de entrada desde el que se sigue leyendo
+        self.written = 0       # registros confirmados en la salida
+        self.done_ids: Set[str] = set()
+        self._buf: List[bytes] = []
+        self._buf_offset = start
+
+        if resume and os.path.exists(out_path):
+            self._recover()
+        else:
+            open(out_path, "wb").close()
+            self._drop_checkpoint()
+        self._f = open(out_path, "ab")
+
+    # ---------------------------------------------------------
+    # Recuperación
+    # ---------------------------------------------------------
+    def _load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.ckpt_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def _recover(self) -> None:
+        state = self._load_checkpoint()
+        if state is not None and any(state.get(k) != v for k, v in self._ident.items()):
+            # checkpoint de otra entrada / otro shard: sus registros pueden ser de
+            # filas que ahora le tocan a otro shard, así que la parte se descarta
+            print(f"   ⚠️ {os.path.basename(self.ckpt_path)} es de otro rango de entrada: se descarta la parte.")
+            keep = 0
+        elif state is not None and state.get("output_bytes", -1) <= os.path.getsize(self.out_path):
+            keep = int(state["output_bytes"])
+            self.offset = int(state["input_offset"])
+        else:
+            # sin checkpoint válido: se conserva todo lo completo y se filtra por id
+            keep = _last_newline(self.out_path)
+        with open(self.out_path, "r+b") as f:
+            f.truncate(keep)
+
+        for _, rec in iter_jsonl_offsets(self.out_path):
+            self.written += 1
+            k = self.key(rec)
+            if k:
+                self.done_ids.add(k)
+        self._buf_offset = self.offset
+        print(f"   ♻️ Reanudando {os.path.basename(self.out_path)}: "
+              f"{self.written} registros ya escritos, entrada desde byte {self.offset}")
+
+    def _drop_checkpoint(self) -> None:
+        try:
+            os.remove(self.ckpt_path)
+        except FileNotFoundError:
+            pass
+
+    # ---------------------------------------------------------
+    # Escritura
+    # ---------------------------------------------------------
+    def seen(self, rec: Dict[str, Any]) -> bool:
+        """True si el registro ya está en la salida (se puede saltar)."""
+        k = self.key(rec)
+        return bool(k) and k in self.done_ids
+
+    def pending(self, rows: Iterable[Tuple[int, Dict[str, Any]]]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Filtra los (offset, dict) cuyo id ya está en la salida."""
+        for off, rec in rows:
+            if not self.seen(rec):
+                yield off, rec
+
+    def write(self, records: Iterable[Dict[str, Any]], input_offset: int) -> None:
+        """Encola registros; `input_offset` es el byte de entrada ya consumido por completo."""
+        for r in records:
+            self._buf.append((json.dumps(r, ensure_ascii=False) + "\n").encode("utf-8"))
+        self._buf_offset = input_offset
+        if len(self._buf) >= self.every:
+            self.commit()
+
+    def commit(self) -> None:
+        """Confirma el segmento pendiente: datos + fsync, luego checkpoint atómico."""
+        if self._buf:
+            self._f.writelines(self._buf)
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self.written += len(self._buf)
+            self._buf = []
+        self.offset = self._buf_offset
+        state = {
+            **self._ident,
+            "input_offset": self.offset,
+            "output_bytes": self._f.tell(),
+            "written": self.written,
+        }
+        tmp = self.ckpt_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.ckpt_path)
+
+    def close(self, finished: bool = True) -> None:
+        """Confirma lo pendiente; si la corrida terminó se borra el checkpoint."""
+        self.commit()
+        self._f.close()
+        if finished:
+            self._drop_checkpoint()
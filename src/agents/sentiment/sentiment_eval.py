@@ -1,36 +1,129 @@
-import pandas as pd
-
-# Datos Reales obtenidos de tus pruebas anteriores
-data_english = {
-    "Métrica": ["Accuracy", "F1-Score (Macro)", "MCC (Matthews)"],
-    "Resultado": [0.724, 0.727, 0.568],
-    "Interpretación": ["Estado del Arte (>70%)", "Balanceado", "Moderado"]
-}
-
-data_spanish = {
-    "Métrica": ["Accuracy", "F1-Score (Macro)", "MCC (Matthews)"],
-    "Resultado": [0.778, 0.776, 0.668],
-    "Interpretación": ["Superior al Base (>75%)", "Muy Balanceado", "Alto (Robusto)"]
-}
-
-# Configuración visual de Pandas
-pd.set_option('display.max_columns', None)
-pd.set_option('display.width', 1000)
-pd.set_option('display.colheader_justify', 'center')
-
-df_en = pd.DataFrame(data_english)
-df_es = pd.DataFrame(data_spanish)
-
-print("\n" + "="*60)
-print("🇺🇸 TABLA: RESULTADOS MODELO INGLÉS (TweetEval)")
-print("   Modelo: twitter-roberta-base-sentiment-latest")
-print("="*60)
-print(df_en.to_string(index=False))
-print("\n\n")
-
-print("="*60)
-print("🇪🇨 TABLA: RESULTADOS MODELO ESPAÑOL (TweetSentMult)")
-print("   Modelo: robertuito-finetuned (Optimizado)")
-print("="*60)
-print(df_es.to_string(index=False))
-print("="*60 + "\n")
\ No newline at end of file
+# src/agents/sentiment/sentiment_eval.py
+from typing import Any, Dict, Sequence
+
+import numpy as np
+
+LABELS = ("negative", "neutral", "positive")
+_IDX = {lab: i for i, lab in enumerate(LABELS)}
+_K = len(LABELS)
+
+# ---------------------------------------------------------
+# MATRIZ DE CONFUSIÓN (filas = gold, columnas = predicción)
+# ---------------------------------------------------------
+def _codes(y_true: Sequence[str], y_pred: Sequence[str]) -> np.ndarray:
+    """t * K + p por ejemplo; los pares con etiquetas fuera de LABELS se descartan."""
+    t = np.fromiter((_IDX.get(y, -1) for y in y_true), dtype=np.int64, count=len(y_true))
+    p = np.fromiter((_IDX.get(y, -1) for y in y_pred), dtype=np.int64, count=len(y_pred))
+    ok = (t >= 0) & (p >= 0)
+    return t[ok] * _K + p[ok]
+
+def confusion_matrix(y_true: Sequence[str], y_pred: Sequence[str]) -> np.ndarray:
+    return np.bincount(_codes(y_true, y_pred), minlength=_K * _K).reshape(_K, _K)
+
+def _metrics(cm: np.ndarray) -> Dict[str, np.ndarray]:
+    """Accuracy, macro-F1 y MCC (Gorodkin) de una o muchas matrices (..., K, K) a la vez."""
+    cm = cm.astype(np.float64)
+    s = cm.sum(axis=(-2, -1))
+    tp = np.diagonal(cm, axis1=-2, axis2=-1)
+    t_k = cm.sum(axis=-1)   # gold por clase
+    p_k = cm.sum(axis=-2)   # predichos por clase
+    c = tp.sum(axis=-1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        acc = np.where(s > 0, c / s, 0.0)
+        denom_f1 = t_k + p_k  # = 2tp + fp + fn
+        f1 = np.where(tp > 0, 2 * tp / denom_f1, 0.0)
+        num = c * s - (t_k * p_k).sum(axis=-1)
+        den = np.sqrt((s * s - (p_k ** 2).sum(axis=-1)) * (s * s - (t_k ** 2).sum(axis=-1)))
+        mcc = np.where(den > 0, num / den, 0.0)
+    return {"accuracy": acc, "macro_f1": f1.mean(axis=-1), "mcc": mcc}
+
+# ---------------------------------------------------------
+# MÉTRICAS (las usa sentiment_eval_hf)
+# ---------------------------------------------------------
+def accuracy(y_true: Sequence[str], y_pred: Sequence[str]) -> float:
+    return float(_metrics(confusion_matrix(y_true, y_pred))["accuracy"])
+
+def macro_f1(y_true: Sequence[str], y_pred: Sequence[str]) -> float:
+    return float(_metrics(confusion_matrix(y_true, y_pred))["macro_f1"])
+
+def mcc_multiclass(y_true: Sequence[str], y_pred: Sequence[str]) -> float:
+    """MCC multiclase (Gorodkin): correlación entre la matriz de confusión y la diagonal."""
+    return float(_metrics(confusion_matrix(y_true, y_pred))["mcc"])
+
+def bootstrap_confusions(codes: np.ndarray, n_boot: int, seed: int = 0,
+                         max_cells: int = 20_000_000) -> np.ndarray:
+    """
+    n_boot matrices de confusión remuestreadas (n_boot, K, K) sin bucles por
+    remuestra: cada remuestra suma su propio bloque de K*K celdas en un bincount.
+    """
+    n = len(codes)
+    rng = np.random.default_rng(seed)
+    out = np.empty((n_boot, _K, _K), dtype=np.int64)
+    step = max(1, max_cells // max(1, n))  # acota la memoria del índice (step × n)
+    for b0 in range(0, n_boot, step):
+        b = min(step, n_boot - b0)
+        idx = rng.integers(0, n, size=(b, n))
+        flat = codes[idx] + (_K * _K) * np.arange(b)[:, None]
+        out[b0:b0 + b] = np.bincount(flat.ravel(), minlength=b * _K * _K).reshape(b, _K, _K)
+    return out
+
+def evaluate(y_true: Sequence[str], y_pred: Sequence[str], n_boot: int = 1000,
+             ci: float = 0.95, seed: int = 0) -> Dict[str, Any]:
+    """Métricas puntuales, matriz de confusión e IC bootstrap (percentiles) de cada métrica."""
+    codes = _codes(y_true, y_pred)
+    cm = np.bincount(codes, minlength=_K * _K).reshape(_K, _K)
+    point = _metrics(cm)
+    out: Dict[str, Any] = {
+        "n": int(len(codes)),
+        **{k: round(float(v), 4) for k, v in point.items()},
+        "confusion": {"labels": list(LABELS), "matrix": cm.tolist()},
+    }
+    if n_boot and len(codes):
+        boot = _metrics(bootstrap_confusions(codes, n_boot, seed))
+        lo, hi = 100 * (1 - ci) / 2, 100 * (1 + ci) / 2
+        out["ci"] = {
+            k: [round(float(np.percentile(v, lo)), 4), round(float(np.percentile(v, hi)), 4)]
+            for k, v in boot.items()
+        }
+        out["ci_level"] = ci
+        out["n_boot"] = n_boot
+    return out
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    # Datos Reales obtenidos de tus pruebas anteriores
+    data_english = {
+        "Métrica": ["Accuracy", "F1-Score (Macro)", "MCC (Matthews)"],
+        "Resultado": [0.724, 0.727, 0.568],
+        "Interpretación": ["Estado del Arte (>70%)", "Balanceado", "Moderado"]
+    }
+
+    data_spanish = {
+        "Métrica": ["Accuracy", "F1-Score (Macro)", "MCC (Matthews)"],
+        "Resultado": [0.778, 0.776, 0.668],
+        "Interpretación": ["Superior al Base (>75%)", "Muy Balanceado", "Alto (Robusto)"]
+    }
+
+    # Configuración visual de Pandas
+    pd.set_option('display.max_columns', None)
+    pd.set_option('display.width', 1000)
+    pd.set_option('display.colheader_justify', 'center')
+
+    df_en = pd.DataFrame(data_english)
+    df_es = pd.DataFrame(data_spanish)
+
+    print("\n" + "="*60)
+    print("🇺🇸 TABLA: RESULTADOS MODELO INGLÉS (TweetEval)")
+    print("   Modelo: twitter-roberta-base-sentiment-latest")
+    print("="*60)
+    print(df_en.to_string(index=False))
+    print("\n\n")
+
+    print("="*60)
+    print("🇪🇨 TABLA: RESULTADOS MODELO ESPAÑOL (TweetSentMult)")
+    print("   Modelo: robertuito-finetuned (Optimizado)")
+    print("="*60)
+    print(df_es.to_string(index=False))
+    print("="*60 + "\n")
@@ -1,13 +1,116 @@
 # src/agents/sentiment/sentiment_eval_hf.py
 from __future__ import annotations
 import argparse
+import hashlib
 import json
-from typing import List, Dict, Any
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Tuple
 
 from datasets import load_dataset
 
-from .sentiment_precise import SentimentPrecise
-from .sentiment_eval import accuracy, macro_f1, mcc_multiclass, LABELS
+from .sentiment_precise import DEFAULT_CASCADE_BACKEND, SentimentPrecise
+from .sentiment_hf import BASE_DIR, model_identity
+from .sentiment_eval import evaluate, LABELS
+
+# Predicciones cacheadas por (dataset, split, muestra, modelo+revisión, backend, cascada):
+# reevaluar tras cambiar solo métricas o agregar un dataset no vuelve a inferir
+EVAL_CACHE_DIR = os.path.join(BASE_DIR, "data", "cache", "eval")
+DEFAULT_EVAL_BATCH = 64
+DEFAULT_BOOTSTRAP = 1000
+
+
+def _star_label(raw: int) -> str:
+    # 0..4 → 1..5 estrellas (ver card del dataset): 0 -> 1 star, 4 -> 5 stars
+    if raw in (0, 1):
+        return "negative"
+    elif raw == 2:
+        return "neutral"
+    return "positive"
+
+
+# Ejemplos de routing según dataset_id
+DATASETS: Dict[str, Dict[str, Any]] = {
+    # Inglés, tweets
+    "cardiffnlp/tweet_eval": dict(
+        subset="sentiment", text_field="text", label_field="label",
+        label_mapping={0: "negative", 1: "neutral", 2: "positive"}, lang_hint="en",
+    ),
+    # Español, tweets (subset "spanish")
+    "cardiffnlp/tweet_sentiment_multilingual": dict(
+        subset="spanish", text_field="text", label_field="label",
+        label_mapping={0: "negative", 1: "neutral", 2: "positive"}, lang_hint="es",
+    ),
+    # Reseñas largas en inglés, label 0..4 (mapping por estrellas)
+    "SetFit/amazon_reviews_multi_en": dict(
+        subset="default", text_field="text", label_field="label",
+        label_mapping={i: _star_label(i) for i in range(5)}, lang_hint="en",
+    ),
+}
+
+
+def _load_examples(
+    dataset_id: str,
+    subset: str | None,
+    split: str,
+    text_field: str,
+    label_field: str,
+    label_mapping: Dict[Any, str],
+    max_samples: int | None,
+) -> Tuple[List[str], List[str]]:
+    if subset:
+        ds = load_dataset(dataset_id, subset, split=split, trust_remote_code=True)
+    else:
+        ds = load_dataset(dataset_id, split=split, trust_remote_code=True)
+
+    if max_samples is not None and len(ds) > max_samples:
+        ds = ds.shuffle(seed=42).select(range(max_samples))
+
+    texts: List[str] = []
+    golds: List[str] = []
+    # Columnas enteras: evita materializar un dict por ejemplo
+    for text, raw_label in zip(ds[text_field], ds[label_field]):
+        # Mapear a nuestras 3 clases
+        gold = label_mapping.get(raw_label)
+        if gold not in LABELS:
+            # por seguridad, saltar ejemplos raros
+            continue
+        texts.append(text)
+        golds.append(gold)
+    return texts, golds
+
+
+def _prediction_key(cfg: Dict[str, Any], backend: str | None, cascade: Dict[str, Any]) -> str:
+    route = SentimentPrecise._route(cfg.get("lang_hint"))
+    ident: Dict[str, Any] = {
+        **{k: cfg.get(k) for k in ("dataset_id", "subset", "split", "text_field",
+                                   "label_field", "lang_hint", "max_samples")},
+        "model": model_identity(route, backend),
+    }
+    if cascade.get("tau1") is not None:
+        m1 = cascade.get("cascade_backend") or DEFAULT_CASCADE_BACKEND
+        ident["cascade"] = {**cascade, "m1": model_identity(route, m1)}
+    raw = json.dumps(ident, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _load_cached(path: str, n: int) -> List[str] | None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            preds = json.load(f)["preds"]
+    except (OSError, ValueError, KeyError):
+        return None
+    return preds if len(preds) == n else None
+
+
+def _save_cached(path: str, preds: List[str], meta: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({**meta, "preds": preds}, f)
+    os.replace(tmp, path)
 
 
 def _eval_dataset(
@@ -19,6 +122,13 @@ def _eval_dataset(
     label_mapping: Dict[Any, str],
     lang_hint: str | None = None,
     max_samples: int | None = 2000,
+    backend: str | None = None,
+    batch_size: int = DEFAULT_EVAL_BATCH,
+    use_cache: bool = True,
+    n_boot: int = DEFAULT_BOOTSTRAP,
+    tau1: float | None = None,
+    tau2: float | None = None,
+    cascade_backend: str | None = None,
 ) -> Dict[str, Any]:
     """
     Evalúa SentimentPrecise sobre un dataset de HF.
@@ -31,111 +141,148 @@ def _eval_dataset(
     - label_mapping: dict que mapea valor bruto → "negative|neutral|positive"
     - lang_hint: "en" / "es" (opcional)
     - max_samples: para no morir evaluando 200k ejemplos
+    - backend:    backend/precisión de inferencia (torch, torch-bf16, torch-int8, onnx, ...)
+    - batch_size: textos por llamada a analyze_batch
+    - use_cache:  reutiliza las predicciones guardadas para la misma revisión del modelo
+    - n_boot:     remuestras bootstrap para los IC (0 = sin IC)
     """
+    cfg = dict(dataset_id=dataset_id, subset=subset, split=split, text_field=text_field,
+               label_field=label_field, lang_hint=lang_hint, max_samples=max_samples)
+    cascade = dict(tau1=tau1, tau2=tau2, cascade_backend=cascade_backend)
 
-    if subset:
-        ds = load_dataset(dataset_id, subset, split=split, trust_remote_code=True)
-    else:
-        ds = load_dataset(dataset_id, split=split, trust_remote_code=True)
+    t0 = time.perf_counter()
+    texts, y_true = _load_examples(dataset_id, subset, split, text_field, label_field,
+                                   label_mapping, max_samples)
+    t_load = time.perf_counter() - t0
 
-    if max_samples is not None and len(ds) > max_samples:
-        ds = ds.shuffle(seed=42).select(range(max_samples))
+    key = _prediction_key(cfg, backend, cascade)
+    cache_path = os.path.join(EVAL_CACHE_DIR, f"{key}.json")
+    y_pred = _load_cached(cache_path, len(texts)) if use_cache else None
+    cached = y_pred is not None
 
-    sp = SentimentPrecise()
+    t1 = time.perf_counter()
+    if y_pred is None:
+        sp = SentimentPrecise(backend=backend, batch_size=batch_size, **cascade)
+        outs = sp.analyze_batch(texts, [lang_hint] * len(texts), batch_size=batch_size)
+        y_pred = [o["label"] for o in outs]
+        _save_cached(cache_path, y_pred, {"key": key, **cfg, "backend": backend, **cascade})
+    t_pred = time.perf_counter() - t1
 
-    y_true: List[str] = []
-    y_pred: List[str] = []
+    return {
+        **evaluate(y_true, y_pred, n_boot=n_boot),
+        "cached": cached,
+        "load_s": round(t_load, 2),
+        "predict_s": round(t_pred, 2),
+        "_preds": y_pred,
+    }
 
-    for ex in ds:
-        text = ex[text_field]
-        raw_label = ex[label_field]
 
-        # Mapear a nuestras 3 clases
-        gold = label_mapping[raw_label]
-        if gold not in LABELS:
-            # por seguridad, saltar ejemplos raros
-            continue
+def dataset_config(name: str, subset: str | None, split: str, max_samples: int | None) -> Dict[str, Any]:
+    if name not in DATASETS:
+        raise ValueError(f"No tengo configurado el dataset {name} aún 🤷‍♀️")
+    base = DATASETS[name]
+    return dict(
+        dataset_id=name,
+        subset=subset or base["subset"],
+        split=split,
+        text_field=base["text_field"],
+        label_field=base["label_field"],
+        label_mapping=base["label_mapping"],
+        lang_hint=base["lang_hint"],
+        max_samples=max_samples,
+    )
 
-        pred = sp.analyze(text, lang_hint=lang_hint)
-        y_true.append(gold)
-        y_pred.append(pred["label"])
 
-    return {
-        "n": len(y_true),
-        "accuracy": accuracy(y_true, y_pred),
-        "macro_f1": macro_f1(y_true, y_pred),
-        "mcc": mcc_multiclass(y_true, y_pred),
-    }
+def _worker_init(threads: int):
+    # Cada worker usa su parte de los núcleos para no sobre-suscribir la CPU
+    import torch
+    torch.set_num_threads(max(1, threads))
+
+
+def _eval_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return _eval_dataset(**job)
+
+
+def run_evaluations(jobs: List[Dict[str, Any]], workers: int = 1) -> List[Dict[str, Any]]:
+    """
+    Evalúa varios (dataset, backend) a la vez, cada uno en su proceso (spawn).
+    Con workers=1 corre en serie en este proceso.
+    """
+    workers = max(1, min(workers, len(jobs)))
+    if workers == 1:
+        return [_eval_dataset(**job) for job in jobs]
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    ctx = mp.get_context("spawn")  # fork + torch/tokenizers no es seguro
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_worker_init, initargs=(threads,)) as ex:
+        return list(ex.map(_eval_job, jobs))
+
+
+def _delta_report(results: Dict[str, Dict[str, Any]], baseline: str) -> Dict[str, Any]:
+    """Diferencia de métricas y acuerdo de predicciones de cada backend vs el baseline."""
+    ref = results[baseline]
+    report: Dict[str, Any] = {}
+    for backend, res in results.items():
+        entry = {k: v for k, v in res.items() if not k.startswith("_")}
+        if backend != baseline:
+            for k in ("accuracy", "macro_f1", "mcc"):
+                entry[f"delta_{k}"] = round(res[k] - ref[k], 4)
+            same = sum(1 for a, b in zip(ref["_preds"], res["_preds"]) if a == b)
+            entry["agreement_vs_baseline"] = round(same / max(1, len(ref["_preds"])), 4)
+        report[backend] = entry
+    return report
 
 
 def main():
     ap = argparse.ArgumentParser(description="Evalua SentimentPrecise sobre datasets de HuggingFace")
-    ap.add_argument("--dataset", required=True, help="ID del dataset en HF (p.ej. cardiffnlp/tweet_eval)")
+    ap.add_argument("--dataset", required=True,
+                    help="ID(s) del dataset en HF separados por comas (p.ej. cardiffnlp/tweet_eval) o 'all'")
     ap.add_argument("--subset", default=None, help="Config/subset (p.ej. sentiment, spanish, default)")
     ap.add_argument("--split", default="test", help="Split: train/validation/test")
     ap.add_argument("--max_samples", type=int, default=2000, help="Máx. ejemplos a evaluar")
+    ap.add_argument("--backends", default=None,
+                    help="Lista separada por comas (p.ej. torch-fp32,torch-bf16,torch-int8): "
+                         "reporta el delta de cada una vs la primera (baseline fp32)")
+    ap.add_argument("--batch_size", type=int, default=DEFAULT_EVAL_BATCH)
+    ap.add_argument("--bootstrap", type=int, default=DEFAULT_BOOTSTRAP,
+                    help="Remuestras bootstrap para los IC al 95%% (0 = sin IC)")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Evaluaciones (dataset × backend) en paralelo, un proceso cada una")
+    ap.add_argument("--no_cache", action="store_true", help="Ignora las predicciones cacheadas")
+    ap.add_argument("--tau1", type=float, default=None)
+    ap.add_argument("--tau2", type=float, default=None)
+    ap.add_argument("--cascade_backend", default=None)
     args = ap.parse_args()
+    backends = [b.strip() for b in (args.backends or "").split(",") if b.strip()] or [None]
+    names = list(DATASETS) if args.dataset == "all" else [d.strip() for d in args.dataset.split(",") if d.strip()]
 
-    # Ejemplos de routing según dataset_id
-    if args.dataset == "cardiffnlp/tweet_eval":
-        # Inglés, tweets
-        mapping = {0: "negative", 1: "neutral", 2: "positive"}
-        res = _eval_dataset(
-            dataset_id="cardiffnlp/tweet_eval",
-            subset=args.subset or "sentiment",
-            split=args.split,
-            text_field="text",
-            label_field="label",
-            label_mapping=mapping,
-            lang_hint="en",
-            max_samples=args.max_samples,
-        )
-
-    elif args.dataset == "cardiffnlp/tweet_sentiment_multilingual":
-        # Español, tweets
-        # subset debe ser "spanish"
-        mapping = {0: "negative", 1: "neutral", 2: "positive"}
-        res = _eval_dataset(
-            dataset_id="cardiffnlp/tweet_sentiment_multilingual",
-            subset=args.subset or "spanish",
-            split=args.split,
-            text_field="text",
-            label_field="label",
-            label_mapping=mapping,
-            lang_hint="es",
-            max_samples=args.max_samples,
-        )
-
-    elif args.dataset == "SetFit/amazon_reviews_multi_en":
-        # Reseñas largas en inglés
-        # label: 0..4   (usa mapping por estrellas)
-        def map_star_label(raw: int) -> str:
-            # 0..4 → 1..5 estrellas (ver card del dataset)
-            # 0 -> 1 star, 4 -> 5 stars
-            if raw in (0, 1):
-                return "negative"
-            elif raw == 2:
-                return "neutral"
-            else:  # 3, 4
-                return "positive"
-
-        mapping = {i: map_star_label(i) for i in range(5)}
-
-        res = _eval_dataset(
-            dataset_id="SetFit/amazon_reviews_multi_en",
-            subset=args.subset or "default",
-            split=args.split,
-            text_field="text",
-            label_field="label",
-            label_mapping=mapping,
-            lang_hint="en",
-            max_samples=args.max_samples,
-        )
+    jobs = [
+        {
+            **dataset_config(name, args.subset, args.split, args.max_samples),
+            "backend": b, "batch_size": args.batch_size, "use_cache": not args.no_cache,
+            "n_boot": args.bootstrap, "tau1": args.tau1, "tau2": args.tau2,
+            "cascade_backend": args.cascade_backend,
+        }
+        for name in names for b in backends
+    ]
+    t0 = time.perf_counter()
+    outs = iter(run_evaluations(jobs, args.workers))
 
-    else:
-        raise ValueError(f"No tengo configurado el dataset {args.dataset} aún 🤷‍♀️")
+    report: Dict[str, Any] = {}
+    for name in names:
+        results = {str(b or "default"): next(outs) for b in backends}
+        if len(results) == 1:
+            res = {k: v for k, v in next(iter(results.values())).items() if not k.startswith("_")}
+            report[name] = {"subset": args.subset, **res}
+        else:
+            report[name] = {"subset": args.subset,
+                            "backends": _delta_report(results, baseline=next(iter(results)))}
 
-    print(json.dumps({"dataset": args.dataset, "subset": args.subset, **res}, indent=2, ensure_ascii=False))
+    if len(names) == 1:
+        print(json.dumps({"dataset": names[0], **report[names[0]]}, indent=2, ensure_ascii=False))
+    else:
+        print(json.dumps({"datasets": report, "elapsed_s": round(time.perf_counter() - t0, 1)},
+                         indent=2, ensure_ascii=False))
 
 
 if __name__ == "__main__":
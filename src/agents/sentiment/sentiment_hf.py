@@ -2,8 +2,15 @@
 from __future__ import annotations
 from typing import Dict, Any, List, Tuple
 import os
+import hashlib
+import numpy as np
 import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, TextClassificationPipeline
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification, TextClassificationPipeline
+
+from src.utils import batch_autotune
+from src.agents.sentiment.sentiment_scheduler import (
+    DEFAULT_TOKEN_BUDGET, LENGTH_BUCKETING, PADDING_STATS, plan_batches,
+)
 
 # ---------------------------------------------------------
 # CONFIGURACIÓN DE MODELOS (Rutas Absolutas)
@@ -15,6 +22,8 @@ ROBERTA_ES_PATH = os.path.join(BASE_DIR, "models", "robertuito-finetuned")
 ROBERTA_EN = "cardiffnlp/twitter-roberta-base-sentiment-latest"
 ROBERTA_ES = ROBERTA_ES_PATH 
 
+ROBERTA_ES_FALLBACK = "pysentimiento/robertuito-sentiment-analysis"
+
 # ---------------------------------------------------------
 # SETUP DEL DISPOSITIVO
 # ---------------------------------------------------------
@@ -25,50 +34,205 @@ def _device():
         return "mps"
     return -1  # CPU
 
-def _build_pipeline(model_name: str) -> TextClassificationPipeline:
-    """Carga tokenizador y modelo en un pipeline de HF."""
-    print(f"   🔄 [SentimentHF] Cargando: {os.path.basename(model_name)} ...")
+# ---------------------------------------------------------
+# BACKENDS DE INFERENCIA (Pluggables)
+# ---------------------------------------------------------
+# "torch"     -> PyTorch fp32 (default)
+# "onnx"      -> ONNX Runtime fp32 (CPU)
+# "onnx-int8" -> ONNX Runtime con cuantización dinámica int8 (CPU)
+# "torch-mmap"-> PyTorch fp32 con pesos safetensors memory-mapped (workers comparten páginas)
+# "torch-bf16"-> PyTorch con torch.autocast bf16 en CPU (si la CPU lo soporta)
+# "torch-int8"-> PyTorch con quantize_dynamic int8 sobre las capas Linear
+# "student"   -> alumno destilado (menos capas) entrenado con distill_sentiment.py
+SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "torch").lower().strip()
+# Precisión del backend "torch": fp32 | bf16 | int8 (atajo de torch-bf16 / torch-int8)
+SENTIMENT_PRECISION = os.getenv("SENTIMENT_PRECISION", "fp32").lower().strip()
+
+class _TorchPipeline(TextClassificationPipeline):
+    """Pipeline PyTorch bajo torch.inference_mode y, opcionalmente, autocast en CPU."""
+    autocast_dtype = None
+
+    def get_inference_context(self):
+        return torch.inference_mode
+
+    def _forward(self, model_inputs, **kwargs):
+        if self.autocast_dtype is None:
+            return super()._forward(model_inputs, **kwargs)
+        with torch.autocast("cpu", dtype=self.autocast_dtype):
+            out = super()._forward(model_inputs, **kwargs)
+        # el postprocess pasa los logits a numpy: los devolvemos en fp32
+        out["logits"] = out["logits"].float()
+        return out
+
+class _Bf16Pipeline(_TorchPipeline):
+    autocast_dtype = torch.bfloat16
+
+def _cpu_supports_bf16() -> bool:
+    """bf16 nativo en CPU (AVX512-BF16 / AMX); sin eso autocast bf16 es más lento que fp32."""
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            flags = f.read()
+        return "avx512_bf16" in flags or "amx_bf16" in flags
+    except OSError:
+        return False
+
+def _load_torch(model_name: str, pipeline_cls=_TorchPipeline) -> TextClassificationPipeline:
+    tok = AutoTokenizer.from_pretrained(model_name, use_fast=False)
+    mdl = AutoModelForSequenceClassification.from_pretrained(model_name)
+    return pipeline_cls(
+        model=mdl,
+        tokenizer=tok,
+        device=_device(),
+        top_k=None  # Retorna todas las puntuaciones
+    )
+
+def _load_torch_bf16(model_name: str) -> TextClassificationPipeline:
+    if _device() == -1 and not _cpu_supports_bf16():
+        print("   ⚠️ [SentimentHF] La CPU no soporta bf16 nativo: usando fp32.")
+        return _load_torch(model_name)
+    return _load_torch(model_name, _Bf16Pipeline)
+
+def _load_torch_int8(model_name: str) -> TextClassificationPipeline:
+    pipe = _load_torch(model_name)
+    if _device() != -1:
+        print("   ⚠️ [SentimentHF] quantize_dynamic int8 es solo para CPU: usando fp32.")
+        return pipe
+    pipe.model = torch.ao.quantization.quantize_dynamic(
+        pipe.model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+    return pipe
+
+def _load_onnx(model_name: str) -> TextClassificationPipeline:
+    from src.agents.sentiment.sentiment_onnx import build_onnx_pipeline
+    return build_onnx_pipeline(model_name, quantize=False)
+
+def _load_onnx_int8(model_name: str) -> TextClassificationPipeline:
+    from src.agents.sentiment.sentiment_onnx import build_onnx_pipeline
+    return build_onnx_pipeline(model_name, quantize=True)
+
+def _load_torch_mmap(model_name: str) -> TextClassificationPipeline:
+    from src.agents.sentiment.sentiment_mmap import build_mmap_pipeline
+    return build_mmap_pipeline(model_name)
+
+STUDENTS_DIR = os.path.join(BASE_DIR, "models", "students")
+
+def student_dir(model_name: str) -> str:
+    """Directorio del alumno destilado del modelo maestro model_name."""
+    return os.path.join(STUDENTS_DIR, os.path.basename(os.path.normpath(model_name)))
+
+def _load_student(model_name: str) -> TextClassificationPipeline:
+    path = student_dir(model_name)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"No hay alumno destilado en {path} (correr distill_sentiment.py)")
+    return _load_torch(path)
+
+BACKENDS = {
+    "torch": _load_torch,
+    "onnx": _load_onnx,
+    "onnx-int8": _load_onnx_int8,
+    "torch-mmap": _load_torch_mmap,
+    "torch-fp32": _load_torch,  # fp32 explícito (ignora SENTIMENT_PRECISION)
+    "torch-bf16": _load_torch_bf16,
+    "torch-int8": _load_torch_int8,
+    "student": _load_student,
+}
+
+def _resolve_backend(backend: str | None) -> str:
+    name = (backend or SENTIMENT_BACKEND).lower().strip()
+    if name == "torch" and SENTIMENT_PRECISION != "fp32":
+        name = f"torch-{SENTIMENT_PRECISION}"
+    if name not in BACKENDS:
+        raise ValueError(f"Backend de sentimiento desconocido: {name} (opciones: {sorted(BACKENDS)})")
+    return name
+
+def _build_pipeline(model_name: str, backend: str | None = None) -> TextClassificationPipeline:
+    """Carga tokenizador y modelo en un pipeline de HF (con el backend elegido)."""
+    backend = _resolve_backend(backend)
+    loader = BACKENDS[backend]
+    print(f"   🔄 [SentimentHF] Cargando: {os.path.basename(model_name)} ({backend}) ...")
     try:
         # Intentamos cargar (Local o Remoto)
-        tok = AutoTokenizer.from_pretrained(model_name, use_fast=False)
-        mdl = AutoModelForSequenceClassification.from_pretrained(model_name)
-        
-        return TextClassificationPipeline(
-            model=mdl,
-            tokenizer=tok,
-            device=_device(),
-            top_k=None  # Retorna todas las puntuaciones
-        )
+        return loader(model_name)
     except Exception as e:
         print(f"   ⚠️ Error cargando {model_name}: {e}")
         # Fallback inteligente
         if model_name == ROBERTA_ES:
-            print("   ⚠️ Usando fallback remoto 'pysentimiento/robertuito-sentiment-analysis'.")
-            fallback = "pysentimiento/robertuito-sentiment-analysis"
-            tok = AutoTokenizer.from_pretrained(fallback, use_fast=False)
-            mdl = AutoModelForSequenceClassification.from_pretrained(fallback)
-            return TextClassificationPipeline(
-                model=mdl, tokenizer=tok, device=_device(), top_k=None
-            )
+            print(f"   ⚠️ Usando fallback remoto '{ROBERTA_ES_FALLBACK}'.")
+            return loader(ROBERTA_ES_FALLBACK)
         raise e
 
 # ---------------------------------------------------------
-# SINGLETONS
+# SINGLETONS (uno por modelo y backend)
+# ---------------------------------------------------------
+_PIPES: Dict[Tuple[str, str], TextClassificationPipeline] = {}
+# Cargas que ya fallaron (p. ej. onnx sin optimum): no se reintentan en cada lote
+_FAILED: Dict[Tuple[str, str], Exception] = {}
+
+def _get_pipe(model_name: str, backend: str | None = None) -> TextClassificationPipeline:
+    key = (model_name, _resolve_backend(backend))
+    if key in _FAILED:
+        raise _FAILED[key]
+    if key not in _PIPES:
+        try:
+            _PIPES[key] = _build_pipeline(model_name, key[1])
+        except Exception as e:
+            _FAILED[key] = e
+            raise
+    return _PIPES[key]
+
+def pipe_available(route: str, backend: str | None = None) -> bool:
+    """True si el modelo de la ruta carga con ese backend (lo carga si hace falta)."""
+    try:
+        _get_pipe(ROBERTA_EN if route == "en" else ROBERTA_ES, backend)
+    except Exception:
+        return False
+    return True
+
+def _get_pipe_en(backend: str | None = None) -> TextClassificationPipeline:
+    return _get_pipe(ROBERTA_EN, backend)
+
+def _get_pipe_es(backend: str | None = None) -> TextClassificationPipeline:
+    return _get_pipe(ROBERTA_ES, backend)
+
+# ---------------------------------------------------------
+# IDENTIDAD DEL MODELO (para cachés persistentes)
 # ---------------------------------------------------------
-_PIPE_EN: TextClassificationPipeline | None = None
-_PIPE_ES: TextClassificationPipeline | None = None
+_IDENTITIES: Dict[Tuple[str, str], Tuple[str, str]] = {}
 
-def _get_pipe_en() -> TextClassificationPipeline:
-    global _PIPE_EN
-    if _PIPE_EN is None:
-        _PIPE_EN = _build_pipeline(ROBERTA_EN)
-    return _PIPE_EN
+def _model_name_for(route: str) -> str:
+    if route == "en":
+        return ROBERTA_EN
+    # Si no existe el fine-tune local se usará el fallback remoto
+    return ROBERTA_ES if os.path.isdir(ROBERTA_ES) else ROBERTA_ES_FALLBACK
 
-def _get_pipe_es() -> TextClassificationPipeline:
-    global _PIPE_ES
-    if _PIPE_ES is None:
-        _PIPE_ES = _build_pipeline(ROBERTA_ES)
-    return _PIPE_ES
+def _model_revision(model_name: str) -> str:
+    """Revisión sin cargar el modelo: huella de archivos (local) o commit del snapshot HF."""
+    if os.path.isdir(model_name):
+        h = hashlib.sha1()
+        for fn in sorted(os.listdir(model_name)):
+            st = os.stat(os.path.join(model_name, fn))
+            h.update(f"{fn}:{st.st_size}:{int(st.st_mtime)}".encode("utf-8"))
+        return h.hexdigest()[:12]
+    try:
+        from huggingface_hub import try_to_load_from_cache
+        cfg = try_to_load_from_cache(model_name, "config.json")
+        if isinstance(cfg, str):
+            # .../snapshots/<commit>/config.json
+            return os.path.basename(os.path.dirname(cfg))
+    except Exception:
+        pass
+    return "unknown"
+
+def model_identity(route: str, backend: str | None = None) -> Tuple[str, str]:
+    """(id de modelo + backend, revisión) del modelo al que se rutea 'en' | 'es'."""
+    key = (route, _resolve_backend(backend))
+    if key not in _IDENTITIES:
+        name = _model_name_for(route)
+        short = os.path.basename(os.path.normpath(name))
+        # el alumno se reentrena aparte: su revisión es la de sus propios archivos
+        weights = student_dir(name) if key[1] == "student" else name
+        _IDENTITIES[key] = (f"{short}:{key[1]}", _model_revision(weights))
+    return _IDENTITIES[key]
 
 # ---------------------------------------------------------
 # UTILIDADES DE NORMALIZACIÓN (Tu código excelente)
@@ -101,32 +265,197 @@ def _argmax_label(probs: Dict[str, float]) -> Tuple[str, float]:
     return lab, float(probs[lab])
 
 # ---------------------------------------------------------
-# FUNCIONES PÚBLICAS (API)
+# LÍMITES DE LONGITUD Y EMPAQUETADO
 # ---------------------------------------------------------
-def predict_english(text: str) -> Dict[str, Any]:
-    pipe = _get_pipe_en()
-    # Lógica segura de longitud (Tu gran aporte)
-    max_len = getattr(pipe.model.config, 'max_position_embeddings', 512)
-    safe_len = min(max_len, 512) - 2 
-    
-    out = pipe(text, truncation=True, max_length=safe_len)
-    probs = _to_probs(out)
-    label, conf = _argmax_label(probs)
-    return {
-        "model_used": "roberta_en", "lang_scope": "en",
-        "label": label, "confidence": conf, "probs": probs
-    }
+# Tamaño de lote por defecto para inferencia en bloque (configurable por env)
+DEFAULT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "32"))
 
-def predict_spanish(text: str) -> Dict[str, Any]:
-    pipe = _get_pipe_es()
+def _safe_len(route: str, config) -> int:
+    if route == "en":
+        # Lógica segura de longitud (Tu gran aporte)
+        max_len = getattr(config, 'max_position_embeddings', 512)
+        return min(max_len, 512) - 2
     # Lógica segura de longitud para Robertuito (Vital)
-    max_len = getattr(pipe.model.config, 'max_position_embeddings', 128)
-    safe_len = max_len - 2 
+    max_len = getattr(config, 'max_position_embeddings', 128)
+    return max_len - 2
+
+def _safe_len_en(pipe: TextClassificationPipeline) -> int:
+    return _safe_len("en", pipe.model.config)
 
-    out = pipe(text, truncation=True, max_length=safe_len)
-    probs = _to_probs(out)
+def _safe_len_es(pipe: TextClassificationPipeline) -> int:
+    return _safe_len("es", pipe.model.config)
+
+def _pack(hf_output, model_used: str, lang_scope: str) -> Dict[str, Any]:
+    probs = _to_probs(hf_output)
     label, conf = _argmax_label(probs)
     return {
-        "model_used": "roberta_es", "lang_scope": "es",
+        "model_used": model_used, "lang_scope": lang_scope,
         "label": label, "confidence": conf, "probs": probs
-    }
\ No newline at end of file
+    }
+
+def _forward_ids(pipe: TextClassificationPipeline, batch_ids: List[Any]) -> List[Any]:
+    """
+    Inferencia sobre ids ya tokenizados (sin pasar por el tokenizer del pipeline).
+    Devuelve lo mismo que el pipeline con top_k=None: [{label, score}, ...] por texto.
+    """
+    tok = pipe.tokenizer
+    pad = tok.pad_token_id if tok.pad_token_id is not None else 0
+    width = max(len(ids) for ids in batch_ids)
+    input_ids = torch.full((len(batch_ids), width), pad, dtype=torch.long)
+    mask = torch.zeros((len(batch_ids), width), dtype=torch.long)
+    left = getattr(tok, "padding_side", "right") == "left"
+    for r, ids in enumerate(batch_ids):
+        n = len(ids)
+        cols = slice(width - n, width) if left else slice(0, n)
+        input_ids[r, cols] = torch.from_numpy(np.asarray(ids, dtype=np.int64))
+        mask[r, cols] = 1
+    logits = pipe.forward({"input_ids": input_ids, "attention_mask": mask})["logits"]
+    probs = torch.softmax(logits.float(), dim=-1).numpy()
+    id2label = pipe.model.config.id2label
+    return [[{"label": id2label[j], "score": float(p[j])} for j in range(len(p))] for p in probs]
+
+def _run_batch(pipe: TextClassificationPipeline, texts: List[str], safe_len: int,
+               batch_size: int | None, token_budget: int | None = None,
+               token_ids: List[Any] | None = None) -> List[Any]:
+    """
+    Pasa una lista de textos por el pipeline como lotes con padding.
+    Con LENGTH_BUCKETING los textos se tokenizan una sola vez, se ordenan por
+    longitud en tokens y se agrupan bajo un presupuesto de tokens (batch_size
+    queda como tope de filas); esos mismos ids van al modelo sin re-entrar al
+    pipeline. La salida vuelve en el orden de entrada.
+    token_ids (opcional, alineado con texts): ids pre-tokenizados (sidecar de
+    chunks); esos textos no se re-tokenizan y los que vengan en None sí.
+    """
+    if not texts:
+        return []
+    bs = max(1, int(batch_size or DEFAULT_BATCH_SIZE))
+    if token_ids is not None and any(ids is not None for ids in token_ids):
+        return _run_batch_ids(pipe, texts, safe_len, bs, token_budget, token_ids)
+    if not LENGTH_BUCKETING or len(texts) <= 1:
+        return pipe(list(texts), truncation=True, max_length=safe_len, batch_size=bs)
+
+    enc = pipe.tokenizer(list(texts), truncation=True, max_length=safe_len)
+    return _run_batch_ids(pipe, texts, safe_len, bs, token_budget, enc["input_ids"])
+
+def _run_batch_ids(pipe: TextClassificationPipeline, texts: List[str], safe_len: int, bs: int,
+                   token_budget: int | None, token_ids: List[Any]) -> List[Any]:
+    ids = list(token_ids)
+    # ids ausentes o que no caben en la ventana (otro modelo): se tokenizan aquí
+    missing = [i for i, x in enumerate(ids) if x is None or len(x) > safe_len]
+    if missing:
+        enc = pipe.tokenizer([texts[i] for i in missing], truncation=True, max_length=safe_len)
+        for i, x in zip(missing, enc["input_ids"]):
+            ids[i] = x
+    lengths = [len(x) for x in ids]
+    if LENGTH_BUCKETING:
+        batches = plan_batches(lengths, token_budget or DEFAULT_TOKEN_BUDGET, bs)
+        PADDING_STATS.record(lengths, batches, bs)
+    else:
+        batches = [list(range(i, min(i + bs, len(ids)))) for i in range(0, len(ids), bs)]
+
+    outs: List[Any] = [None] * len(texts)
+    for idxs in batches:
+        for i, o in zip(idxs, _forward_ids(pipe, [ids[i] for i in idxs])):
+            outs[i] = o
+    return outs
+
+def padding_report() -> Dict[str, float]:
+    """Eficiencia de padding acumulada por _run_batch (tokens reales / con padding)."""
+    return PADDING_STATS.report()
+
+# ---------------------------------------------------------
+# FUNCIONES PÚBLICAS (API)
+# ---------------------------------------------------------
+def predict_english(text: str, backend: str | None = None) -> Dict[str, Any]:
+    pipe = _get_pipe_en(backend)
+    out = pipe(text, truncation=True, max_length=_safe_len_en(pipe))
+    return _pack(out, "roberta_en", "en")
+
+def predict_spanish(text: str, backend: str | None = None) -> Dict[str, Any]:
+    pipe = _get_pipe_es(backend)
+    out = pipe(text, truncation=True, max_length=_safe_len_es(pipe))
+    return _pack(out, "roberta_es", "es")
+
+_TOKENIZERS: Dict[str, Tuple[Any, Any]] = {}
+
+def tokenizer_budget(route: str, backend: str | None = None) -> Tuple[Any, int]:
+    """
+    Tokenizer del modelo ruteado ('en' | 'es') y cuántos subwords de contenido
+    caben sin truncar (ventana segura menos tokens especiales).
+    Si el modelo aún no está cargado solo se carga tokenizer + config (sin pesos).
+    """
+    model_name = ROBERTA_EN if route == "en" else ROBERTA_ES
+    pipe = _PIPES.get((model_name, _resolve_backend(backend)))
+    if pipe is not None:
+        tok, config = pipe.tokenizer, pipe.model.config
+    else:
+        if route not in _TOKENIZERS:
+            name = _model_name_for(route)
+            _TOKENIZERS[route] = (
+                AutoTokenizer.from_pretrained(name, use_fast=False),
+                AutoConfig.from_pretrained(name),
+            )
+        tok, config = _TOKENIZERS[route]
+    return tok, _safe_len(route, config) - tok.num_special_tokens_to_add()
+
+# ---------------------------------------------------------
+# AUTOTUNING DEL TAMAÑO DE LOTE (SENTIMENT_AUTOTUNE=1)
+# ---------------------------------------------------------
+_TUNED: Dict[Tuple[str, str], int] = {}
+AUTOTUNE_MIN_TEXTS = 64      # con menos textos reales se mide sobre un corpus sintético
+AUTOTUNE_SAMPLES = 256
+
+def _tuning_samples(route: str, texts: List[str]) -> List[str]:
+    """
+    Textos con los que se mide: los reales si la llamada trae suficientes; si no
+    (un lote de 1, uno adelgazado por la caché), el corpus sintético del benchmark
+    con la distribución de longitudes tipo Reddit, para que el lote persistido
+    no salga de un puñado de textos cortos.
+    """
+    if len(texts) >= AUTOTUNE_MIN_TEXTS:
+        return list(texts[:AUTOTUNE_SAMPLES])
+    from src.agents.sentiment.sentiment_bench import synthetic_corpus
+    docs = synthetic_corpus(AUTOTUNE_SAMPLES, 1.0 if route == "es" else 0.0, "reddit",
+                            mean_words=60, max_words=400, seed=0)
+    return [d["text_norm"] for d in docs]
+
+def _batch_size_for(route: str, backend: str | None, pipe: TextClassificationPipeline,
+                    texts: List[str], safe_len: int, batch_size: int | None) -> int | None:
+    """
+    Lote explícito si lo hay; si no, con autotuning activo, el tamaño elegido
+    para este modelo/backend/host. Se mide en el primer uso por el mismo camino
+    que la inferencia real (_run_batch: con LENGTH_BUCKETING el lote es el tope
+    de filas bajo el presupuesto de tokens).
+    """
+    if batch_size or not batch_autotune.enabled():
+        return batch_size
+    key = (route, _resolve_backend(backend))
+    if key not in _TUNED:
+        model_id = model_identity(route, backend)[0]
+        _TUNED[key] = batch_autotune.autotune_batch_size(
+            f"sentiment:{model_id}:{_device()}",
+            lambda items, bs: _run_batch(pipe, items, safe_len, bs),
+            _tuning_samples(route, texts),
+            fallback=DEFAULT_BATCH_SIZE,
+        )
+    return _TUNED[key]
+
+def predict_english_batch(texts: List[str], batch_size: int | None = None,
+                          backend: str | None = None,
+                          token_ids: List[Any] | None = None) -> List[Dict[str, Any]]:
+    """Versión en lote de predict_english (mismo esquema, mismo orden)."""
+    pipe = _get_pipe_en(backend)
+    safe_len = _safe_len_en(pipe)
+    bs = _batch_size_for("en", backend, pipe, texts, safe_len, batch_size)
+    outs = _run_batch(pipe, texts, safe_len, bs, token_ids=token_ids)
+    return [_pack(o, "roberta_en", "en") for o in outs]
+
+def predict_spanish_batch(texts: List[str], batch_size: int | None = None,
+                          backend: str | None = None,
+                          token_ids: List[Any] | None = None) -> List[Dict[str, Any]]:
+    """Versión en lote de predict_spanish (mismo esquema, mismo orden)."""
+    pipe = _get_pipe_es(backend)
+    safe_len = _safe_len_es(pipe)
+    bs = _batch_size_for("es", backend, pipe, texts, safe_len, batch_size)
+    outs = _run_batch(pipe, texts, safe_len, bs, token_ids=token_ids)
+    return [_pack(o, "roberta_es", "es") for o in outs]
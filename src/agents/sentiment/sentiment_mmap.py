@@ -0,0 +1,195 @@
+# src/agents/sentiment/sentiment_mmap.py
+from __future__ import annotations
+import argparse
+import contextlib
+import json
+import multiprocessing as mp
+import os
+import shutil
+import struct
+import time
+from typing import Dict, Any, List, Optional
+
+import torch
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification, TextClassificationPipeline
+
+from src.agents.sentiment.sentiment_hf import (
+    BASE_DIR, _build_pipeline, _device, _model_name_for,
+)
+
+# ---------------------------------------------------------
+# RUTAS DE EXPORTACIÓN
+# ---------------------------------------------------------
+SAFETENSORS_DIR = os.path.join(BASE_DIR, "models", "safetensors")
+SAFETENSORS_FILE = "model.safetensors"
+
+_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8,
+    "U8": torch.uint8, "BOOL": torch.bool,
+}
+
+def _export_dir(model_name: str) -> str:
+    return os.path.join(SAFETENSORS_DIR, os.path.basename(model_name.rstrip("/\\")))
+
+# ---------------------------------------------------------
+# EXPORTACIÓN (una sola vez, luego se reutiliza desde disco)
+# ---------------------------------------------------------
+def export_safetensors(model_name: str, force: bool = False) -> str:
+    """Guarda pesos (safetensors), config y tokenizer del modelo HF en un directorio local."""
+    out = _export_dir(model_name)
+    if force or not os.path.exists(os.path.join(out, SAFETENSORS_FILE)):
+        print(f"   📦 [SentimentMMAP] Exportando {os.path.basename(model_name)} → {out}")
+        # se exporta a un directorio temporal y se renombra: varios workers
+        # arrancando a la vez nunca ven un export a medias
+        tmp = f"{out}.tmp{os.getpid()}"
+        mdl = AutoModelForSequenceClassification.from_pretrained(model_name)
+        mdl.save_pretrained(tmp, safe_serialization=True)
+        AutoTokenizer.from_pretrained(model_name, use_fast=False).save_pretrained(tmp)
+        if force:
+            shutil.rmtree(out, ignore_errors=True)
+        try:
+            os.rename(tmp, out)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)  # otro proceso terminó primero
+    return out
+
+# ---------------------------------------------------------
+# CARGA MEMORY-MAPPED (cero copias)
+# ---------------------------------------------------------
+def load_mmap_state_dict(path: str) -> Dict[str, torch.Tensor]:
+    """
+    Tensores que apuntan directo a un mmap privado (copy-on-write) del archivo
+    safetensors: todos los procesos que lo abren comparten las mismas páginas
+    del page cache mientras nadie escriba en los pesos.
+    """
+    with open(path, "rb") as f:
+        n = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(n))
+    base = 8 + n
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+
+    state: Dict[str, torch.Tensor] = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = _DTYPES[info["dtype"]]
+        start, _ = info["data_offsets"]
+        itemsize = torch.empty((), dtype=dtype).element_size()
+        if (base + start) % itemsize:
+            raise ValueError(f"Tensor desalineado en {path}: {name}")
+        t = torch.empty(0, dtype=dtype)
+        t.set_(storage, (base + start) // itemsize, info["shape"])
+        state[name] = t
+    return state
+
+def _no_init():
+    """Crea el modelo sin inicializar pesos (torch.empty no toca páginas)."""
+    try:
+        from transformers.modeling_utils import no_init_weights
+        return no_init_weights()
+    except Exception:
+        return contextlib.nullcontext()
+
+def load_mmap_model(model_dir: str):
+    config = AutoConfig.from_pretrained(model_dir)
+    with _no_init():
+        mdl = AutoModelForSequenceClassification.from_config(config)
+    state = load_mmap_state_dict(os.path.join(model_dir, SAFETENSORS_FILE))
+    missing, unexpected = mdl.load_state_dict(state, strict=False, assign=True)
+    # buffers no persistentes (position_ids, ...) los crea el propio modelo
+    persistent = set(mdl.state_dict().keys()) - {
+        f"{mod}.{b}" if mod else b
+        for mod, m in mdl.named_modules()
+        for b in getattr(m, "_non_persistent_buffers_set", ())
+    }
+    missing = [k for k in missing if k in persistent]
+    if missing:
+        raise ValueError(f"Pesos faltantes en {model_dir}: {missing[:5]}")
+    mdl.tie_weights()
+    return mdl.eval()
+
+def build_mmap_pipeline(model_name: str) -> TextClassificationPipeline:
+    """Pipeline PyTorch con pesos memory-mapped (misma interfaz que el de _load_torch)."""
+    path = export_safetensors(model_name)
+    return TextClassificationPipeline(
+        model=load_mmap_model(path),
+        tokenizer=AutoTokenizer.from_pretrained(path, use_fast=False),
+        device=_device(),
+        top_k=None,
+    )
+
+# ---------------------------------------------------------
+# MEDICIÓN: RSS por worker y arranque en frío
+# ---------------------------------------------------------
+def _memory_mb() -> Dict[str, float]:
+    """RSS anónimo/de archivo y PSS (reparte las páginas compartidas entre procesos)."""
+    out: Dict[str, float] = {}
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                k, _, v = line.partition(":")
+                if k in ("VmRSS", "RssAnon", "RssFile"):
+                    out[k] = round(int(v.split()[0]) / 1024, 1)
+        with open("/proc/self/smaps_rollup", "r") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    out["Pss"] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass  # solo Linux
+    return out
+
+def _cold_start(job: Dict[str, Any]) -> Dict[str, Any]:
+    torch.set_num_threads(1)
+    t0 = time.perf_counter()
+    pipes = [_build_pipeline(_model_name_for(lang), job["backend"]) for lang in job["langs"]]
+    load_s = time.perf_counter() - t0
+    for p in pipes:
+        p("ok")
+    first_s = time.perf_counter() - t0
+    job["barrier"].wait()  # todos cargados a la vez: así se ve el reparto de páginas
+    return {"load_s": round(load_s, 2), "first_inference_s": round(first_s, 2), **_memory_mb()}
+
+def compare_cold_start(backends: List[str], workers: int, langs: List[str]) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"workers": workers, "langs": langs, "backends": {}}
+    ctx = mp.get_context("spawn")
+    for backend in backends:
+        with mp.Manager() as mgr:
+            barrier = mgr.Barrier(workers)
+            jobs = [{"backend": backend, "langs": langs, "barrier": barrier} for _ in range(workers)]
+            with ctx.Pool(workers) as pool:
+                per_worker = pool.map(_cold_start, jobs)
+
+        def _mean(k: str) -> Optional[float]:
+            vals = [w[k] for w in per_worker if k in w]
+            return round(sum(vals) / len(vals), 2) if vals else None
+
+        report["backends"][backend] = {
+            "load_s_mean": _mean("load_s"),
+            "load_s_max": max(w["load_s"] for w in per_worker),
+            "first_inference_s_mean": _mean("first_inference_s"),
+            "rss_mb_mean": _mean("VmRSS"),
+            "rss_anon_mb_mean": _mean("RssAnon"),
+            "rss_file_mb_mean": _mean("RssFile"),
+            "pss_mb_mean": _mean("Pss"),
+            "pss_mb_total": round(sum(w.get("Pss", 0.0) for w in per_worker), 1),
+        }
+    return report
+
+def main():
+    ap = argparse.ArgumentParser(description="Exporta a safetensors y mide RSS/arranque con pesos memory-mapped")
+    ap.add_argument("--lang", choices=["en", "es", "both"], default="both")
+    ap.add_argument("--export", action="store_true", help="Exporta aunque ya exista en disco")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--backends", default="torch,torch-mmap")
+    args = ap.parse_args()
+
+    langs = ["en", "es"] if args.lang == "both" else [args.lang]
+    for lang in langs:
+        export_safetensors(_model_name_for(lang), force=args.export)
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    print(json.dumps(compare_cold_start(backends, args.workers, langs), indent=2))
+
+if __name__ == "__main__":
+    main()
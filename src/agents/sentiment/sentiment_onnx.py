@@ -0,0 +1,201 @@
+# src/agents/sentiment/sentiment_onnx.py
+from __future__ import annotations
+import argparse
+import json
+import os
+import time
+from typing import Dict, Any, List
+
+from transformers import AutoTokenizer
+
+from src.agents.sentiment.sentiment_hf import (
+    BASE_DIR, ROBERTA_EN, ROBERTA_ES, _build_pipeline, _run_batch,
+    _safe_len_en, _safe_len_es, _to_probs, _argmax_label,
+)
+
+# ---------------------------------------------------------
+# RUTAS DE EXPORTACIÓN
+# ---------------------------------------------------------
+ONNX_DIR = os.path.join(BASE_DIR, "models", "onnx")
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_quantized.onnx"
+
+# Hilos de ONNX Runtime (0 = lo decide ORT)
+ORT_THREADS = int(os.getenv("SENTIMENT_ORT_THREADS", "0"))
+
+def _export_dir(model_name: str, quantize: bool) -> str:
+    name = os.path.basename(model_name.rstrip("/\\"))
+    return os.path.join(ONNX_DIR, f"{name}-int8" if quantize else name)
+
+# ---------------------------------------------------------
+# EXPORTACIÓN (una sola vez, luego se reutiliza desde disco)
+# ---------------------------------------------------------
+def export_onnx(model_name: str, quantize: bool = False, force: bool = False) -> str:
+    """
+    Exporta el modelo HF a ONNX (y opcionalmente lo cuantiza a int8 dinámico).
+    Devuelve el directorio listo para ORTModelForSequenceClassification.
+    """
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    fp32_dir = _export_dir(model_name, quantize=False)
+    if force or not os.path.exists(os.path.join(fp32_dir, ONNX_FILE)):
+        print(f"   📦 [SentimentONNX] Exportando {os.path.basename(model_name)} → {fp32_dir}")
+        mdl = ORTModelForSequenceClassification.from_pretrained(model_name, export=True)
+        tok = AutoTokenizer.from_pretrained(model_name, use_fast=False)
+        mdl.save_pretrained(fp32_dir)
+        tok.save_pretrained(fp32_dir)
+
+    if not quantize:
+        return fp32_dir
+
+    q_dir = _export_dir(model_name, quantize=True)
+    if force or not os.path.exists(os.path.join(q_dir, ONNX_INT8_FILE)):
+        print(f"   🗜️ [SentimentONNX] Cuantizando int8 (dinámico) → {q_dir}")
+        quantizer = ORTQuantizer.from_pretrained(fp32_dir, file_name=ONNX_FILE)
+        # avx2 es el mínimo común en nuestros servidores CPU; dinámico = sin calibración
+        qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=q_dir, quantization_config=qconfig)
+        AutoTokenizer.from_pretrained(fp32_dir, use_fast=False).save_pretrained(q_dir)
+        ORTModelForSequenceClassification.from_pretrained(fp32_dir, file_name=ONNX_FILE).config.save_pretrained(q_dir)
+    return q_dir
+
+def build_onnx_pipeline(model_name: str, quantize: bool = False):
+    """Pipeline de clasificación sobre ONNX Runtime (misma interfaz que el de PyTorch)."""
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    from optimum.pipelines import pipeline as ort_pipeline
+
+    path = export_onnx(model_name, quantize=quantize)
+    opts = ort.SessionOptions()
+    if ORT_THREADS > 0:
+        opts.intra_op_num_threads = ORT_THREADS
+    mdl = ORTModelForSequenceClassification.from_pretrained(
+        path,
+        file_name=ONNX_INT8_FILE if quantize else ONNX_FILE,
+        provider="CPUExecutionProvider",
+        session_options=opts,
+    )
+    tok = AutoTokenizer.from_pretrained(path, use_fast=False)
+    return ort_pipeline("text-classification", model=mdl, tokenizer=tok, accelerator="ort", top_k=None)
+
+# ---------------------------------------------------------
+# PARIDAD Y LATENCIA vs PyTorch
+# ---------------------------------------------------------
+SAMPLE_TEXTS = {
+    "en": [
+        "I love this park in Quito",
+        "The service was terrible and nobody answered my emails.",
+        "It's fine I guess, nothing special.",
+        "Best update ever, the new features are amazing!",
+        "Prices keep going up and wages don't, this is exhausting.",
+    ],
+    "es": [
+        "Odio el tráfico de la Av. Occidental",
+        "Este gobierno es un desastre total, la economía se cae a pedazos.",
+        "El servicio fue regular, esperaba más.",
+        "Me encantó el concierto, la mejor noche del año!",
+        "No sé qué pensar de la nueva ley, habrá que ver.",
+    ],
+}
+
+def _read_texts(path: str, limit: int) -> List[str]:
+    texts: List[str] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except Exception:
+                continue
+            t = obj.get("text_norm") or obj.get("text")
+            if t:
+                texts.append(t)
+            if len(texts) >= limit:
+                break
+    return texts
+
+def compare_backends(
+    lang: str,
+    texts: List[str],
+    backends: List[str],
+    batch_size: int = 32,
+    repeats: int = 3,
+) -> Dict[str, Any]:
+    """
+    Corre los mismos textos por cada backend y reporta:
+    - paridad: máx. diferencia absoluta de probabilidades y % de labels iguales vs 'torch'
+    - latencia: mejor tiempo de `repeats` corridas (ms por texto)
+    """
+    model_name = ROBERTA_EN if lang == "en" else ROBERTA_ES
+    safe_len_fn = _safe_len_en if lang == "en" else _safe_len_es
+
+    probs_by_backend: Dict[str, List[Dict[str, float]]] = {}
+    report: Dict[str, Any] = {"lang": lang, "n_texts": len(texts), "backends": {}}
+
+    for backend in backends:
+        t0 = time.perf_counter()
+        pipe = _build_pipeline(model_name, backend)
+        load_s = time.perf_counter() - t0
+
+        safe_len = safe_len_fn(pipe)
+        _run_batch(pipe, texts[:batch_size], safe_len, batch_size)  # warm-up
+        best = float("inf")
+        outs: List[Any] = []
+        for _ in range(max(1, repeats)):
+            t0 = time.perf_counter()
+            outs = _run_batch(pipe, texts, safe_len, batch_size)
+            best = min(best, time.perf_counter() - t0)
+
+        probs_by_backend[backend] = [_to_probs(o) for o in outs]
+        report["backends"][backend] = {
+            "load_s": round(load_s, 3),
+            "ms_per_text": round(1000.0 * best / max(1, len(texts)), 3),
+        }
+
+    ref = probs_by_backend.get("torch")
+    if ref is not None:
+        ref_ms = report["backends"]["torch"]["ms_per_text"]
+        for backend, probs in probs_by_backend.items():
+            max_diff = max(
+                (abs(a[k] - b[k]) for a, b in zip(ref, probs) for k in a),
+                default=0.0,
+            )
+            agree = sum(
+                1 for a, b in zip(ref, probs) if _argmax_label(a)[0] == _argmax_label(b)[0]
+            )
+            entry = report["backends"][backend]
+            entry["max_abs_prob_diff"] = round(max_diff, 6)
+            entry["label_agreement"] = round(agree / max(1, len(probs)), 4)
+            entry["speedup_vs_torch"] = round(ref_ms / entry["ms_per_text"], 2) if entry["ms_per_text"] else None
+
+    return report
+
+def main():
+    ap = argparse.ArgumentParser(description="Exporta los modelos de sentimiento a ONNX y compara con PyTorch")
+    ap.add_argument("--lang", choices=["en", "es", "both"], default="both")
+    ap.add_argument("--export", action="store_true", help="Exporta (y cuantiza) aunque ya exista en disco")
+    ap.add_argument("--in", dest="inp", default=None, help="JSONL opcional con textos (text_norm/text)")
+    ap.add_argument("--limit", type=int, default=512)
+    ap.add_argument("--batch_size", type=int, default=32)
+    ap.add_argument("--repeats", type=int, default=3)
+    ap.add_argument("--backends", default="torch,onnx,onnx-int8")
+    args = ap.parse_args()
+
+    langs = ["en", "es"] if args.lang == "both" else [args.lang]
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+
+    results = []
+    for lang in langs:
+        model_name = ROBERTA_EN if lang == "en" else ROBERTA_ES
+        if args.export:
+            export_onnx(model_name, quantize=False, force=True)
+            export_onnx(model_name, quantize=True, force=True)
+        texts = _read_texts(args.inp, args.limit) if args.inp else SAMPLE_TEXTS[lang]
+        results.append(compare_backends(lang, texts, backends, args.batch_size, args.repeats))
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,251 @@
 # src/agents/sentiment/sentiment_precise.py
 from __future__ import annotations
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Sequence
 # Importamos los "Drivers" que acabamos de arreglar
-from src.agents.sentiment.sentiment_hf import predict_english, predict_spanish
+from src.agents.sentiment.sentiment_hf import (
+    predict_english, predict_spanish,
+    predict_english_batch, predict_spanish_batch,
+    tokenizer_budget, model_identity, pipe_available,
+)
+from src.agents.sentiment.sentiment_cache import SentimentCache
+
+# Backend barato de la primera etapa de la cascada (mismo modelo, int8)
+DEFAULT_CASCADE_BACKEND = "onnx-int8"
 
 class SentimentPrecise:
     """
     Router de Alto Nivel.
     Decide qué modelo usar y estandariza la salida.
+
+    Con tau1 activa una cascada de dos etapas: un modelo barato (m1) puntúa
+    todo y solo los textos con confianza < tau1 escalan al modelo completo (m2).
+    'source' registra la ruta tomada: m1_high_conf, m1_m2_consensus,
+    m2_override (m2 discrepa con confianza >= tau2), m2_low_conf o
+    m1_only_m2_error (escaló pero m2 falló). Si m1 no carga, se puntúa sin
+    cascada (solo m2).
     """
 
-    def __init__(self, **kwargs):
-        pass
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        cache: Optional[SentimentCache] = None,
+        backend: Optional[str] = None,
+        tau1: Optional[float] = None,
+        tau2: Optional[float] = None,
+        cascade_backend: Optional[str] = None,
+        **kwargs,
+    ):
+        # None -> usa DEFAULT_BATCH_SIZE / SENTIMENT_BACKEND de sentiment_hf
+        self.batch_size = batch_size
+        self.backend = backend
+        # Caché persistente opcional (se consulta antes de inferir)
+        self.cache = cache
+        # Cascada (desactivada si tau1 es None)
+        self.tau1 = tau1
+        self.tau2 = tau2 if tau2 is not None else tau1
+        self.cascade_backend = cascade_backend or DEFAULT_CASCADE_BACKEND
+        self._m1_down: set = set()  # rutas sin m1 disponible (ya avisadas)
+
+    @staticmethod
+    def _route(lang_hint: Optional[str]) -> str:
+        """Normaliza el idioma y devuelve la ruta: 'en' o 'es' (Default para Ecuador)."""
+        lang = (lang_hint or "es").lower().strip()
+        return "en" if lang.startswith("en") else "es"
+
+    def tokenizer_for(self, lang_hint: Optional[str] = None):
+        """(tokenizer, presupuesto de subwords) del modelo al que se rutearía lang_hint."""
+        return tokenizer_budget(self._route(lang_hint), self.backend)
+
+    def _cache_key(self, text: str, route: str, backend: Optional[str] = None) -> str:
+        model_id, revision = model_identity(route, backend or self.backend)
+        return SentimentCache.make_key(text, model_id, revision)
 
     def analyze(self, text: str, lang_hint: Optional[str] = None) -> Dict[str, Any]:
         text = (text or "").strip()
         if not text:
-            return {"label": "neutral", "confidence": 0.0, "source": "empty", "details": {}}
+            return self._empty_result()
+
+        if self.tau1 is not None:
+            # La cascada decide por lotes; un texto suelto es un lote de 1
+            return self.analyze_batch([text], [lang_hint])[0]
 
         # 1. Normalización del idioma
-        lang = (lang_hint or "es").lower().strip()
-        
-        # 2. Ruteo (Decision Making)
+        route = self._route(lang_hint)
+
+        # 2. Caché (si ya puntuamos este texto con este modelo)
+        key = None
+        if self.cache is not None:
+            key = self._cache_key(text, route)
+            hit = self.cache.get(key)
+            if hit is not None:
+                return hit
+
+        # 3. Ruteo (Decision Making)
         try:
-            if lang.startswith("en"):
+            if route == "en":
                 # Delegamos al driver de Inglés
-                res = predict_english(text)
-                source_tag = "model_en_specialist"
+                res = predict_english(text, backend=self.backend)
             else:
                 # Delegamos al driver de Español (Default para Ecuador)
-                res = predict_spanish(text)
-                source_tag = "model_es_finetuned"
-                
+                res = predict_spanish(text, backend=self.backend)
+
         except Exception as e:
             print(f"   ❌ Error en SentimentPrecise router: {e}")
-            return {"label": "neutral", "confidence": 0.0, "source": "error", "details": {"err": str(e)}}
+            return self._error_result(e)
+
+        # 4. Empaquetado final
+        out = self._package(res, route)
+        if key is not None:
+            self.cache.put(key, out)
+        return out
+
+    def analyze_batch(
+        self,
+        texts: Sequence[str],
+        lang_hints: Optional[Sequence[Optional[str]]] = None,
+        batch_size: Optional[int] = None,
+        token_ids: Optional[Sequence[Optional[Sequence[int]]]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Versión en lote de analyze().
+        Agrupa los textos por idioma, manda cada grupo al pipeline HF en lotes
+        con padding y devuelve los resultados en el orden de entrada,
+        con el mismo esquema que analyze().
+        token_ids (opcional): ids ya tokenizados para el modelo de la ruta de
+        cada texto (p. ej. del sidecar del chunker); None = tokenizar aquí.
+        """
+        n = len(texts)
+        if lang_hints is None:
+            lang_hints = [None] * n
+        if len(lang_hints) != n:
+            raise ValueError("texts y lang_hints deben tener la misma longitud")
+        if token_ids is not None and len(token_ids) != n:
+            raise ValueError("texts y token_ids deben tener la misma longitud")
 
-        # 3. Empaquetado final
+        bs = batch_size or self.batch_size
+        results: List[Optional[Dict[str, Any]]] = [None] * n
+
+        # 1. Agrupar por ruta (los vacíos se resuelven sin modelo)
+        groups: Dict[str, List[int]] = {"en": [], "es": []}
+        clean: List[str] = [""] * n
+        for i, (text, hint) in enumerate(zip(texts, lang_hints)):
+            clean[i] = (text or "").strip()
+            if not clean[i]:
+                results[i] = self._empty_result()
+            else:
+                groups[self._route(hint)].append(i)
+
+        # 2. Inferencia por grupo homogéneo
+        for route, idxs in groups.items():
+            if not idxs:
+                continue
+            batch = [clean[i] for i in idxs]
+            ids = [token_ids[i] for i in idxs] if token_ids is not None else None
+            if self.tau1 is None:
+                outs = self._score_route(route, batch, self.backend, bs, ids)
+            else:
+                outs = self._cascade(route, batch, bs, ids)
+            for i, res in zip(idxs, outs):
+                results[i] = res
+
+        return results  # type: ignore[return-value]
+
+    def _score_route(
+        self,
+        route: str,
+        texts: List[str],
+        backend: Optional[str],
+        bs: Optional[int],
+        token_ids: Optional[List[Optional[Sequence[int]]]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Puntúa textos ya limpios de una sola ruta con un backend (con caché)."""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+        todo = list(range(len(texts)))
+
+        # Caché: solo se infieren los textos que faltan
+        keys: Dict[int, str] = {}
+        if self.cache is not None:
+            keys = {i: self._cache_key(texts[i], route, backend) for i in todo}
+            hits = self.cache.get_many(keys.values())
+            for i in todo:
+                if keys[i] in hits:
+                    results[i] = hits[keys[i]]
+            todo = [i for i in todo if results[i] is None]
+            if not todo:
+                return results  # type: ignore[return-value]
+
+        drivers = {"en": predict_english_batch, "es": predict_spanish_batch}
+        try:
+            ids = [token_ids[i] for i in todo] if token_ids is not None else None
+            outs = drivers[route]([texts[i] for i in todo], batch_size=bs, backend=backend, token_ids=ids)
+        except Exception as e:
+            print(f"   ❌ Error en SentimentPrecise router (batch {route}): {e}")
+            for i in todo:
+                results[i] = self._error_result(e)
+            return results  # type: ignore[return-value]
+
+        fresh: Dict[str, Dict[str, Any]] = {}
+        for i, res in zip(todo, outs):
+            results[i] = self._package(res, route)
+            if keys:
+                fresh[keys[i]] = results[i]
+        if fresh:
+            self.cache.put_many(fresh)
+        return results  # type: ignore[return-value]
+
+    # ---------------------------------------------------------
+    # Cascada m1 (barato) → m2 (completo)
+    # ---------------------------------------------------------
+    def _cascade(self, route: str, texts: List[str], bs: Optional[int],
+                 token_ids: Optional[List[Optional[Sequence[int]]]] = None) -> List[Dict[str, Any]]:
+        if route in self._m1_down or not pipe_available(route, self.cascade_backend):
+            if route not in self._m1_down:
+                self._m1_down.add(route)
+                print(f"   ⚠️ [SentimentPrecise] m1 ({self.cascade_backend}) no disponible para '{route}': "
+                      f"se puntúa sin cascada.")
+            return self._score_route(route, texts, self.backend, bs, token_ids)
+
+        # m1 y m2 son el mismo modelo base: comparten tokenizer y, por lo tanto, token_ids
+        first = self._score_route(route, texts, self.cascade_backend, bs, token_ids)
+        results: List[Dict[str, Any]] = []
+        escalate: List[int] = []
+        for i, r1 in enumerate(first):
+            if r1["source"] == "error" or r1["confidence"] < self.tau1:
+                escalate.append(i)
+                results.append(r1)
+            else:
+                results.append({**r1, "source": "m1_high_conf"})
+        if not escalate:
+            return results
+
+        second = self._score_route(route, [texts[i] for i in escalate], self.backend, bs,
+                                   [token_ids[i] for i in escalate] if token_ids is not None else None)
+        for i, r2 in zip(escalate, second):
+            r1 = first[i]
+            if r2["source"] == "error":
+                # m2 no disponible: nos quedamos con m1 (si es que respondió)
+                if r1["source"] != "error":
+                    results[i] = {**r1, "source": "m1_only_m2_error",
+                                  "details": {**r1["details"], "m2_error": r2["details"].get("err")}}
+                continue
+            if r1["source"] != "error" and r1["label"] == r2["label"]:
+                source = "m1_m2_consensus"
+            elif r2["confidence"] >= self.tau2:
+                source = "m2_override"
+            else:
+                source = "m2_low_conf"
+            results[i] = {
+                **r2,
+                "source": source,
+                "details": {**r2["details"], "m1": {"label": r1["label"], "confidence": r1["confidence"]}},
+            }
+        return results
+
+    # ---------------------------------------------------------
+    # Empaquetado
+    # ---------------------------------------------------------
+    def _package(self, res: Dict[str, Any], route: str) -> Dict[str, Any]:
+        source_tag = "model_en_specialist" if route == "en" else "model_es_finetuned"
         return {
             "label": self._normalize_label(res["label"]),
             "confidence": res["confidence"],
@@ -44,9 +253,17 @@ class SentimentPrecise:
             "details": res  # Guardamos toda la metadata técnica (probs, modelo usado)
         }
 
+    @staticmethod
+    def _empty_result() -> Dict[str, Any]:
+        return {"label": "neutral", "confidence": 0.0, "source": "empty", "details": {}}
+
+    @staticmethod
+    def _error_result(e: Exception) -> Dict[str, Any]:
+        return {"label": "neutral", "confidence": 0.0, "source": "error", "details": {"err": str(e)}}
+
     @staticmethod
     def _normalize_label(label: str) -> str:
         t = label.strip().lower()
         if t in ("positive", "pos", "label_2"): return "positive"
         if t in ("negative", "neg", "label_0"): return "negative"
-        return "neutral"
\ No newline at end of file
+        return "neutral"
@@ -0,0 +1,180 @@
+# src/agents/sentiment/sentiment_progress.py
+"""
+Puntuación priorizada y progresiva.
+- Orden de prioridad de los posts (engagement, recencia o un campo/función propia)
+  para que los de más señal se puntúen primero.
+- Agregados parciales publicados tras cada lote en <salida>_partial.json, para que
+  el dashboard y el Agente SR arranquen con el top N% mientras se puntúa la cola.
+"""
+from __future__ import annotations
+import json
+import math
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from src.agents.sentiment.sentiment_checkpoint import iter_jsonl_starts
+
+LABELS = ("negative", "neutral", "positive")
+
+PriorityFn = Callable[[Dict[str, Any]], float]
+
+# ---------------------------------------------------------
+# CLAVES DE PRIORIDAD
+# ---------------------------------------------------------
+def _num(v: Any) -> float:
+    try:
+        x = float(v)
+    except (TypeError, ValueError):
+        return 0.0
+    return x if math.isfinite(x) else 0.0
+
+def _epoch(v: Any) -> float:
+    """created_utc (epoch) o ISO-8601; 0 si no se entiende."""
+    if isinstance(v, str) and v and not v.replace(".", "", 1).isdigit():
+        try:
+            return datetime.fromisoformat(v.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return 0.0
+    return _num(v)
+
+def engagement(obj: Dict[str, Any]) -> float:
+    # log1p: un post viral no aplasta al resto; los comentarios pesan el doble que los votos
+    return math.log1p(max(0.0, _num(obj.get("score")))) + 2 * math.log1p(max(0.0, _num(obj.get("num_comments"))))
+
+def recency(obj: Dict[str, Any]) -> float:
+    return _epoch(obj.get("timestamp"))
+
+def _field(name: str) -> PriorityFn:
+    return lambda obj: _num(obj.get(name))
+
+PRIORITY_MODES = ("none", "engagement", "recency", "field:<campo>")
+
+def priority_key(mode: Union[str, PriorityFn, None]) -> Optional[PriorityFn]:
+    """
+    "none" (orden del archivo) → None; "engagement" | "recency" | "field:<campo>"
+    → función obj → float (mayor = antes). También acepta directamente una función.
+    """
+    if callable(mode):
+        return mode
+    mode = (mode or "none").strip()
+    if mode.lower() in ("", "none", "0"):
+        return None
+    if mode.lower() == "engagement":
+        return engagement
+    if mode.lower() == "recency":
+        return recency
+    if mode.startswith("field:") and mode[6:]:
+        return _field(mode[6:])
+    raise ValueError(f"Prioridad desconocida: {mode!r}. Opciones: {', '.join(PRIORITY_MODES)}")
+
+# ---------------------------------------------------------
+# LECTURA EN ORDEN DE PRIORIDAD
+# ---------------------------------------------------------
+def prioritized_rows(path: str, key: PriorityFn) -> Tuple[int, Iterator[Dict[str, Any]]]:
+    """
+    Primera pasada: solo (prioridad, offset) por post, sin guardar textos.
+    Devuelve el total de posts y un iterador que relee cada uno con seek en
+    orden de prioridad descendente. Empates: orden original del archivo.
+    """
+    index = [(-key(obj), start) for start, obj in iter_jsonl_starts(path)]
+    index.sort()
+
+    def _rows() -> Iterator[Dict[str, Any]]:
+        with open(path, "rb") as f:
+            for _, start in index:
+                f.seek(start)
+                yield json.loads(f.readline())
+
+    return len(index), _rows()
+
+# ---------------------------------------------------------
+# AGREGADOS PARCIALES
+# ---------------------------------------------------------
+def partial_path(output_path: str) -> str:
+    return output_path.replace(".jsonl", "_partial.json")
+
+class PartialAggregate:
+    """
+    Resumen incremental de la salida ya confirmada: distribución de etiquetas,
+    confianza media, polaridad y avance. publish() reemplaza el JSON atómicamente,
+    así los lectores nunca ven uno a medias.
+    """
+
+    def __init__(self, output_path: str, *, priority: str = "none", total: Optional[int] = None,
+                 input_path: Optional[str] = None):
+        self.path = partial_path(output_path)
+        self.output_path = output_path
+        self.priority = priority
+        self.total = total
+        self._input_size = os.path.getsize(input_path) if input_path and os.path.exists(input_path) else 0
+        self.labels: Counter = Counter()
+        self.conf_sum = 0.0
+        self.processed = 0
+        self.threshold: Optional[float] = None
+        self.input_offset = 0
+        self.batches = 0
+        self._t0 = time.time()
+
+    def update(self, records: Iterable[Dict[str, Any]], *, threshold: Optional[float] = None,
+               input_offset: Optional[int] = None) -> None:
+        for r in records:
+            s = r.get("sentiment") or {}
+            self.labels[s.get("label", "neutral")] += 1
+            self.conf_sum += _num(s.get("confidence"))
+            self.processed += 1
+        if threshold is not None:
+            self.threshold = threshold
+        if input_offset is not None:
+            self.input_offset = input_offset
+
+    def load_existing(self) -> None:
+        """Al reanudar: cuenta lo que ya está en la salida."""
+        if os.path.exists(self.output_path):
+            self.update(obj for _, obj in iter_jsonl_starts(self.output_path))
+
+    def summary(self, complete: bool = False) -> Dict[str, Any]:
+        n = self.processed
+        if self.total:
+            fraction = n / self.total
+        elif self._input_size:
+            fraction = self.input_offset / self._input_size
+        else:
+            fraction = 0.0
+        return {
+            "output": os.path.basename(self.output_path),
+            "priority": self.priority,
+            "processed": n,
+            "total": self.total,
+            "fraction": round(1.0 if complete else min(1.0, fraction), 4),
+            # todo post con prioridad >= threshold ya está puntuado (modo priorizado)
+            "priority_threshold": self.threshold,
+            "labels": {l: self.labels.get(l, 0) for l in LABELS},
+            "label_share": {l: round(self.labels.get(l, 0) / n, 4) if n else 0.0 for l in LABELS},
+            "mean_confidence": round(self.conf_sum / n, 4) if n else 0.0,
+            "polarity": round((self.labels.get("positive", 0) - self.labels.get("negative", 0)) / n, 4) if n else 0.0,
+            "batches": self.batches,
+            "elapsed_s": round(time.time() - self._t0, 1),
+            "complete": complete,
+            "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+    def publish(self, complete: bool = False) -> Dict[str, Any]:
+        if not complete:
+            self.batches += 1
+        data = self.summary(complete)
+        tmp = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+        return data
+
+def load_partial(output_path: str) -> Optional[Dict[str, Any]]:
+    """Resumen parcial de una salida de sentimiento (None si no hay)."""
+    try:
+        with open(partial_path(output_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -6,6 +6,8 @@ import os
 from collections import Counter
 from typing import Dict, Any, List
 
+from .sentiment_sampling import estimate_label_distribution, is_sampled
+
 # ---------- Helpers de lectura ----------
 
 def read_posts_jsonl(path: str) -> List[Dict[str, Any]]:
@@ -35,8 +37,9 @@ def build_report(posts: List[Dict[str, Any]]) -> Dict[str, Any]:
         "chunks": int,
         "valid_chunks": int,
         "lang_counts": {lang: count},
-        "route_counts": {source: count},   # p.ej. m1_high_conf, m1_m2_consensus, gpt_fallback
-        "decider": {...}
+        "route_counts": {source: count},   # p.ej. m1_high_conf, m1_m2_consensus, m2_override
+        "decider": {...},
+        "sample": {"stratum", "stratum_size", ...}   # opcional, modo muestreo
       }
     """
     total_posts = len(posts)
@@ -110,6 +113,11 @@ def build_report(posts: List[Dict[str, Any]]) -> Dict[str, Any]:
             ],
         },
     }
+    # Modo muestreo: label_distribution cuenta solo la muestra; la estimación
+    # estratificada para todo el corpus va con su intervalo de confianza
+    if is_sampled(posts):
+        report["kpis"]["label_distribution_estimate"] = estimate_label_distribution(posts)
+
     return report
 
 # ---------- Exports opcionales a disco (para debug / offline) ----------
@@ -127,6 +135,14 @@ def export_report_files(report: Dict[str, Any], out_dir: str) -> None:
         for lbl, cnt in report["kpis"]["label_distribution"].items():
             f.write(f"{lbl},{cnt}\n")
 
+    # Distribución estimada (modo muestreo)
+    estimate = report["kpis"].get("label_distribution_estimate")
+    if estimate:
+        with open(os.path.join(out_dir, "label_distribution_estimate.csv"), "w", encoding="utf-8") as f:
+            f.write("label,share,ci_low,ci_high,count_est\n")
+            for lbl, v in estimate["labels"].items():
+                f.write(f"{lbl},{v['share']},{v['ci_low']},{v['ci_high']},{v['count_est']}\n")
+
     # Lenguajes
     with open(os.path.join(out_dir, "lang_counts.csv"), "w", encoding="utf-8") as f:
         f.write("lang,count\n")
@@ -1,29 +1,29 @@
 # src/agents/sentiment/sentiment_runner.py
 from __future__ import annotations
 import argparse
+import glob
 import json
 import os
+import re
+import shutil
 import sys
+import time
 import traceback
-from typing import Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+from typing import Dict, Any, List, Iterable, Tuple
 
 from dotenv import load_dotenv
 load_dotenv()
 
 from .sentiment_precise import SentimentPrecise
+from .sentiment_hf import padding_report
+from .sentiment_checkpoint import CheckpointedWriter, DEFAULT_CHECKPOINT_EVERY, iter_jsonl_offsets
+from .sentiment_tokens import TokenStore, route_for
 
-
-def _open_jsonl(path: str):
-    """Generador que lee un JSONL y devuelve un dict por línea válida."""
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                yield json.loads(line)
-            except Exception:
-                continue
+DEFAULT_BATCH_SIZE = 64  # chunks por llamada a analyze_batch
+# Usa el sidecar de token ids del chunker (<chunks>.tokens.*) si existe
+TOKEN_STORE = os.getenv("SENTIMENT_TOKEN_STORE", "1").lower() not in ("0", "false", "no")
 
 
 def _ensure_dir(p: str):
@@ -31,16 +31,21 @@ def _ensure_dir(p: str):
     os.makedirs(d, exist_ok=True)
 
 
-def analyze_chunk(chunk: Dict[str, Any], sp: SentimentPrecise) -> Dict[str, Any]:
-    """
-    Aplica la cascada de sentimiento a un chunk.
-    """
+def _chunk_text_lang(chunk: Dict[str, Any]):
     text = (
         chunk.get("text_norm") or
         chunk.get("text")
-    )       
+    )
     # Intentamos sacar el idioma del chunk, si no existe, pasamos None
     lang = chunk.get("lang") or (chunk.get("meta") or {}).get("lang")
+    return text, lang
+
+
+def analyze_chunk(chunk: Dict[str, Any], sp: SentimentPrecise) -> Dict[str, Any]:
+    """
+    Aplica la cascada de sentimiento a un chunk.
+    """
+    text, lang = _chunk_text_lang(chunk)
 
     sentiment_res = sp.analyze(text, lang_hint=lang)
 
@@ -52,48 +57,286 @@ def analyze_chunk(chunk: Dict[str, Any], sp: SentimentPrecise) -> Dict[str, Any]
     return out
 
 
+def _error_record(chunk: Dict[str, Any], e: Exception) -> Dict[str, Any]:
+    return {
+        "chunk_id": chunk.get("chunk_id"),
+        "error": f"{type(e).__name__}: {e}"
+    }
+
+
+def analyze_chunks(chunks: List[Dict[str, Any]], sp: SentimentPrecise,
+                   token_ids: List[Any] | None = None) -> List[Dict[str, Any]]:
+    """
+    Versión en lote de analyze_chunk (un solo analyze_batch para todo el lote).
+    Si el lote falla se reintenta chunk a chunk para aislar el registro con error.
+    token_ids: ids pre-tokenizados por chunk (del TokenStore), None donde no haya.
+    """
+    try:
+        pairs = [_chunk_text_lang(c) for c in chunks]
+        extra = {"token_ids": token_ids} if token_ids is not None else {}
+        results = sp.analyze_batch([t for t, _ in pairs], [l for _, l in pairs], **extra)
+        return [{**c, "sentiment": r} for c, r in zip(chunks, results)]
+    except Exception:
+        out = []
+        for c in chunks:
+            try:
+                out.append(analyze_chunk(c, sp))
+            except Exception as e:
+                print(f"\n❌ ERROR en chunk {c.get('chunk_id')}: {e}")
+                traceback.print_exc()
+                out.append(_error_record(c, e))
+        return out
+
+
+def _batched(rows: Iterable[Dict[str, Any]], size: int) -> Iterable[List[Dict[str, Any]]]:
+    buf: List[Dict[str, Any]] = []
+    for r in rows:
+        buf.append(r)
+        if len(buf) >= size:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+def _stored_ids(store: TokenStore, batch: List[Tuple[int, Dict[str, Any]]]) -> List[Any]:
+    """Ids del sidecar por chunk del lote (clave: offset de fin de línea en el JSONL)."""
+    out = []
+    for end, c in batch:
+        # el sidecar tokeniza "text"; si el chunk trae text_norm se tokeniza en línea
+        ids = None if c.get("text_norm") else store.get(end, route_for(_chunk_text_lang(c)[1]))
+        out.append(ids)
+    return out
+
+
+def _score_stream(rows: Iterable[Tuple[int, Dict[str, Any]]], sp: SentimentPrecise,
+                  writer: CheckpointedWriter, batch_size: int, batch_log: int,
+                  tag: str = "", store: TokenStore | None = None) -> Dict[str, int]:
+    """
+    Lee (offset, chunk) → puntúa en lotes → escribe en segmentos con checkpoint.
+    Si se interrumpe, lo ya puntuado queda confirmado para --resume.
+    Con store los chunks pre-tokenizados no pasan por el tokenizer.
+    Devuelve contadores (solo de esta corrida, más los reanudados).
+    """
+    total = 0
+    written = 0
+    resumed = writer.written
+    next_log = max(1, batch_log)
+    finished = False
+    try:
+        for batch in _batched(writer.pending(rows), max(1, batch_size)):
+            total += len(batch)
+            ids = _stored_ids(store, batch) if store is not None else None
+            recs = analyze_chunks([c for _, c in batch], sp, ids)
+            writer.write(recs, batch[-1][0])
+            written += sum(1 for rec in recs if "error" not in rec)
+            if written >= next_log:
+                print(f"… {tag}escritos {written} / leídos {total}")
+                next_log = (written // max(1, batch_log) + 1) * max(1, batch_log)
+        finished = True
+    finally:
+        writer.close(finished)
+    return {"read": total, "written": written, "resumed": resumed}
+
+
+# ---------------------------------------------------------------------
+# MODO MULTI-PROCESO (--workers N)
+# ---------------------------------------------------------------------
+def _shard_ranges(path: str, n: int) -> List[Tuple[int, int]]:
+    """Parte el archivo en n rangos de bytes alineados a saltos de línea."""
+    size = os.path.getsize(path)
+    cuts = [0]
+    with open(path, "rb") as f:
+        for k in range(1, n):
+            pos = max(cuts[-1], size * k // n)
+            f.seek(pos)
+            if pos > 0:
+                f.readline()  # avanzar al inicio de la siguiente línea
+            cuts.append(max(cuts[-1], f.tell()))
+    cuts.append(size)
+    return [(cuts[i], cuts[i + 1]) for i in range(n) if cuts[i] < cuts[i + 1]]
+
+
+def _manifest_path(out: str) -> str:
+    return out + ".shards.json"
+
+
+def _shard_layout(inp: str, out: str, workers: int, resume: bool) -> Tuple[List[Tuple[int, int]], bool]:
+    """
+    Rangos de los shards y si sus partes se pueden reanudar.
+    El reparto se guarda en <out>.shards.json: al reanudar se reutiliza aunque
+    cambie --workers, porque cada parte solo es válida para su propio rango.
+    """
+    path = _manifest_path(out)
+    ident = {"input": os.path.abspath(inp), "input_bytes": os.path.getsize(inp)}
+    if resume:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+        if manifest and all(manifest.get(k) == v for k, v in ident.items()):
+            ranges = [(int(s), int(e)) for s, e in manifest["ranges"]]
+            if len(ranges) != workers:
+                print(f"   ♻️ Reanudando con el reparto original: {len(ranges)} shards (se ignora --workers {workers})")
+            return ranges, True
+        print("   ⚠️ Sin reparto de shards válido para reanudar: se puntúa desde cero.")
+    ranges = _shard_ranges(inp, workers)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({**ident, "ranges": ranges}, f)
+    os.replace(tmp, path)
+    return ranges, False
+
+
+def _drop_stale_parts(out: str, keep: Iterable[str] = ()) -> None:
+    """Borra las partes (y sus checkpoints) de otros repartos de <out>."""
+    keep = set(keep)
+    for path in glob.glob(glob.escape(out) + ".part*"):
+        # <out>.partNNN, <out>.partNNN.ckpt, <out>.partNNN.ckpt.tmp
+        m = re.match(r"(.*\.part\d+)", path)
+        if m and m.group(1) not in keep:
+            os.remove(path)
+
+
+def _worker_init(threads: int):
+    # Cada worker usa su parte de los núcleos para no sobre-suscribir la CPU
+    import torch
+    torch.set_num_threads(max(1, threads))
+
+
+def _worker(job: Dict[str, Any]) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    sp = SentimentPrecise(
+        backend=job.get("backend"),
+        tau1=job.get("tau1"), tau2=job.get("tau2"),
+        cascade_backend=job.get("cascade_backend"),
+    )
+    t_load = time.perf_counter() - t0
+    writer = CheckpointedWriter(
+        job["part"], job["inp"],
+        resume=job["resume"], start=job["start"], end=job["end"],
+        every=job["checkpoint_every"],
+    )
+    stats = _score_stream(
+        iter_jsonl_offsets(job["inp"], writer.offset, job["end"]),
+        sp,
+        writer,
+        job["batch_size"],
+        job["batch_log"],
+        tag=f"[w{job['worker']}] ",
+        store=TokenStore.open(job["inp"]) if job.get("token_store") else None,
+    )
+    elapsed = time.perf_counter() - t0
+    return {
+        "worker": job["worker"],
+        **stats,
+        "load_s": round(t_load, 2),
+        "elapsed_s": round(elapsed, 2),
+        "chunks_per_s": round(stats["read"] / max(1e-9, elapsed - t_load), 2),
+        "padding": padding_report(),
+    }
+
+
+def _run_parallel(inp: str, out: str, workers: int, batch_size: int,
+                  batch_log: int, backend: str | None,
+                  cascade: Dict[str, Any] | None = None,
+                  resume: bool = False,
+                  checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+                  token_store: bool = TOKEN_STORE) -> Dict[str, Any]:
+    ranges, reusable = _shard_layout(inp, out, workers, resume)
+    threads = max(1, (os.cpu_count() or 1) // max(1, len(ranges)))
+    jobs = [
+        {
+            "worker": i, "inp": inp, "start": s, "end": e,
+            "part": f"{out}.part{i:03d}", "batch_size": batch_size,
+            "batch_log": batch_log, "backend": backend,
+            "resume": resume and reusable, "checkpoint_every": checkpoint_every,
+            "token_store": token_store,
+            **(cascade or {}),
+        }
+        for i, (s, e) in enumerate(ranges)
+    ]
+    _drop_stale_parts(out, (job["part"] for job in jobs))
+    print(f"🧵 Runner paralelo: {len(jobs)} workers × {threads} hilos torch")
+
+    t0 = time.perf_counter()
+    ctx = mp.get_context("spawn")  # fork + torch/tokenizers no es seguro
+    with ProcessPoolExecutor(max_workers=len(jobs), mp_context=ctx,
+                             initializer=_worker_init, initargs=(threads,)) as ex:
+        per_worker = list(ex.map(_worker, jobs))
+
+    # Merge en orden de entrada (los shards son rangos contiguos).
+    # Las partes se borran solo tras el merge completo: si muere aquí, --resume
+    # las reutiliza tal cual (cada una con su propio checkpoint).
+    tmp_out = out + ".merge"
+    with open(tmp_out, "wb") as w:
+        for job in jobs:
+            with open(job["part"], "rb") as part:
+                shutil.copyfileobj(part, w)
+    os.replace(tmp_out, out)
+    for job in jobs:
+        os.remove(job["part"])
+    os.remove(_manifest_path(out))
+    elapsed = time.perf_counter() - t0
+
+    read = sum(s["read"] for s in per_worker)
+    for s in per_worker:
+        print(f"   [w{s['worker']}] leídos={s['read']} escritos={s['written']} "
+              f"carga={s['load_s']}s → {s['chunks_per_s']} chunks/s "
+              f"padding={s['padding']['padding_efficiency']}")
+    print(f"   Total: {read} chunks en {elapsed:.1f}s → {read / max(1e-9, elapsed):.1f} chunks/s")
+    return {
+        "read": read,
+        "written": sum(s["written"] for s in per_worker),
+        "resumed": sum(s["resumed"] for s in per_worker),
+        "workers": per_worker,
+    }
+
+
 def main():
     ap = argparse.ArgumentParser(description="Runner de análisis de sentimiento.")
     ap.add_argument("--in", dest="inp", required=True)
     ap.add_argument("--out", dest="out", required=True)
-    ap.add_argument("--tau1", type=float, default=None) # Mantenido por compatibilidad
-    ap.add_argument("--tau2", type=float, default=None) # Mantenido por compatibilidad
+    ap.add_argument("--tau1", type=float, default=None,
+                    help="Activa la cascada: chunks con confianza m1 < tau1 escalan al modelo completo")
+    ap.add_argument("--tau2", type=float, default=None,
+                    help="Confianza mínima de m2 para imponerse a m1 si discrepan (default: tau1)")
+    ap.add_argument("--cascade_backend", default=None,
+                    help="Backend de la etapa barata de la cascada (default: onnx-int8)")
     ap.add_argument("--batch_log", type=int, default=200)
+    ap.add_argument("--batch_size", type=int, default=DEFAULT_BATCH_SIZE)
+    ap.add_argument("--workers", type=int, default=1, help="Procesos en paralelo (cada uno carga su modelo)")
+    ap.add_argument("--backend", default=None, help="torch | torch-mmap | torch-bf16 | torch-int8 | onnx | onnx-int8 | student (default: SENTIMENT_BACKEND)")
+    ap.add_argument("--resume", action="store_true",
+                    help="Reanuda desde el último checkpoint y salta los chunk_id ya escritos")
+    ap.add_argument("--checkpoint_every", type=int, default=DEFAULT_CHECKPOINT_EVERY,
+                    help="Registros por segmento confirmado (fsync + checkpoint)")
+    ap.add_argument("--server", default=os.getenv("SENTIMENT_SERVER_URL"),
+                    help="URL del servidor de sentimiento (no carga modelos en este proceso)")
+    ap.add_argument("--no_token_store", action="store_true",
+                    help="Ignora el sidecar de token ids del chunker y tokeniza en línea")
     args = ap.parse_args()
 
     if not os.path.exists(args.inp):
         print(f"Error: no existe {args.inp}", file=sys.stderr)
         sys.exit(1)
 
-    _ensure_dir(args.out)
-
-    sp = SentimentPrecise() # Ya no necesita taus, es determinista
-
-    total = 0
-    written = 0
-    
     print(f"🚀 Iniciando Runner desde CLI. Leyendo: {args.inp}")
-
-    with open(args.out, "w", encoding="utf-8") as w:
-        for chunk in _open_jsonl(args.inp):
-            total += 1
-            try:
-                rec = analyze_chunk(chunk, sp)
-                w.write(json.dumps(rec, ensure_ascii=False) + "\n")
-                written += 1
-            except Exception as e:
-                print(f"\n❌ ERROR en chunk {chunk.get('chunk_id')}: {e}")
-                traceback.print_exc()
-                
-                # Registrar error en archivo
-                w.write(json.dumps({
-                    "chunk_id": chunk.get("chunk_id"), 
-                    "error": str(e)
-                }, ensure_ascii=False) + "\n")
-
-            if written % max(1, args.batch_log) == 0:
-                print(f"… escritos {written} / leídos {total}")
-
+    run_sentiment_pipeline(
+        args.inp, args.out,
+        tau1=args.tau1,
+        tau2=args.tau2,
+        batch_log=args.batch_log,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        backend=args.backend,
+        server_url=args.server,
+        cascade_backend=args.cascade_backend,
+        resume=args.resume,
+        checkpoint_every=args.checkpoint_every,
+        token_store=TOKEN_STORE and not args.no_token_store,
+    )
     print(f"✅ Finalizado CLI → {args.out}")
 
 
@@ -106,44 +349,56 @@ def run_sentiment_pipeline(
     tau1: float | None = None,
     tau2: float | None = None,
     batch_log: int = 200,
-) -> Dict[str, int]:
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers: int = 1,
+    backend: str | None = None,
+    server_url: str | None = None,
+    cascade_backend: str | None = None,
+    resume: bool = False,
+    checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+    token_store: bool = TOKEN_STORE,
+) -> Dict[str, Any]:
     """
     Wrapper programático del runner, para usarlo desde tests o scripts.
+    Con workers > 1 reparte el JSONL en shards contiguos entre procesos
+    y une los resultados en el orden de entrada.
+    Con server_url delega la inferencia al servidor local de sentimiento.
+    Con tau1 usa la cascada m1 (barato) → m2 (completo) de SentimentPrecise.
+    La salida se confirma en segmentos con checkpoint (<out>.ckpt); con
+    resume=True se continúa desde ahí sin repetir los chunk_id ya escritos
+    (en paralelo, con el mismo reparto de shards de <out>.shards.json).
+    Con token_store y un sidecar <inp>.tokens.* (chunk_file(token_store=True))
+    los chunks entran al modelo como ids, sin re-tokenizar.
     """
     if not os.path.exists(inp):
         raise FileNotFoundError(f"No existe el archivo de chunks: {inp}")
 
     _ensure_dir(out)
-    
-    # Inicializamos la clase 'SentimentPrecise'
-    sp = SentimentPrecise()
 
-    total = 0
-    written = 0
+    cascade = {"tau1": tau1, "tau2": tau2, "cascade_backend": cascade_backend}
+    # una corrida paralela interrumpida se reanuda con su mismo reparto
+    if not server_url and (workers > 1 or (resume and os.path.exists(_manifest_path(out)))):
+        return _run_parallel(inp, out, workers, batch_size, batch_log, backend, cascade,
+                             resume, checkpoint_every, token_store)
 
-    with open(out, "w", encoding="utf-8") as w:
-        for chunk in _open_jsonl(inp):
-            total += 1
-            try:
-                rec = analyze_chunk(chunk, sp)
-                w.write(json.dumps(rec, ensure_ascii=False) + "\n")
-                written += 1
-            except Exception as e:
-                # --- DEBUG PRINT ---
-                print(f"\n❌ ERROR CRÍTICO durante el test en chunk {total}:")
-                print(f"   Mensaje: {e}")
-                traceback.print_exc()
-                # -------------------
-                
-                w.write(json.dumps({
-                    "chunk_id": chunk.get("chunk_id"),
-                    "error": f"{type(e).__name__}: {e}"
-                }, ensure_ascii=False) + "\n")
-            
-            if written % max(1, batch_log) == 0:
-                print(f"… escritos {written} / leídos {total}")
-
-    return {"read": total, "written": written}
+    if server_url:
+        from .sentiment_server import SentimentClient
+        sp = SentimentClient(server_url)
+    else:
+        # Inicializamos la clase 'SentimentPrecise'
+        sp = SentimentPrecise(backend=backend, **cascade)
+    # el cliente del servidor no acepta ids: ahí se tokeniza del lado del servidor
+    store = TokenStore.open(inp) if token_store and not server_url else None
+    _drop_stale_parts(out)
+    if os.path.exists(_manifest_path(out)):
+        os.remove(_manifest_path(out))
+    writer = CheckpointedWriter(out, inp, resume=resume, every=checkpoint_every)
+    stats = _score_stream(iter_jsonl_offsets(inp, writer.offset), sp, writer, batch_size, batch_log,
+                          store=store)
+    if not server_url:
+        stats["padding"] = padding_report()
+        print(f"   Padding: {stats['padding']}")
+    return stats
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,242 @@
+# src/agents/sentiment/sentiment_sampling.py
+"""
+Modo muestreo para corpus enormes.
+Estratifica los posts por subreddit × idioma × ventana de tiempo (los estratos
+demasiado chicos para el presupuesto se fusionan en otros más gruesos), puntúa
+solo una muestra del tamaño justo para un margen de error objetivo y estima la
+distribución de etiquetas con intervalos de confianza (estimador estratificado
+con corrección por población finita). El resto se puede puntuar después
+("fill"): con todos los estratos completos el intervalo colapsa al valor exacto.
+"""
+from __future__ import annotations
+import json
+import math
+import random
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from statistics import NormalDist
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.agents.sentiment.sentiment_checkpoint import iter_jsonl_starts
+
+LABELS = ("negative", "neutral", "positive")
+TIME_BUCKETS = ("day", "week", "month")
+MIN_PER_STRATUM = 2  # con 2 ya se puede estimar la varianza del estrato
+
+# ---------------------------------------------------------
+# ESTRATOS
+# ---------------------------------------------------------
+def _time_bucket(ts: Any, bucket: str) -> str:
+    try:
+        if isinstance(ts, str) and ts and not ts.replace(".", "", 1).isdigit():
+            dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+        else:
+            dt = datetime.fromtimestamp(float(ts), tz=timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return "unknown"
+    if bucket == "day":
+        return dt.strftime("%Y-%m-%d")
+    if bucket == "month":
+        return dt.strftime("%Y-%m")
+    year, week, _ = dt.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def stratum_of(obj: Dict[str, Any], bucket: str = "week") -> str:
+    sub = obj.get("subreddit") or (obj.get("metadata") or {}).get("subreddit") or obj.get("channel") or "unknown"
+    lang = obj.get("lang") or "unknown"
+    return f"{sub}|{lang}|{_time_bucket(obj.get('timestamp'), bucket)}"
+
+# ---------------------------------------------------------
+# TAMAÑO DE MUESTRA
+# ---------------------------------------------------------
+def _z(confidence: float) -> float:
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+def sample_size(population: int, margin: float, confidence: float = 0.95, p: float = 0.5) -> int:
+    """n para estimar una proporción con ±margin (peor caso p=0.5) y corrección finita."""
+    if population <= 0:
+        return 0
+    n0 = _z(confidence) ** 2 * p * (1 - p) / margin ** 2
+    return min(population, math.ceil(n0 / (1 + (n0 - 1) / population)))
+
+def allocate(sizes: Dict[str, int], n: int) -> Dict[str, int]:
+    """
+    Asignación proporcional de exactamente min(n, N) posts por resto mayor:
+    cada estrato recibe floor(n·N_h/N) y las unidades sobrantes van a los de
+    mayor parte fraccional (el cupo nunca pasa el tamaño del estrato).
+    """
+    total = sum(sizes.values())
+    if not total:
+        return {}
+    n = min(n, total)
+    quota = {h: n * N_h / total for h, N_h in sizes.items()}
+    alloc = {h: int(q) for h, q in quota.items()}
+    left = n - sum(alloc.values())
+    for h in sorted(sizes, key=lambda h: (alloc[h] - quota[h], h))[:left]:
+        alloc[h] += 1
+    return alloc
+
+# Niveles de agregación de un estrato sub|lang|tiempo que no alcanza
+# MIN_PER_STRATUM: primero se junta el tiempo, luego el subreddit, luego todo
+_COARSER = (
+    lambda sub, lang, t: f"{sub}|{lang}|*",
+    lambda sub, lang, t: f"*|{lang}|*",
+    lambda sub, lang, t: "*|*|*",
+)
+
+def collapse_strata(by_stratum: Dict[str, List[Any]], n: int) -> Dict[str, List[Any]]:
+    """
+    Fusiona los estratos cuyo cupo proporcional (n·N_h/N) no llega a
+    MIN_PER_STRATUM en estratos más gruesos, para que el presupuesto n alcance
+    a estimar la varianza de cada estrato sin inflar la muestra.
+    """
+    total = sum(len(v) for v in by_stratum.values())
+    if not total:
+        return dict(by_stratum)
+    strata = dict(by_stratum)
+    for coarser in _COARSER:
+        merged: Dict[str, List[Any]] = defaultdict(list)
+        for h, rows in strata.items():
+            if n * len(rows) / total < MIN_PER_STRATUM:
+                h = coarser(*h.split("|", 2))
+            merged[h].extend(rows)
+        strata = dict(merged)
+    return strata
+
+def planned_margin(sizes: Dict[str, int], alloc: Dict[str, int], confidence: float = 0.95) -> float:
+    """Margen (peor caso p=0.5) del estimador estratificado con esta asignación."""
+    total = sum(sizes.values())
+    var = 0.0
+    for h, N_h in sizes.items():
+        n_h = alloc.get(h, 0)
+        if n_h <= 0:
+            continue
+        w = N_h / total
+        var += w * w * max(0.0, 1 - n_h / N_h) * 0.25 / n_h
+    return _z(confidence) * math.sqrt(var)
+
+# ---------------------------------------------------------
+# PLAN DE MUESTREO
+# ---------------------------------------------------------
+class SamplePlan:
+    """
+    Índice (estrato, offset) del JSONL de entrada y la muestra elegida.
+    rows() relee solo los posts de la muestra; remaining() el resto.
+    Con la misma semilla y la misma entrada el plan es reproducible.
+    """
+
+    def __init__(self, path: str, margin: float, *, confidence: float = 0.95, bucket: str = "week",
+                 seed: int = 13, key: Optional[Callable[[Dict[str, Any]], float]] = None):
+        self.path = path
+        self.margin = margin
+        self.confidence = confidence
+        self.bucket = bucket
+
+        rows_by: Dict[str, List[Tuple[float, int]]] = defaultdict(list)
+        for start, obj in iter_jsonl_starts(path):
+            rows_by[stratum_of(obj, bucket)].append((-key(obj) if key else 0.0, start))
+        self.population = sum(len(v) for v in rows_by.values())
+        self.target = sample_size(self.population, margin, confidence)
+        by_stratum = collapse_strata(rows_by, self.target)
+        self.sizes = {h: len(v) for h, v in by_stratum.items()}
+        alloc = allocate(self.sizes, self.target)
+        self.planned_margin = planned_margin(self.sizes, alloc, confidence)
+
+        rng = random.Random(seed)
+        chosen: List[Tuple[float, int]] = []
+        self._stratum: Dict[int, str] = {}
+        for h in sorted(by_stratum):
+            rows = by_stratum[h]
+            for prio, start in rng.sample(rows, alloc[h]):
+                chosen.append((prio, start))
+            for _, start in rows:
+                self._stratum[start] = h
+        # con key: primero los de más prioridad; si no, orden del archivo
+        chosen.sort()
+        self.offsets = [start for _, start in chosen]
+        self.n = len(self.offsets)
+
+    def tag(self, obj: Dict[str, Any], start: int, phase: str) -> Dict[str, Any]:
+        h = self._stratum[start]
+        return {**obj, "sample": {"stratum": h, "stratum_size": self.sizes[h],
+                                  "population": self.population, "phase": phase}}
+
+    def _read(self, offsets: Iterable[int], phase: str) -> Iterator[Dict[str, Any]]:
+        with open(self.path, "rb") as f:
+            for start in offsets:
+                f.seek(start)
+                yield self.tag(json.loads(f.readline()), start, phase)
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        return self._read(self.offsets, "sample")
+
+    def remaining(self) -> Iterator[Dict[str, Any]]:
+        chosen = set(self.offsets)
+        return self._read((s for s in sorted(self._stratum) if s not in chosen), "fill")
+
+    def summary(self) -> Dict[str, Any]:
+        return {"population": self.population, "sample_size": self.n, "target": self.target,
+                "strata": len(self.sizes), "margin": self.margin,
+                "planned_margin": round(self.planned_margin, 4), "confidence": self.confidence,
+                "time_bucket": self.bucket}
+
+# ---------------------------------------------------------
+# ESTIMACIÓN
+# ---------------------------------------------------------
+def _label(rec: Dict[str, Any]) -> str:
+    return rec.get("label_final") or (rec.get("sentiment") or {}).get("label") or "neutral"
+
+def is_sampled(posts: Iterable[Dict[str, Any]]) -> bool:
+    return any(p.get("sample") for p in posts)
+
+def estimate_label_distribution(posts: Iterable[Dict[str, Any]], confidence: float = 0.95) -> Dict[str, Any]:
+    """
+    Estimador estratificado de la proporción de cada etiqueta:
+      p = Σ W_h p_h,   Var = Σ W_h² (1 - n_h/N_h) p_h (1 - p_h) / (n_h - 1)
+    con W_h = N_h / N. Los posts sin metadatos de muestra se ignoran.
+    """
+    counts: Dict[str, Counter] = defaultdict(Counter)
+    sizes: Dict[str, int] = {}
+    population = 0
+    for p in posts:
+        s = p.get("sample")
+        if not s:
+            continue
+        counts[s["stratum"]][_label(p)] += 1
+        sizes[s["stratum"]] = int(s["stratum_size"])
+        population = max(population, int(s.get("population") or 0))
+    # estratos de la población que no llegaron a la muestra no se pueden estimar:
+    # se normaliza sobre los estratos observados
+    covered = sum(sizes.values()) or 1
+    n = sum(sum(c.values()) for c in counts.values())
+    z = _z(confidence)
+
+    labels: Dict[str, Dict[str, float]] = {}
+    achieved = 0.0
+    for lbl in LABELS:
+        share = var = 0.0
+        for h, c in counts.items():
+            n_h, N_h = sum(c.values()), sizes[h]
+            w = N_h / covered
+            p_h = c.get(lbl, 0) / n_h
+            share += w * p_h
+            fpc = max(0.0, 1 - n_h / N_h)
+            var += w * w * fpc * (p_h * (1 - p_h) / (n_h - 1) if n_h > 1 else 0.25)
+        half = z * math.sqrt(var)
+        achieved = max(achieved, half)
+        labels[lbl] = {
+            "share": round(share, 4),
+            "ci_low": round(max(0.0, share - half), 4),
+            "ci_high": round(min(1.0, share + half), 4),
+            "count_est": round(share * covered, 1),
+        }
+    return {
+        "method": "stratified",
+        "confidence": confidence,
+        "population": population or covered,
+        "sample_size": n,
+        "strata": len(counts),
+        "complete": n >= (population or covered),
+        "margin_achieved": round(achieved, 4),
+        "labels": labels,
+    }
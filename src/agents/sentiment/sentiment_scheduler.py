@@ -0,0 +1,84 @@
+# src/agents/sentiment/sentiment_scheduler.py
+from __future__ import annotations
+import os
+import threading
+from typing import Dict, List, Sequence
+
+# ---------------------------------------------------------
+# CONFIGURACIÓN
+# ---------------------------------------------------------
+# Presupuesto de tokens por lote (filas × longitud del más largo, con padding)
+DEFAULT_TOKEN_BUDGET = int(os.getenv("SENTIMENT_TOKEN_BUDGET", "8192"))
+# SENTIMENT_LENGTH_BUCKETING=0 vuelve a los lotes por cantidad en orden de llegada
+LENGTH_BUCKETING = os.getenv("SENTIMENT_LENGTH_BUCKETING", "1") != "0"
+
+# ---------------------------------------------------------
+# PLANIFICACIÓN DE LOTES
+# ---------------------------------------------------------
+def plan_batches(lengths: Sequence[int], token_budget: int, max_batch: int) -> List[List[int]]:
+    """
+    Ordena los índices por longitud y arma lotes consecutivos cuyo costo con
+    padding (filas × máx. longitud) no pasa de token_budget ni de max_batch filas.
+    Un texto que por sí solo supera el presupuesto va en un lote de 1.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    budget = max(1, int(token_budget))
+    cap = max(1, int(max_batch))
+
+    batches: List[List[int]] = []
+    cur: List[int] = []
+    for i in order:
+        # al ir en orden creciente, el nuevo es el más largo del lote
+        if cur and (len(cur) >= cap or (len(cur) + 1) * max(1, lengths[i]) > budget):
+            batches.append(cur)
+            cur = []
+        cur.append(i)
+    if cur:
+        batches.append(cur)
+    return batches
+
+def fixed_batches(n: int, max_batch: int) -> List[List[int]]:
+    """Lotes ingenuos: max_batch textos en orden de llegada."""
+    bs = max(1, int(max_batch))
+    return [list(range(i, min(i + bs, n))) for i in range(0, n, bs)]
+
+def padded_tokens(lengths: Sequence[int], batches: Sequence[Sequence[int]]) -> int:
+    return sum(len(b) * max(lengths[i] for i in b) for b in batches if b)
+
+# ---------------------------------------------------------
+# MÉTRICA DE EFICIENCIA DE PADDING
+# ---------------------------------------------------------
+class PaddingStats:
+    """
+    Acumula tokens reales vs. tokens con padding (eficiencia = reales / con padding),
+    junto con lo que habría costado el lote ingenuo por cantidad.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.real = 0
+        self.padded = 0
+        self.naive_padded = 0
+        self.batches = 0
+
+    def record(self, lengths: Sequence[int], batches: Sequence[Sequence[int]], max_batch: int) -> None:
+        with self._lock:
+            self.real += sum(lengths)
+            self.padded += padded_tokens(lengths, batches)
+            self.naive_padded += padded_tokens(lengths, fixed_batches(len(lengths), max_batch))
+            self.batches += len(batches)
+
+    def report(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "real_tokens": self.real,
+                "padded_tokens": self.padded,
+                "padding_efficiency": round(self.real / self.padded, 4) if self.padded else 1.0,
+                "naive_padding_efficiency": round(self.real / self.naive_padded, 4) if self.naive_padded else 1.0,
+            }
+
+PADDING_STATS = PaddingStats()
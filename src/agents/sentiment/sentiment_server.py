@@ -0,0 +1,279 @@
+# src/agents/sentiment/sentiment_server.py
+from __future__ import annotations
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Sequence
+
+from src.agents.sentiment.sentiment_scheduler import PADDING_STATS
+
+# ---------------------------------------------------------
+# CONFIGURACIÓN
+# ---------------------------------------------------------
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = int(os.getenv("SENTIMENT_SERVER_PORT", "8765"))
+DEFAULT_MAX_BATCH = 64        # textos por forward
+DEFAULT_MAX_WAIT_MS = 10      # ventana máxima para juntar un micro-lote
+DEFAULT_MAX_PENDING = 4096    # textos en cola antes de rechazar (backpressure)
+CLIENT_MAX_REQUEST = 256      # textos por petición HTTP desde el cliente
+
+
+class QueueFull(Exception):
+    """La cola del servidor está llena: el cliente debe reintentar más tarde."""
+
+
+class _Request:
+    __slots__ = ("texts", "hints", "done", "results", "error")
+
+    def __init__(self, texts: List[str], hints: List[Optional[str]]):
+        self.texts = texts
+        self.hints = hints
+        self.done = threading.Event()
+        self.results: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+
+
+# ---------------------------------------------------------
+# MICRO-BATCHER
+# ---------------------------------------------------------
+class MicroBatcher:
+    """
+    Junta peticiones concurrentes en micro-lotes para SentimentPrecise.analyze_batch.
+    Un lote sale cuando llega a max_batch textos o cuando vence max_wait_ms desde
+    la primera petición. Si hay más de max_pending textos en cola se rechaza (QueueFull).
+    """
+
+    def __init__(self, analyzer, max_batch: int = DEFAULT_MAX_BATCH,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS, max_pending: int = DEFAULT_MAX_PENDING):
+        self.analyzer = analyzer
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_pending = max(1, int(max_pending))
+
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "texts": 0, "batches": 0, "rejected": 0}
+
+        self._thread = threading.Thread(target=self._loop, name="sentiment-microbatcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def submit(self, texts: Sequence[str], hints: Optional[Sequence[Optional[str]]] = None,
+               timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        texts = list(texts)
+        hints = list(hints) if hints is not None else [None] * len(texts)
+        if len(hints) != len(texts):
+            raise ValueError("texts y lang_hints deben tener la misma longitud")
+        if not texts:
+            return []
+
+        with self._lock:
+            if self._pending + len(texts) > self.max_pending:
+                self.stats["rejected"] += 1
+                raise QueueFull(f"{self._pending} textos en cola (máx {self.max_pending})")
+            self._pending += len(texts)
+            self.stats["requests"] += 1
+            self.stats["texts"] += len(texts)
+
+        req = _Request(texts, hints)
+        self._queue.put(req)
+        if not req.done.wait(timeout):
+            raise TimeoutError("El servidor de sentimiento no respondió a tiempo")
+        if req.error:
+            raise RuntimeError(req.error)
+        return req.results
+
+    def _collect(self) -> List[_Request]:
+        first = self._queue.get()
+        batch = [first]
+        size = len(first.texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                req = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(req)
+            size += len(req.texts)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            texts = [t for r in batch for t in r.texts]
+            hints = [h for r in batch for h in r.hints]
+            try:
+                results = self.analyzer.analyze_batch(texts, hints, batch_size=self.max_batch)
+                pos = 0
+                for r in batch:
+                    r.results = results[pos:pos + len(r.texts)]
+                    pos += len(r.texts)
+            except Exception as e:
+                for r in batch:
+                    r.error = f"{type(e).__name__}: {e}"
+            finally:
+                with self._lock:
+                    self._pending -= len(texts)
+                    self.stats["batches"] += 1
+                for r in batch:
+                    r.done.set()
+
+
+# ---------------------------------------------------------
+# SERVIDOR HTTP
+# ---------------------------------------------------------
+def _make_handler(batcher: MicroBatcher):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                cache = getattr(batcher.analyzer, "cache", None)
+                self._send(200, {
+                    "status": "ok",
+                    "pending": batcher.pending,
+                    "stats": batcher.stats,
+                    "cache": cache.stats() if cache is not None else None,
+                    "padding": PADDING_STATS.report(),
+                })
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/analyze":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                data = json.loads(self.rfile.read(length) or b"{}")
+                results = batcher.submit(data.get("texts") or [], data.get("lang_hints"))
+                self._send(200, {"results": results})
+            except QueueFull as e:
+                self._send(503, {"error": str(e)}, {"Retry-After": "1"})
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+            except Exception as e:
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def log_message(self, fmt, *args):
+            pass  # sin log por petición
+
+    return Handler
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, max_batch: int = DEFAULT_MAX_BATCH,
+          max_wait_ms: float = DEFAULT_MAX_WAIT_MS, max_pending: int = DEFAULT_MAX_PENDING,
+          backend: Optional[str] = None, tau1: Optional[float] = None,
+          tau2: Optional[float] = None) -> None:
+    from src.agents.sentiment.sentiment_precise import SentimentPrecise
+    from src.agents.sentiment.sentiment_cache import SentimentCache
+
+    analyzer = SentimentPrecise(cache=SentimentCache.from_env(), backend=backend, tau1=tau1, tau2=tau2)
+    # Precarga ambos modelos para que la primera petición no pague el arranque
+    analyzer.analyze_batch(["ok", "ok"], ["en", "es"])
+
+    batcher = MicroBatcher(analyzer, max_batch, max_wait_ms, max_pending)
+    httpd = ThreadingHTTPServer((host, port), _make_handler(batcher))
+    print(f"🛰️ Servidor de sentimiento en http://{host}:{port} "
+          f"(max_batch={max_batch}, max_wait={max_wait_ms}ms, max_pending={max_pending})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+# ---------------------------------------------------------
+# CLIENTE (misma interfaz que SentimentPrecise)
+# ---------------------------------------------------------
+class SentimentClient:
+    """
+    Cliente ligero del servidor: expone analyze / analyze_batch como SentimentPrecise,
+    sin cargar modelos en el proceso. Reintenta con backoff si el servidor está lleno.
+    """
+
+    def __init__(self, url: str, timeout: float = 300.0, retries: int = 8):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.cache = None  # la caché vive en el servidor
+
+    def _post(self, texts: List[str], hints: List[Optional[str]]) -> List[Dict[str, Any]]:
+        body = json.dumps({"texts": texts, "lang_hints": hints}, ensure_ascii=False).encode("utf-8")
+        delay = 0.1
+        for attempt in range(self.retries + 1):
+            req = urllib.request.Request(
+                f"{self.url}/analyze", data=body, headers={"Content-Type": "application/json"}
+            )
+            try:
+                with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                    return json.loads(resp.read())["results"]
+            except urllib.error.HTTPError as e:
+                if e.code != 503 or attempt == self.retries:
+                    raise
+            time.sleep(delay)
+            delay = min(delay * 2, 5.0)
+        return []
+
+    def health(self) -> Dict[str, Any]:
+        with urllib.request.urlopen(f"{self.url}/health", timeout=5) as resp:
+            return json.loads(resp.read())
+
+    def tokenizer_for(self, lang_hint: Optional[str] = None):
+        # Solo tokenizer + config (sin pesos) para el chunking por subwords
+        from src.agents.sentiment.sentiment_hf import tokenizer_budget
+        lang = (lang_hint or "es").lower().strip()
+        return tokenizer_budget("en" if lang.startswith("en") else "es")
+
+    def analyze(self, text: str, lang_hint: Optional[str] = None) -> Dict[str, Any]:
+        return self.analyze_batch([text], [lang_hint])[0]
+
+    def analyze_batch(self, texts: Sequence[str], lang_hints: Optional[Sequence[Optional[str]]] = None,
+                      batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+        texts = list(texts)
+        hints = list(lang_hints) if lang_hints is not None else [None] * len(texts)
+        out: List[Dict[str, Any]] = []
+        for i in range(0, len(texts), CLIENT_MAX_REQUEST):
+            out.extend(self._post(texts[i:i + CLIENT_MAX_REQUEST], hints[i:i + CLIENT_MAX_REQUEST]))
+        return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Servidor local de sentimiento con micro-batching")
+    ap.add_argument("--host", default=DEFAULT_HOST)
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--max_batch", type=int, default=DEFAULT_MAX_BATCH)
+    ap.add_argument("--max_wait_ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    ap.add_argument("--max_pending", type=int, default=DEFAULT_MAX_PENDING)
+    ap.add_argument("--backend", default=None, help="torch | torch-mmap | torch-bf16 | torch-int8 | onnx | onnx-int8 | student")
+    ap.add_argument("--tau1", type=float, default=None, help="Activa la cascada m1 → m2")
+    ap.add_argument("--tau2", type=float, default=None)
+    args = ap.parse_args()
+    serve(args.host, args.port, args.max_batch, args.max_wait_ms, args.max_pending, args.backend,
+          args.tau1, args.tau2)
+
+
+if __name__ == "__main__":
+    main()
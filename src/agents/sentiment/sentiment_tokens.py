@@ -0,0 +1,143 @@
+# src/agents/sentiment/sentiment_tokens.py
+"""
+Almacén de token ids pre-tokenizados por chunk (sidecar del JSONL de chunks).
+- <chunks>.tokens.bin: int32 concatenados (se abre con np.memmap, sin copiar)
+- <chunks>.tokens.npz: por chunk, byte de fin de su línea en el JSONL (la clave
+  que ya devuelve iter_jsonl_offsets), inicio en el .bin y ruta (en/es), más la
+  identidad del tokenizer de cada ruta.
+Los ids son los que generaría el pipeline (con tokens especiales y truncados a
+la ventana segura del modelo ruteado); si el modelo cambió, el sidecar se ignora.
+"""
+from __future__ import annotations
+import json
+import os
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+ROUTES = ("en", "es")
+BIN_SUFFIX = ".tokens.bin"
+INDEX_SUFFIX = ".tokens.npz"
+
+def sidecar_paths(chunks_path: str):
+    return chunks_path + BIN_SUFFIX, chunks_path + INDEX_SUFFIX
+
+def route_for(lang: Optional[str]) -> str:
+    # misma regla que SentimentPrecise._route
+    return "en" if (lang or "es").lower().strip().startswith("en") else "es"
+
+# ---------------------------------------------------------
+# TOKENIZERS POR RUTA (sin cargar pesos; uno por proceso)
+# ---------------------------------------------------------
+_TOKENIZERS: Dict[str, Any] = {}
+
+def _tokenizer(route: str):
+    if route not in _TOKENIZERS:
+        from src.agents.sentiment.sentiment_hf import tokenizer_budget
+        tok, budget = tokenizer_budget(route)
+        _TOKENIZERS[route] = (tok, budget + tok.num_special_tokens_to_add())
+    return _TOKENIZERS[route]
+
+def tokenize(text: str, route: str) -> List[int]:
+    tok, max_len = _tokenizer(route)
+    return tok(text, truncation=True, max_length=max_len)["input_ids"]
+
+def chunk_token_ids(chunk: Dict[str, Any]) -> Tuple[str, List[int]]:
+    """(ruta, ids) de un registro chunk, con el mismo texto/idioma que lee el runner."""
+    lang = chunk.get("lang") or (chunk.get("meta") or {}).get("lang")
+    route = route_for(lang)
+    # SentimentPrecise puntúa el texto sin espacios en los bordes
+    return route, tokenize((chunk.get("text") or "").strip(), route)
+
+def tokenizer_identity() -> Dict[str, List[str]]:
+    from src.agents.sentiment.sentiment_hf import _model_name_for, _model_revision
+    out = {}
+    for route in ROUTES:
+        name = _model_name_for(route)
+        out[route] = [os.path.basename(os.path.normpath(name)), _model_revision(name)]
+    return out
+
+# ---------------------------------------------------------
+# ESCRITURA (streaming, a la par del JSONL de chunks)
+# ---------------------------------------------------------
+class TokenStoreWriter:
+    def __init__(self, chunks_path: str):
+        self.chunks_path = chunks_path
+        self.bin_path, self.index_path = sidecar_paths(chunks_path)
+        self._bin = open(self.bin_path + ".tmp", "wb")
+        self._ends = array("q")
+        self._starts = array("q", [0])
+        self._routes = array("B")
+
+    def add(self, line_end: int, route: str, ids: Sequence[int]) -> None:
+        """line_end: byte del JSONL de chunks justo después de la línea de este chunk."""
+        self._bin.write(np.asarray(ids, dtype=np.int32).tobytes())
+        self._ends.append(line_end)
+        self._starts.append(self._starts[-1] + len(ids))
+        self._routes.append(ROUTES.index(route))
+
+    def close(self) -> Dict[str, int]:
+        self._bin.close()
+        meta = {
+            "tokenizers": tokenizer_identity(),
+            "jsonl_bytes": os.path.getsize(self.chunks_path),
+        }
+        tmp_index = self.index_path + ".tmp.npz"
+        np.savez(
+            tmp_index,
+            ends=np.frombuffer(self._ends, dtype=np.int64),
+            starts=np.frombuffer(self._starts, dtype=np.int64),
+            routes=np.frombuffer(self._routes, dtype=np.uint8),
+            meta=np.array(json.dumps(meta)),
+        )
+        os.replace(self.bin_path + ".tmp", self.bin_path)
+        os.replace(tmp_index, self.index_path)
+        return {"chunks": len(self._ends), "tokens": int(self._starts[-1])}
+
+# ---------------------------------------------------------
+# LECTURA
+# ---------------------------------------------------------
+class TokenStore:
+    """Búsqueda de los ids de un chunk por el offset de fin de su línea."""
+
+    def __init__(self, chunks_path: str):
+        bin_path, index_path = sidecar_paths(chunks_path)
+        with np.load(index_path) as idx:
+            self.ends = idx["ends"]
+            self.starts = idx["starts"]
+            self.routes = idx["routes"]
+            self.meta = json.loads(str(idx["meta"]))
+        n_tokens = int(self.starts[-1])
+        self.ids = (np.memmap(bin_path, dtype=np.int32, mode="r", shape=(n_tokens,))
+                    if n_tokens else np.zeros(0, dtype=np.int32))
+        # rutas cuyo tokenizer ya no es el actual: esos chunks se re-tokenizan
+        current = tokenizer_identity()
+        self.valid_routes = {r for r in ROUTES if self.meta["tokenizers"].get(r) == current[r]}
+
+    @classmethod
+    def open(cls, chunks_path: str) -> Optional["TokenStore"]:
+        """None si no hay sidecar o si no corresponde a este JSONL."""
+        bin_path, index_path = sidecar_paths(chunks_path)
+        if not (os.path.exists(bin_path) and os.path.exists(index_path)):
+            return None
+        try:
+            store = cls(chunks_path)
+        except Exception as e:
+            print(f"   ⚠️ Sidecar de tokens ilegible ({e}): se tokeniza en línea.")
+            return None
+        if store.meta.get("jsonl_bytes") != os.path.getsize(chunks_path):
+            print("   ⚠️ El sidecar de tokens no corresponde al JSONL actual: se ignora.")
+            return None
+        return store
+
+    def get(self, line_end: int, route: str) -> Optional[np.ndarray]:
+        if route not in self.valid_routes:
+            return None
+        k = int(np.searchsorted(self.ends, line_end))
+        if k >= len(self.ends) or self.ends[k] != line_end or ROUTES[self.routes[k]] != route:
+            return None
+        return self.ids[self.starts[k]:self.starts[k + 1]]
+
+    def __len__(self) -> int:
+        return len(self.ends)
@@ -4,6 +4,7 @@ import re, json, os, hashlib
 from typing import List
 from pydantic import BaseModel, Field
 from datetime import datetime
+from src.utils.lang_id import detect_posts
 
 class PreprocessInput(BaseModel):
     path: str = Field(..., description="Ruta del archivo JSON o JSONL con los datos a limpiar y normalizar")
@@ -47,22 +48,6 @@ def _to_iso_z(ts):
     except:
         return None
 
-def _detect_lang_simple(text: str):
-    """Heurística ligera ES/EN; si no se puede, devuelve None (para que salga null en JSON)."""
-    t = (text or "").lower()
-    if not t.strip():
-        return None
-    ES_SW = {" no ", " si ", " pero ", " muy ", " más ", " mas ", " también ", " tambien ", " porque ", " que ", " esto ", " esta ", " estos ", " estas ", " otro ", " otra "}
-    EN_SW = {" the ", " and ", " but ", " very ", " more ", " also ", " because ", " that ", " this ", " these ", " those ", " again "}
-
-    es = sum(1 for w in ES_SW if w in " " + t + " ")
-    en = sum(1 for w in EN_SW if w in " " + t + " ")
-    if es >= 2 and es > en: return "es"
-    if en >= 2 and en > es: return "en"
-    # pistas por acentos
-    if re.search(r"[áéíóúñ¿¡]", t): return "es"
-    return None
-
 def _extract_hashtags(text):
     return re.findall(r"#(\w+)", text or "")
 
@@ -93,7 +78,8 @@ def preprocess_posts(path: str, output_path: str) -> str:
     Preprocesa posts (JSON/JSONL) al esquema estándar para el agente de sentimiento.
     - Descarta registros vacíos y sin timestamp.
     - Normaliza timestamp a ISO-8601 Z.
-    - lang = null si no se detecta.
+    - lang por n-gramas de caracteres (todo el archivo en un lote); null si no se detecta.
+      Posts con español e inglés llevan además lang_mixed = true.
     - Dedup por sha256(content), url y post_id.
     - Cuenta procesados/descartes/deduplicados.
     """
@@ -169,9 +155,6 @@ def preprocess_posts(path: str, output_path: str) -> str:
             continue
         seen_sha.add(content_hash)
 
-        # Lang (null si no detecta)
-        lang = _detect_lang_simple(raw_text)
-
         # Mapea engagement
         likes = data.get("score") or data.get("ups") or data.get("likes")
         comments = data.get("num_comments") or data.get("comments")
@@ -183,7 +166,7 @@ def preprocess_posts(path: str, output_path: str) -> str:
             "post_id": f"reddit:{post_id}" if post_id else "",
             "timestamp": timestamp,
             "channel": data.get("channel") or "reddit",
-            "lang": lang,  # None -> null en JSON
+            "lang": None,  # se completa abajo en lote; None -> null en JSON
             "text_norm": text_norm,
             "text_raw": raw_text,
             "text_raw_ref": None,
@@ -217,6 +200,12 @@ def preprocess_posts(path: str, output_path: str) -> str:
         cleaned.append(item)
         processed += 1
 
+    # Lang (null si no detecta): un solo lote vectorizado para todo el archivo
+    for item, (lang, mixed) in zip(cleaned, detect_posts([it["text_raw"] for it in cleaned])):
+        item["lang"] = lang
+        if mixed:
+            item["lang_mixed"] = True
+
     # Escribir salida JSONL
     with open(output_path, "w", encoding="utf-8") as out:
         for item in cleaned:
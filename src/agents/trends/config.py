@@ -24,6 +24,9 @@ REPORT_OUTPUT = os.path.join(ARTIFACTS_DIR, "latest_trend_report.json")
 # Opción A: 'paraphrase-multilingual-MiniLM-L12-v2' (Rápido, bueno para Reddit)
 # Opción B: 'xlm-r-bert-base-nli-stsb-mean-tokens' (Más pesado, mejor comprensión)
 EMBEDDING_MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+# Lote de embeddings (default de sentence-transformers); con SENTIMENT_AUTOTUNE=1
+# se reemplaza por el elegido por src/utils/batch_autotune.py para este host
+EMBEDDING_BATCH_SIZE = 32
 
 # Configuración de BERTopic
 MIN_TOPIC_SIZE = 10  # Mínimo de posts para formar un tema
@@ -7,13 +7,30 @@ from sklearn.feature_extraction.text import CountVectorizer # Usamos el estánda
 
 # --- Importaciones de BERTopic y Clustering ---
 from bertopic import BERTopic
+from bertopic.backend import BaseEmbedder
+from sentence_transformers import SentenceTransformer
 from sklearn.cluster import MiniBatchKMeans
 
+from src.utils import batch_autotune
+from src import model_daemon
+
 try:
     from src.agents.trends import config
 except ImportError:
     from . import config
 
+class DaemonEmbedder(BaseEmbedder):
+    """Embedder de BERTopic que delega en el daemon de modelos (sin cargar pesos aquí)."""
+
+    def __init__(self, client, name):
+        super().__init__()
+        self.client = client
+        self.name = name
+
+    def embed(self, documents, verbose=False):
+        return self.client.embed(list(documents), self.name, config.EMBEDDING_BATCH_SIZE)
+
+
 class TopicModelEngine:
     """
     Motor de Tópicos 'Stateless' (Sin Estado).
@@ -23,6 +40,11 @@ class TopicModelEngine:
 
     def __init__(self):
         self.model = None
+        # Daemon de modelos corriendo: embeddings y stopwords ya están cargados allí
+        self.daemon = model_daemon.get_client()
+        if self.daemon is not None:
+            print(f"[TopicEngine] 🛰️ Usando daemon de modelos: {self.daemon.url}")
+            return
         # Precarga de NLTK para no fallar en ejecución
         try:
             nltk.data.find('corpora/stopwords')
@@ -32,8 +54,12 @@ class TopicModelEngine:
 
     def _get_custom_stopwords(self):
         """Genera la super-lista de palabras a ignorar"""
-        stop_es = stopwords.words('spanish')
-        stop_en = stopwords.words('english')
+        if self.daemon is not None:
+            words = self.daemon.stopwords()
+            stop_es, stop_en = words["spanish"], words["english"]
+        else:
+            stop_es = stopwords.words('spanish')
+            stop_en = stopwords.words('english')
         
         # Intentamos leer la lista del config, si no existe, usamos lista vacía
         stop_custom = getattr(config, 'CUSTOM_STOP_WORDS', []) 
@@ -41,6 +67,24 @@ class TopicModelEngine:
         # Unimos todo: Español + Inglés + Tu lista de Config
         return stop_es + stop_en + stop_custom
 
+    def _embed(self, texts):
+        """Modelo de embeddings + embeddings de los textos (lote fijo o autotuneado)."""
+        name = config.EMBEDDING_MODEL_NAME
+        if self.daemon is not None:
+            model = DaemonEmbedder(self.daemon, name)
+            return model, model.embed(texts)
+        model = SentenceTransformer(name)
+        batch_size = config.EMBEDDING_BATCH_SIZE
+        if batch_autotune.enabled():
+            batch_size = batch_autotune.autotune_batch_size(
+                f"embedding:{name}:{model.device}",
+                lambda items, bs: model.encode(items, batch_size=bs, show_progress_bar=False),
+                texts[:256],
+                fallback=batch_size,
+            )
+        embeddings = model.encode(texts, batch_size=batch_size, show_progress_bar=config.VERBOSE_LOGS)
+        return model, embeddings
+
     def fit_transform(self, texts):
         """
         Entrena el modelo con los textos actuales y retorna los tópicos.
@@ -68,8 +112,10 @@ class TopicModelEngine:
         )
 
         # 3. Inicializar BERTopic con el vectorizador limpio
+        # (los embeddings se calculan aquí para controlar el tamaño de lote)
+        embedding_model, embeddings = self._embed(texts)
         self.model = BERTopic(
-            embedding_model=config.EMBEDDING_MODEL_NAME,
+            embedding_model=embedding_model,
             hdbscan_model=cluster_model,
             vectorizer_model=vectorizer_model, # <--- Aquí entra la limpieza
             min_topic_size=3,  
@@ -80,7 +126,7 @@ class TopicModelEngine:
 
         # 4. Entrenar y Transformar
         try:
-            topics, probs = self.model.fit_transform(texts)
+            topics, probs = self.model.fit_transform(texts, embeddings=embeddings)
             
             # Debug: Mostrar qué encontró (ahora debería salir limpio)
             info = self.model.get_topic_info()
@@ -0,0 +1,518 @@
+# src/model_daemon.py
+"""
+Daemon de modelos "calientes" compartido por el CLI (run.py), run_batch.py y el
+dashboard. Carga una sola vez RoBERTa ES/EN, el embedder de tópicos y las
+stopwords de NLTK, y los sirve por HTTP en localhost:
+  GET  /health     estado, modelos cargados, segundos sin uso
+  GET  /stopwords  stopwords español + inglés de NLTK
+  POST /analyze    sentimiento (mismo contrato que sentiment_server → SentimentClient)
+  POST /embed      embeddings (float32 en base64)
+  POST /tokenize   token ids del modelo de sentimiento ruteado
+Tras MODEL_DAEMON_IDLE_UNLOAD_S sin peticiones libera los modelos (el proceso
+sigue vivo y los recarga en la siguiente petición).
+
+El daemon deja su URL en data/run/model_daemon.json: nodes.get_analyzer() y
+TopicModelEngine la descubren solos (MODEL_DAEMON=0 lo desactiva).
+
+    python -m src.model_daemon start | stop | status | serve
+"""
+from __future__ import annotations
+import argparse
+import base64
+import gc
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from src.agents.sentiment.sentiment_server import (
+    DEFAULT_MAX_BATCH, DEFAULT_MAX_PENDING, DEFAULT_MAX_WAIT_MS,
+    MicroBatcher, QueueFull, SentimentClient,
+)
+from src.utils import batch_autotune
+
+# ---------------------------------------------------------
+# CONFIGURACIÓN
+# ---------------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUN_DIR = os.path.join(BASE_DIR, "data", "run")
+STATE_FILE = os.path.join(RUN_DIR, "model_daemon.json")
+LOG_FILE = os.path.join(RUN_DIR, "model_daemon.log")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = int(os.getenv("MODEL_DAEMON_PORT", "8766"))
+# 0 = nunca descargar
+IDLE_UNLOAD_S = float(os.getenv("MODEL_DAEMON_IDLE_UNLOAD_S", "1800"))
+DISCOVERY_TIMEOUT_S = 0.5
+
+
+# ---------------------------------------------------------
+# MODELOS (carga perezosa, descarga por inactividad)
+# ---------------------------------------------------------
+class WarmModels:
+    """
+    Dueño de los modelos del proceso. Toda inferencia pasa por use(), que marca
+    actividad y bloquea la descarga mientras hay peticiones en curso.
+    """
+
+    def __init__(self, backend: Optional[str] = None, tau1: Optional[float] = None,
+                 tau2: Optional[float] = None, embedder: bool = True):
+        from src.agents.sentiment.sentiment_precise import SentimentPrecise
+        from src.agents.sentiment.sentiment_cache import SentimentCache
+
+        self.analyzer = SentimentPrecise(cache=SentimentCache.from_env(), backend=backend, tau1=tau1, tau2=tau2)
+        self.with_embedder = embedder
+        self._embedders: Dict[str, Any] = {}
+        self._stopwords: Optional[Dict[str, List[str]]] = None
+        self._lock = threading.RLock()
+        self._active = 0
+        self.last_used = time.time()
+        self.unloads = 0
+
+    # -- uso ----------------------------------------------------------
+    @contextmanager
+    def use(self):
+        with self._lock:
+            self._active += 1
+            self.last_used = time.time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+                self.last_used = time.time()
+
+    def analyze_batch(self, texts, lang_hints=None, batch_size=None):
+        with self.use():
+            return self.analyzer.analyze_batch(texts, lang_hints, batch_size=batch_size)
+
+    def embedder(self, name: Optional[str] = None):
+        from src.agents.trends import config
+        name = name or config.EMBEDDING_MODEL_NAME
+        with self._lock:
+            if name not in self._embedders:
+                from sentence_transformers import SentenceTransformer
+                print(f"   🔄 [ModelDaemon] Cargando embedder: {name} ...")
+                self._embedders[name] = SentenceTransformer(name)
+            return self._embedders[name]
+
+    def embed(self, texts: List[str], name: Optional[str] = None, batch_size: Optional[int] = None):
+        from src.agents.trends import config
+        with self.use():
+            model = self.embedder(name)
+            return model.encode(texts, batch_size=batch_size or config.EMBEDDING_BATCH_SIZE,
+                                show_progress_bar=False, convert_to_numpy=True)
+
+    def tokenize(self, texts: List[str], lang_hints: Sequence[Optional[str]]) -> List[List[int]]:
+        from src.agents.sentiment.sentiment_tokens import route_for, tokenize
+        with self.use():
+            return [tokenize((t or "").strip(), route_for(h)) for t, h in zip(texts, lang_hints)]
+
+    def stopwords(self) -> Dict[str, List[str]]:
+        if self._stopwords is None:
+            import nltk
+            from nltk.corpus import stopwords
+            try:
+                nltk.data.find('corpora/stopwords')
+            except LookupError:
+                nltk.download('stopwords')
+            self._stopwords = {"spanish": stopwords.words('spanish'), "english": stopwords.words('english')}
+        return self._stopwords
+
+    # -- ciclo de vida ------------------------------------------------
+    def preload(self) -> None:
+        with self.use(), batch_autotune.paused():
+            # primera inferencia por ruta: carga ambos pipelines de sentimiento
+            # (el autotuning se hace con la primera carga real, no con este warm-up)
+            self.analyzer.analyze_batch(["ok", "ok"], ["en", "es"])
+            if self.with_embedder:
+                self.embedder()
+        self.stopwords()
+
+    def loaded(self) -> Dict[str, Any]:
+        from src.agents.sentiment import sentiment_hf
+        return {
+            "sentiment": [f"{os.path.basename(m)}:{b}" for m, b in sentiment_hf._PIPES],
+            "embedders": sorted(self._embedders),
+            "stopwords": self._stopwords is not None,
+        }
+
+    def unload_if_idle(self, idle_s: float) -> bool:
+        from src.agents.sentiment import sentiment_hf
+        with self._lock:
+            if self._active or time.time() - self.last_used < idle_s:
+                return False
+            if not sentiment_hf._PIPES and not self._embedders:
+                return False
+            sentiment_hf._PIPES.clear()
+            self._embedders.clear()
+            self.unloads += 1
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except Exception:
+            pass
+        print(f"   💤 [ModelDaemon] {idle_s:.0f}s sin uso: modelos descargados.")
+        return True
+
+
+def _idle_loop(models: WarmModels, idle_s: float) -> None:
+    while True:
+        time.sleep(max(1.0, min(30.0, idle_s / 4)))
+        models.unload_if_idle(idle_s)
+
+
+# ---------------------------------------------------------
+# SERVIDOR HTTP
+# ---------------------------------------------------------
+def _encode_array(arr) -> Dict[str, Any]:
+    import numpy as np
+    arr = np.ascontiguousarray(arr, dtype=np.float32)
+    return {"dtype": "float32", "shape": list(arr.shape), "data": base64.b64encode(arr.tobytes()).decode("ascii")}
+
+
+def _make_handler(models: WarmModels, batcher: MicroBatcher, started: float, idle_s: float):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                cache = models.analyzer.cache
+                self._send(200, {
+                    "status": "ok",
+                    "pid": os.getpid(),
+                    "uptime_s": round(time.time() - started, 1),
+                    "idle_s": round(time.time() - models.last_used, 1),
+                    "idle_unload_s": idle_s,
+                    "unloads": models.unloads,
+                    "loaded": models.loaded(),
+                    "pending": batcher.pending,
+                    "stats": batcher.stats,
+                    "cache": cache.stats() if cache is not None else None,
+                })
+            elif self.path == "/stopwords":
+                self._send(200, models.stopwords())
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                data = json.loads(self.rfile.read(length) or b"{}")
+                texts = data.get("texts") or []
+                if self.path == "/analyze":
+                    self._send(200, {"results": batcher.submit(texts, data.get("lang_hints"))})
+                elif self.path == "/embed":
+                    emb = models.embed(texts, data.get("model"), data.get("batch_size"))
+                    self._send(200, {"embeddings": _encode_array(emb)})
+                elif self.path == "/tokenize":
+                    hints = data.get("lang_hints") or [None] * len(texts)
+                    if len(hints) != len(texts):
+                        raise ValueError("texts y lang_hints deben tener la misma longitud")
+                    self._send(200, {"input_ids": models.tokenize(texts, hints)})
+                else:
+                    self._send(404, {"error": "not found"})
+            except QueueFull as e:
+                self._send(503, {"error": str(e)}, {"Retry-After": "1"})
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+            except Exception as e:
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def log_message(self, fmt, *args):
+            pass  # sin log por petición
+
+    return Handler
+
+
+def _write_state(state: Dict[str, Any]) -> None:
+    os.makedirs(RUN_DIR, exist_ok=True)
+    tmp = f"{STATE_FILE}.tmp{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, STATE_FILE)
+
+
+def _read_state() -> Optional[Dict[str, Any]]:
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _clear_state(pid: int) -> None:
+    state = _read_state()
+    if state and state.get("pid") == pid:
+        try:
+            os.remove(STATE_FILE)
+        except OSError:
+            pass
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, max_batch: int = DEFAULT_MAX_BATCH,
+          max_wait_ms: float = DEFAULT_MAX_WAIT_MS, max_pending: int = DEFAULT_MAX_PENDING,
+          backend: Optional[str] = None, tau1: Optional[float] = None, tau2: Optional[float] = None,
+          idle_unload_s: float = IDLE_UNLOAD_S, embedder: bool = True) -> None:
+    t0 = time.time()
+    models = WarmModels(backend=backend, tau1=tau1, tau2=tau2, embedder=embedder)
+    models.preload()
+    print(f"   ✅ [ModelDaemon] Modelos listos en {time.time() - t0:.1f}s: {models.loaded()}")
+
+    batcher = MicroBatcher(models, max_batch, max_wait_ms, max_pending)
+    httpd = ThreadingHTTPServer((host, port), _make_handler(models, batcher, t0, idle_unload_s))
+    if idle_unload_s > 0:
+        threading.Thread(target=_idle_loop, args=(models, idle_unload_s),
+                         name="model-daemon-idle", daemon=True).start()
+
+    url = f"http://{host}:{httpd.server_address[1]}"
+    _write_state({"url": url, "pid": os.getpid(), "supervisor_pid": os.getppid()
+                  if os.getenv("MODEL_DAEMON_SUPERVISED") else None, "started_at": t0})
+    # SIGTERM (stop / supervisor) → salida limpia por el mismo camino que Ctrl+C
+    def _sigterm(*_):
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, _sigterm)
+    print(f"🛰️ Daemon de modelos en {url} (idle_unload={idle_unload_s:.0f}s)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        _clear_state(os.getpid())
+
+
+# ---------------------------------------------------------
+# SUPERVISOR (reinicia el daemon si muere)
+# ---------------------------------------------------------
+def supervise(serve_args: List[str]) -> None:
+    cmd = [sys.executable, "-m", "src.model_daemon", "serve", *serve_args]
+    env = {**os.environ, "MODEL_DAEMON_SUPERVISED": "1"}
+    child: Optional[subprocess.Popen] = None
+    stopping = False
+
+    def _stop(*_):
+        nonlocal stopping
+        stopping = True
+        if child is not None and child.poll() is None:
+            child.terminate()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    delay = 1.0
+    while not stopping:
+        t0 = time.time()
+        child = subprocess.Popen(cmd, cwd=BASE_DIR, env=env)
+        code = child.wait()
+        if stopping or code == 0:
+            break
+        # backoff si muere al arrancar; se reinicia si vivió un buen rato
+        delay = 1.0 if time.time() - t0 > 60 else min(delay * 2, 60.0)
+        print(f"   ⚠️ [ModelDaemon] El daemon terminó con código {code}: reinicio en {delay:.0f}s")
+        time.sleep(delay)
+
+
+def start(serve_args: List[str], wait_s: float = 300.0) -> Optional[str]:
+    """Lanza el supervisor en segundo plano y espera a que el daemon responda."""
+    url = discover()
+    if url:
+        print(f"El daemon ya está corriendo en {url}")
+        return url
+    os.makedirs(RUN_DIR, exist_ok=True)
+    with open(LOG_FILE, "ab") as log:
+        subprocess.Popen([sys.executable, "-m", "src.model_daemon", "supervise", *serve_args],
+                         cwd=BASE_DIR, stdout=log, stderr=subprocess.STDOUT,
+                         stdin=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.time() + wait_s
+    while time.time() < deadline:
+        url = discover()
+        if url:
+            print(f"✅ Daemon listo en {url} (log: {LOG_FILE})")
+            return url
+        time.sleep(1.0)
+    print(f"❌ El daemon no respondió en {wait_s:.0f}s (ver {LOG_FILE})")
+    return None
+
+
+def stop() -> bool:
+    state = _read_state()
+    if not state:
+        return False
+    pid = state.get("supervisor_pid") or state.get("pid")
+    try:
+        os.kill(int(pid), signal.SIGTERM)
+    except (OSError, TypeError, ValueError):
+        _clear_state(state.get("pid"))
+        return False
+    return True
+
+
+# ---------------------------------------------------------
+# DESCUBRIMIENTO + CLIENTE
+# ---------------------------------------------------------
+def _pid_alive(pid: Any) -> bool:
+    try:
+        os.kill(int(pid), 0)
+    except (OSError, TypeError, ValueError):
+        return False
+    return True
+
+
+def discover() -> Optional[str]:
+    """
+    URL del daemon si está corriendo y responde a /health; si no, None.
+    MODEL_DAEMON_URL fuerza una URL; MODEL_DAEMON=0 desactiva el descubrimiento.
+    """
+    if os.getenv("MODEL_DAEMON", "1").lower() in ("0", "false", "no"):
+        return None
+    url = os.getenv("MODEL_DAEMON_URL")
+    if not url:
+        state = _read_state()
+        if not state or not _pid_alive(state.get("pid")):
+            return None
+        url = state.get("url")
+    try:
+        with urllib.request.urlopen(f"{url}/health", timeout=DISCOVERY_TIMEOUT_S) as resp:
+            return url if json.loads(resp.read()).get("status") == "ok" else None
+    except Exception:
+        return None
+
+
+class DaemonClient(SentimentClient):
+    """SentimentClient + embeddings, tokenización y stopwords del daemon."""
+
+    def _call(self, path: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        data = None if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        req = urllib.request.Request(f"{self.url}{path}", data=data,
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            return json.loads(resp.read())
+
+    def embed(self, texts: Sequence[str], model: Optional[str] = None, batch_size: Optional[int] = None):
+        import numpy as np
+        out = self._call("/embed", {"texts": list(texts), "model": model, "batch_size": batch_size})["embeddings"]
+        return np.frombuffer(base64.b64decode(out["data"]), dtype=out["dtype"]).reshape(out["shape"])
+
+    def tokenize(self, texts: Sequence[str], lang_hints: Optional[Sequence[Optional[str]]] = None) -> List[List[int]]:
+        hints = list(lang_hints) if lang_hints is not None else [None] * len(texts)
+        return self._call("/tokenize", {"texts": list(texts), "lang_hints": hints})["input_ids"]
+
+    def stopwords(self) -> Dict[str, List[str]]:
+        return self._call("/stopwords")
+
+
+class FallbackAnalyzer:
+    """
+    Analizador de nodes.get_analyzer() cuando hay servidor/daemon: le delega
+    mientras responda. Si la conexión falla (daemon detenido o caído) vuelve a
+    descubrir y, si no queda ninguno, sigue con SentimentPrecise en este proceso.
+    """
+
+    def __init__(self, url: str, local_factory: Callable[[], Any]):
+        self._client: SentimentClient = SentimentClient(url)
+        self._local_factory = local_factory
+        self._local = None
+
+    @property
+    def url(self) -> Optional[str]:
+        return None if self._local is not None else self._client.url
+
+    @property
+    def cache(self):
+        return (self._local or self._client).cache
+
+    def tokenizer_for(self, lang_hint: Optional[str] = None):
+        return (self._local or self._client).tokenizer_for(lang_hint)
+
+    def _call(self, method: str, *args, **kwargs):
+        for _ in range(2):
+            if self._local is not None:
+                break
+            try:
+                return getattr(self._client, method)(*args, **kwargs)
+            except urllib.error.HTTPError:
+                raise  # el servidor respondió: no es un problema de conexión
+            except (urllib.error.URLError, ConnectionError) as e:
+                url = discover()
+                if url:
+                    print(f"   🛰️ Servidor de sentimiento no responde ({e}): reintentando con {url}")
+                    self._client = SentimentClient(url)
+                else:
+                    print(f"   ⚠️ Servidor de sentimiento no disponible ({e}): se cargan los modelos en este proceso.")
+                    self._local = self._local_factory()
+        if self._local is None:
+            self._local = self._local_factory()
+        return getattr(self._local, method)(*args, **kwargs)
+
+    def analyze(self, text: str, lang_hint: Optional[str] = None) -> Dict[str, Any]:
+        return self._call("analyze", text, lang_hint)
+
+    def analyze_batch(self, texts: Sequence[str], lang_hints: Optional[Sequence[Optional[str]]] = None,
+                      batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self._call("analyze_batch", texts, lang_hints, batch_size)
+
+
+def get_client() -> Optional[DaemonClient]:
+    url = discover()
+    return DaemonClient(url) if url else None
+
+
+# ---------------------------------------------------------
+# CLI
+# ---------------------------------------------------------
+def main():
+    ap = argparse.ArgumentParser(description="Daemon de modelos calientes (sentimiento, embeddings, tokenización)")
+    ap.add_argument("command", choices=["start", "stop", "status", "serve", "supervise"])
+    ap.add_argument("--host", default=DEFAULT_HOST)
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--max_batch", type=int, default=DEFAULT_MAX_BATCH)
+    ap.add_argument("--max_wait_ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    ap.add_argument("--max_pending", type=int, default=DEFAULT_MAX_PENDING)
+    ap.add_argument("--backend", default=None, help="torch | torch-mmap | torch-bf16 | torch-int8 | onnx | onnx-int8 | student")
+    ap.add_argument("--tau1", type=float, default=None, help="Activa la cascada m1 → m2")
+    ap.add_argument("--tau2", type=float, default=None)
+    ap.add_argument("--idle_unload", type=float, default=IDLE_UNLOAD_S,
+                    help="Segundos sin peticiones antes de liberar los modelos (0 = nunca)")
+    ap.add_argument("--no_embedder", action="store_true", help="No precarga el embedder de tópicos")
+    args, _ = ap.parse_known_args()
+
+    # argumentos que el supervisor reenvía al proceso "serve"
+    serve_args = sys.argv[2:]
+    if args.command == "serve":
+        serve(args.host, args.port, args.max_batch, args.max_wait_ms, args.max_pending, args.backend,
+              args.tau1, args.tau2, args.idle_unload, not args.no_embedder)
+    elif args.command == "supervise":
+        supervise(serve_args)
+    elif args.command == "start":
+        sys.exit(0 if start(serve_args) else 1)
+    elif args.command == "stop":
+        print("🛑 Daemon detenido." if stop() else "No hay daemon corriendo.")
+    else:
+        url = discover()
+        if not url:
+            print("No hay daemon corriendo.")
+            sys.exit(1)
+        print(json.dumps(DaemonClient(url).health(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# Archivo: src/utils/batch_autotune.py
+"""
+Autotuner de tamaño de lote para inferencia (sentimiento y embeddings).
+Prueba lotes crecientes con entradas representativas, elige el "codo" de
+throughput bajo un techo de RSS y guarda la elección por host y modelo.
+"""
+import contextlib
+import json
+import os
+import resource
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_STORE = os.path.join(BASE_DIR, "data", "cache", "batch_autotune.json")
+
+CANDIDATES = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+KNEE_TOLERANCE = 0.05   # se acepta el lote más chico a ≤5% del mejor throughput
+PROBE_SECONDS = 1.0     # tiempo mínimo medido por candidato
+
+_LOCK = threading.Lock()
+_PAUSED = threading.local()
+
+def enabled() -> bool:
+    """SENTIMENT_AUTOTUNE=1 activa el autotuning (si no, se usan los tamaños fijos)."""
+    if getattr(_PAUSED, "depth", 0):
+        return False
+    return os.getenv("SENTIMENT_AUTOTUNE", "0") == "1"
+
+@contextlib.contextmanager
+def paused():
+    """Sin autotuning en este hilo (p. ej. warm-ups con textos de juguete que no deben fijar el lote)."""
+    _PAUSED.depth = getattr(_PAUSED, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _PAUSED.depth -= 1
+
+def _host_key() -> str:
+    return f"{socket.gethostname()}:{os.cpu_count()}cpu"
+
+def _rss_mb() -> float:
+    """RSS actual del proceso (no el pico histórico: otros modelos ya cargados no cuentan)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # sin /proc (macOS): solo queda el pico, en bytes
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024)
+
+def default_rss_ceiling_mb() -> float:
+    """SENTIMENT_AUTOTUNE_RSS_MB o, si no, el 80% de la RAM del host."""
+    env = os.getenv("SENTIMENT_AUTOTUNE_RSS_MB")
+    if env:
+        return float(env)
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return 0.8 * int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 4096.0
+
+# ---------------------------------------------------------
+# PERSISTENCIA (JSON por host y modelo)
+# ---------------------------------------------------------
+def _load(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save(path: str, key: str, entry: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    data = _load(path)
+    data[key] = entry
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+# ---------------------------------------------------------
+# PROBING
+# ---------------------------------------------------------
+def _probe(run: Callable[[List[Any], int], Any], samples: Sequence[Any], bs: int) -> float:
+    """Throughput (items/s) de run() con lotes de bs, repitiendo hasta PROBE_SECONDS."""
+    items = [samples[i % len(samples)] for i in range(2 * bs)]
+    run(items[:bs], bs)  # warm-up (asignaciones del tamaño nuevo)
+    done = 0
+    t0 = time.perf_counter()
+    while True:
+        run(items, bs)
+        done += len(items)
+        elapsed = time.perf_counter() - t0
+        if elapsed >= PROBE_SECONDS:
+            return done / elapsed
+
+def pick_knee(throughputs: Dict[int, float], tolerance: float = KNEE_TOLERANCE) -> int:
+    """El lote más chico cuyo throughput está a ≤ tolerance del mejor."""
+    best = max(throughputs.values())
+    return min(bs for bs, t in throughputs.items() if t >= (1 - tolerance) * best)
+
+def autotune_batch_size(
+    model_key: str,
+    run: Callable[[List[Any], int], Any],
+    samples: Sequence[Any],
+    *,
+    candidates: Sequence[int] = CANDIDATES,
+    rss_ceiling_mb: Optional[float] = None,
+    store_path: str = DEFAULT_STORE,
+    fallback: int = 32,
+) -> int:
+    """
+    Devuelve el tamaño de lote para model_key en este host.
+    Si ya está guardado lo reutiliza; si no, llama run(items, batch_size) con
+    lotes crecientes sobre `samples`, corta cuando el throughput deja de crecer
+    o cuando el RSS estimado del siguiente lote (crecimiento por ítem medido en
+    los anteriores) pasaría el techo, y persiste la elección.
+    """
+    key = f"{_host_key()}|{model_key}"
+    with _LOCK:
+        cached = _load(store_path).get(key)
+        if cached:
+            return int(cached["batch_size"])
+        if not samples:
+            return fallback
+
+        ceiling = rss_ceiling_mb or default_rss_ceiling_mb()
+        baseline = _rss_mb()
+        per_item = 0.0  # MB por ítem del lote, el mayor observado
+        throughputs: Dict[int, float] = {}
+        stopped = "max_candidate"
+        for bs in candidates:
+            # se estima antes de correr: un lote que no cabe no se llega a probar
+            if throughputs and baseline + per_item * bs > ceiling:
+                stopped = "rss_ceiling"
+                break
+            try:
+                tput = _probe(run, samples, bs)
+            except (MemoryError, RuntimeError) as e:  # OOM de torch = RuntimeError
+                stopped = f"error:{type(e).__name__}"
+                break
+            rss = _rss_mb()
+            per_item = max(per_item, (rss - baseline) / bs)
+            if rss > ceiling and throughputs:
+                stopped = "rss_ceiling"
+                break
+            throughputs[bs] = tput
+            # sin mejora en dos pasos seguidos: ya pasamos el codo
+            ordered = [throughputs[b] for b in sorted(throughputs)]
+            if len(ordered) >= 3 and ordered[-1] <= ordered[-2] <= ordered[-3]:
+                stopped = "plateau"
+                break
+
+        if not throughputs:
+            return fallback
+        chosen = pick_knee(throughputs)
+        _save(store_path, key, {
+            "batch_size": chosen,
+            "throughput": {str(b): round(t, 2) for b, t in throughputs.items()},
+            "rss_ceiling_mb": round(ceiling, 1),
+            "baseline_rss_mb": round(baseline, 1),
+            "rss_mb": round(_rss_mb(), 1),
+            "rss_per_item_mb": round(per_item, 3),
+            "stopped": stopped,
+            "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+        print(f"   🎛️ [Autotune] {model_key}: batch_size={chosen} ({stopped})")
+        return chosen
@@ -0,0 +1,246 @@
+# Archivo: src/utils/lang_id.py
+"""
+Identificación de idioma ES/EN por n-gramas de caracteres, vectorizada por lote.
+Todo el lote se concatena en un solo buffer de bytes y NumPy calcula los
+3- y 4-gramas, les suma el peso (log-odds EN vs ES) y reduce por texto: no hay
+bucle de Python por carácter ni por n-grama. Cientos de miles de textos
+cortos por segundo en un núcleo (ver --bench).
+
+score > 0 → "en", score < 0 → "es"; con poca evidencia (|score| < margen)
+devuelve el default (None = desconocido, el ruteo de sentimiento cae a ES).
+"""
+from __future__ import annotations
+import json
+import os
+import re
+import time
+from itertools import islice
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+LANGS = ("en", "es")
+# Margen mínimo de log-odds para decidir (≈ dos rasgos fuertes a favor)
+MIN_MARGIN = float(os.getenv("LANGID_MIN_MARGIN", "2.0"))
+# Post "mixto": cada idioma cubre al menos esta fracción del texto con evidencia
+MIXED_MIN_SHARE = float(os.getenv("LANGID_MIXED_MIN_SHARE", "0.2"))
+
+# ---------------------------------------------------------
+# ALFABETO REDUCIDO (30 símbolos → tablas densas de 3- y 4-gramas)
+# ---------------------------------------------------------
+# 0 = separador (espacio, puntuación, dígitos), 1..26 = a-z, 27 = apóstrofo,
+# 28 = byte no ASCII (letras acentuadas, emojis...), 29 = frontera entre textos
+_N = 30
+_SEP, _APOS, _OTHER, _EDGE = 0, 27, 28, 29
+_SYM = np.zeros(256, dtype=np.int32)
+for _c in range(ord("a"), ord("z") + 1):
+    _SYM[_c] = _c - ord("a") + 1
+_SYM[ord("'")] = _APOS
+_SYM[0x80:] = _OTHER
+_SYM[0] = _EDGE
+
+def _code(gram: str) -> int:
+    code = 0
+    for ch in gram:
+        code = code * _N + int(_SYM[ord(ch)])
+    return code
+
+# Rasgos (espacio = borde de palabra) con su peso de log-odds: positivo = inglés,
+# negativo = español. Palabras funcionales y terminaciones frecuentes en un idioma
+# y raras en el otro; 2 fuerte, 1 medio. Los de 5+ caracteres se reparten en sus 4-gramas.
+_FEATURES = {
+    # inglés
+    " the": 2.0, "the ": 2.0, " and": 2.0, "and ": 1.0, " of ": 2.0, " to ": 2.0, " you": 2.0,
+    " is ": 2.0, " it ": 2.0, " was": 2.0, " wha": 2.0, " whe": 2.0, "with": 2.0, "ing ": 2.0,
+    "ght": 2.0, "n't": 2.0, "'s ": 1.0, "'m ": 2.0, "'re": 2.0, "'ve": 2.0, " i ": 2.0,
+    " my ": 2.0, " but": 2.0, " are": 2.0, " have": 2.0, "just": 2.0, "ould": 2.0, " tha": 2.0,
+    " thi": 2.0, "th ": 1.0, "ly ": 1.0, " for": 1.0, " be ": 2.0, " at ": 2.0, " so ": 1.0,
+    " if ": 2.0, " all": 1.0, " can": 1.0, " don": 1.0, "ver ": 1.0, "ow ": 1.0, "ck ": 1.0,
+    "sh ": 1.0, "eed": 1.0, "tion": 1.0, "ity ": 1.0, "ness": 1.5, " lol": 1.0, " tbh": 1.0,
+    # español
+    " de ": -2.0, " la ": -2.0, " el ": -2.0, " que": -2.0, "que ": -2.0, " los ": -2.0,
+    " las ": -2.0, " y ": -2.0, " por": -2.0, "por ": -2.0, "pero": -2.0, " muy": -2.0,
+    " del ": -2.0, " una": -2.0, "una ": -2.0, " un ": -2.0, " es ": -2.0, " en ": -2.0,
+    "con ": -2.0, " se ": -2.0, " lo ": -2.0, " ya ": -2.0, "hay ": -2.0, "esto": -1.0,
+    "esta": -1.0, "ente": -1.0, "cion": -1.5, "idad": -2.0, "ado ": -1.5, "ada ": -1.5,
+    "ido ": -1.0, "ida ": -1.0, "mos ": -1.5, "ndo ": -1.5, "aba ": -1.0, "lla ": -1.0,
+    "llo ": -1.0, "os ": -0.5, " mi ": -1.5, " tu ": -1.5, " te ": -1.5, " le ": -1.5,
+    " al ": -1.5, " su ": -1.5, " si ": -1.0, "jaja": -2.0, "nunca": -2.0, "siempre": -2.0,
+}
+
+def _build_tables() -> Tuple[np.ndarray, np.ndarray]:
+    tri = np.zeros(_N ** 3, dtype=np.float32)
+    quad = np.zeros(_N ** 4, dtype=np.float32)
+    for gram, w in _FEATURES.items():
+        if len(gram) == 3:
+            tri[_code(gram)] += w
+        else:
+            parts = [gram[k:k + 4] for k in range(len(gram) - 3)]
+            for q in parts:
+                quad[_code(q)] += w / len(parts)
+    return tri, quad
+
+_TRI, _QUAD = _build_tables()
+
+# Pesos por byte: acentos, ñ, ¿ ¡ (bytes de continuación UTF-8 de C3/C2) y letras
+# casi ausentes del español (w, k)
+_UNI = np.zeros(256, dtype=np.float32)
+for _b, _w in {0xA1: -1.5, 0xA9: -1.5, 0xAD: -1.5, 0xB3: -1.5, 0xBA: -1.5,  # á é í ó ú
+               0xB1: -3.0, 0xBF: -3.0,                                       # ñ ¿
+               ord("w"): 0.8, ord("k"): 0.5}.items():
+    _UNI[_b] = _w
+
+# ---------------------------------------------------------
+# PUNTUACIÓN VECTORIZADA
+# ---------------------------------------------------------
+def scores(texts: Sequence[str]) -> np.ndarray:
+    """Log-odds EN vs ES de cada texto (float32, mismo orden)."""
+    n = len(texts)
+    if not n:
+        return np.zeros(0, dtype=np.float32)
+    # cada texto va entre espacios (bordes de palabra) y separado por \x00
+    parts = [(" " + (t or "").lower() + " ").encode("utf-8", errors="ignore") for t in texts]
+    lengths = np.fromiter(map(len, parts), dtype=np.int64, count=n)
+    starts = np.zeros(n, dtype=np.int64)
+    np.cumsum(lengths[:-1] + 1, out=starts[1:])
+    buf = np.frombuffer(b"\x00".join(parts) + b"\x00\x00\x00", dtype=np.uint8)
+
+    sym = _SYM[buf]
+    codes3 = (sym[:-2] * _N + sym[1:-1]) * _N + sym[2:]
+    codes4 = codes3[:-1] * _N + sym[3:]
+    # los n-gramas que cruzan una frontera (\x00) caen en celdas con peso 0
+    total = np.add.reduceat(_TRI[codes3], starts)
+    total += np.add.reduceat(_QUAD[codes4], starts)
+    total += np.add.reduceat(_UNI[buf], starts)
+    return total
+
+def detect_batch(texts: Sequence[str], default: Optional[str] = None,
+                 min_margin: float = MIN_MARGIN) -> List[Optional[str]]:
+    s = scores(texts)
+    out = np.where(s >= min_margin, "en", np.where(s <= -min_margin, "es", ""))
+    return [l or default for l in out.tolist()]
+
+def detect(text: str, default: Optional[str] = None) -> Optional[str]:
+    return detect_batch([text], default)[0]
+
+# ---------------------------------------------------------
+# POSTS MIXTOS (por oración)
+# ---------------------------------------------------------
+_SEGMENT = re.compile(r"(?<=[\.\!\?\n])\s+")
+
+def detect_posts(texts: Sequence[str], default: Optional[str] = None,
+                 min_margin: float = MIN_MARGIN) -> List[Tuple[Optional[str], bool]]:
+    """
+    (idioma, mixto) por post. Se puntúa cada oración en el mismo lote vectorizado:
+    el idioma del post sale de la suma de sus oraciones y es "mixto" si cada
+    idioma ocupa al menos MIXED_MIN_SHARE de los caracteres con evidencia.
+    """
+    segs: List[str] = []
+    owner: List[int] = []
+    for i, t in enumerate(texts):
+        pieces = _SEGMENT.split(t or "") or [""]
+        segs.extend(pieces)
+        owner.extend([i] * len(pieces))
+    s = scores(segs)
+    owner_a = np.asarray(owner, dtype=np.int64)
+    seg_len = np.fromiter(map(len, segs), dtype=np.float64, count=len(segs))
+
+    n = len(texts)
+    total = np.bincount(owner_a, weights=s, minlength=n)
+    en_chars = np.bincount(owner_a, weights=seg_len * (s >= min_margin), minlength=n)
+    es_chars = np.bincount(owner_a, weights=seg_len * (s <= -min_margin), minlength=n)
+    decided = np.maximum(en_chars + es_chars, 1.0)
+    mixed = (np.minimum(en_chars, es_chars) / decided) >= MIXED_MIN_SHARE
+
+    out: List[Tuple[Optional[str], bool]] = []
+    for tot, mx in zip(total.tolist(), mixed.tolist()):
+        lang = "en" if tot >= min_margin else "es" if tot <= -min_margin else default
+        out.append((lang, bool(mx)))
+    return out
+
+# ---------------------------------------------------------
+# ARCHIVOS COMPLETOS (JSONL)
+# ---------------------------------------------------------
+def annotate_records(records: List[Dict], field: str = "text_norm", keep_hint: bool = True) -> List[Dict]:
+    """
+    Escribe "lang" (y "lang_mixed" en posts mixtos) en cada registro, en un solo lote.
+    Con keep_hint, si no hay evidencia se conserva el "lang" que ya traía
+    (p. ej. el search_lang del colector).
+    """
+    texts = [r.get(field) or r.get("text") or "" for r in records]
+    for r, (lang, mixed) in zip(records, detect_posts(texts)):
+        r["lang"] = lang or (r.get("lang") if keep_hint else None)
+        if mixed:
+            r["lang_mixed"] = True
+        else:
+            r.pop("lang_mixed", None)
+    return records
+
+def annotate_file(input_path: str, output_path: str, field: str = "text_norm",
+                  window: int = 50000) -> Dict[str, int]:
+    """Anota un JSONL entero por ventanas de `window` líneas (memoria acotada)."""
+    counts = {"posts": 0, "en": 0, "es": 0, "unknown": 0, "mixed": 0}
+    tmp = f"{output_path}.tmp{os.getpid()}"
+    with open(input_path, "r", encoding="utf-8") as fin, open(tmp, "w", encoding="utf-8") as fout:
+        while True:
+            lines = [l for l in islice(fin, window)]
+            if not lines:
+                break
+            records = []
+            for line in lines:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+            for r in annotate_records(records, field):
+                counts["posts"] += 1
+                counts[r.get("lang") if r.get("lang") in LANGS else "unknown"] += 1
+                counts["mixed"] += bool(r.get("lang_mixed"))
+                fout.write(json.dumps(r, ensure_ascii=False) + "\n")
+    os.replace(tmp, output_path)
+    return counts
+
+# ---------------------------------------------------------
+# BENCHMARK
+# ---------------------------------------------------------
+_BENCH = {
+    "es": ["no me gusta nada cómo quedó el partido de ayer", "qué buena noticia, por fin bajan los precios",
+           "la verdad es que el servicio fue muy lento pero la comida estaba rica",
+           "alguien sabe dónde puedo comprar esto en Quito?"],
+    "en": ["this is the worst update they have ever shipped", "I love how the new phone looks, great job",
+           "honestly the food was fine but the service was really slow",
+           "does anyone know where I can buy this in London?"],
+}
+
+def bench(n: int = 1_000_000, batch: int = 100_000) -> Dict[str, float]:
+    pool = [(t, l) for l, ts in _BENCH.items() for t in ts]
+    texts = [pool[i % len(pool)][0] for i in range(n)]
+    gold = [pool[i % len(pool)][1] for i in range(n)]
+    t0 = time.perf_counter()
+    preds: List[Optional[str]] = []
+    for i in range(0, n, batch):
+        preds.extend(detect_batch(texts[i:i + batch]))
+    elapsed = time.perf_counter() - t0
+    return {
+        "texts": n,
+        "seconds": round(elapsed, 3),
+        "texts_per_min": round(60 * n / max(1e-9, elapsed)),
+        "accuracy": round(sum(p == g for p, g in zip(preds, gold)) / n, 4),
+    }
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Identificación de idioma ES/EN por lotes (n-gramas de caracteres)")
+    ap.add_argument("--in", dest="input_path", help="JSONL de posts o chunks")
+    ap.add_argument("--out", dest="output_path", help="JSONL anotado (default: sobrescribe --in)")
+    ap.add_argument("--field", default="text_norm", help="Campo de texto (fallback: text)")
+    ap.add_argument("--bench", type=int, default=0, help="Mide N textos cortos sintéticos y sale")
+    args = ap.parse_args()
+
+    if args.bench:
+        print(json.dumps(bench(args.bench), indent=2))
+    elif args.input_path:
+        stats = annotate_file(args.input_path, args.output_path or args.input_path, args.field)
+        print(f"✅ Idioma anotado → {args.output_path or args.input_path} | {stats}")
+    else:
+        ap.error("--in o --bench")
@@ -27,6 +27,18 @@ class TestSentimentAgent(unittest.TestCase):
         res = self.agent.analyze("Hola mundo", lang_hint=None)
         self.assertEqual(res["source"], "model_es_finetuned")
 
+    def test_batch_matches_single(self):
+        """Verificar que analyze_batch respeta orden, ruteo y esquema de analyze"""
+        texts = ["I love this park in Quito", "Odio el tráfico de la Av. Occidental", "", "Hola mundo"]
+        hints = ["en", "es", "es", None]
+        batch = self.agent.analyze_batch(texts, hints, batch_size=2)
+        self.assertEqual(len(batch), len(texts))
+        for text, hint, res in zip(texts, hints, batch):
+            single = self.agent.analyze(text, lang_hint=hint)
+            self.assertEqual(res["source"], single["source"])
+            self.assertEqual(res["label"], single["label"])
+            self.assertAlmostEqual(res["confidence"], single["confidence"], places=4)
+
     # --- 2. PRUEBAS DEL AGREGADOR (Matemáticas) ---
     def test_aggregation_logic(self):
         """
@@ -50,6 +62,68 @@ class TestSentimentAgent(unittest.TestCase):
         result = _length_weighted(fake_chunks)
         self.assertEqual(result["label_final"], "positive")
 
+    def test_aggregator_modes_match(self):
+        """Los modos memory, grouped y spill producen la misma salida, agrupada o no"""
+        import json, os, random, tempfile
+        from src.agents.sentiment.sentiment_aggregator import run_aggregator
+        rng = random.Random(5)
+        rows = []
+        for p in range(300):
+            for i in range(rng.randint(1, 6)):
+                start = rng.randint(0, 400)
+                rows.append({
+                    "chunk_id": f"p{p}_c{i}", "parent_post_id": f"p{p}", "chunk_index": i,
+                    "text": "x" * rng.randint(1, 50), "span_tokens": [start, start + rng.randint(1, 300)],
+                    "sentiment": {"label": rng.choice(["negative", "neutral", "positive"]),
+                                  "confidence": round(rng.random(), 4)},
+                })
+        shuffled = rows[:]
+        rng.shuffle(shuffled)
+
+        def run(tmp, data, mode):
+            inp, out = os.path.join(tmp, f"in_{mode}.jsonl"), os.path.join(tmp, f"out_{mode}.jsonl")
+            with open(inp, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(r) + "\n" for r in data)
+            run_aggregator(inp, out, mode=mode, spill_buckets=7)
+            with open(out, "r", encoding="utf-8") as f:
+                return f.read()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for data in (rows, shuffled):
+                ref = run(tmp, data, "memory")
+                self.assertTrue(ref)
+                self.assertEqual(run(tmp, data, "spill"), ref)
+                self.assertEqual(run(tmp, data, "auto"), ref)
+                if data is rows:
+                    self.assertEqual(run(tmp, data, "grouped"), ref)
+                else:
+                    with self.assertRaises(ValueError):
+                        run(tmp, data, "grouped")
+
+    # --- CACHÉ DE SENTIMIENTO ---
+    def test_cache_lru_and_counters(self):
+        """La caché expulsa la entrada menos usada, cuenta hits/misses y separa revisiones"""
+        import os, tempfile, time
+        from src.agents.sentiment.sentiment_cache import SentimentCache
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = SentimentCache(os.path.join(tmp, "c.sqlite"), max_entries=3)
+            keys = {t: SentimentCache.make_key(t, "roberta_es", "rev1") for t in "abcd"}
+            for t in "abc":
+                cache.put(keys[t], {"label": t})
+                time.sleep(0.01)
+            self.assertEqual(cache.get(keys["a"]), {"label": "a"})  # "a" pasa a ser la más reciente
+            time.sleep(0.01)
+            cache.put(keys["d"], {"label": "d"})
+            self.assertIsNone(cache.get(keys["b"]))
+            self.assertEqual(set(cache.get_many(keys.values())), {keys["a"], keys["c"], keys["d"]})
+            stats = cache.stats()
+            self.assertEqual((stats["hits"], stats["misses"], stats["evictions"], stats["entries"]), (4, 2, 1, 3))
+
+            # otra revisión del modelo = otra clave (no se reutiliza el resultado viejo)
+            self.assertNotEqual(SentimentCache.make_key("a", "roberta_es", "rev2"), keys["a"])
+            self.assertIsNone(cache.get(SentimentCache.make_key("a", "roberta_es", "rev2")))
+            cache.close()
+
     # --- 3. PRUEBAS DEL CHUNKER ---
     def test_chunking_split(self):
         """Verificar que el chunker no rompa oraciones si caben"""
@@ -59,5 +133,100 @@ class TestSentimentAgent(unittest.TestCase):
         # Verificar que devuelve tuplas (texto, start, end)
         self.assertEqual(len(chunks[0]), 3) 
 
+    def test_chunking_matches_legacy(self):
+        """El chunker lineal produce los mismos chunks que la versión original"""
+        import random
+        from src.agents.sentiment.chunker_bench import chunk_text_legacy, synthetic_post
+        rng = random.Random(7)
+        for _ in range(30):
+            post = synthetic_post(rng, rng.randint(5, 1500))
+            self.assertEqual(
+                chunk_text(post, max_tokens=60, overlap=15),
+                chunk_text_legacy(post, max_tokens=60, overlap=15),
+            )
+
+    def test_subword_chunks_fit_budget(self):
+        """Con tokenizer, todo chunk cabe en la ventana del modelo (también URLs/emojis/hashtags enormes)"""
+        text = ("Great game tonight in Quito! " * 30 + "https://example.com/" + "a1b2c3" * 150
+                + " " + "😂" * 200 + " #" + "EcuadorPresente" * 60 + " y nada más que decir.")
+        for lang in ("en", "es"):
+            tok, budget = self.agent.tokenizer_for(lang)
+            chunks = chunk_text(text, max_tokens=budget, overlap=16, tokenizer=tok)
+            self.assertTrue(len(chunks) > 1)
+            for c, _, _ in chunks:
+                self.assertLessEqual(len(tok(c.strip(), add_special_tokens=False)["input_ids"]), budget)
+
+    # --- 4. IDENTIFICACIÓN DE IDIOMA ---
+    def test_lang_id_batch(self):
+        """El detector por n-gramas separa ES/EN y marca los posts mixtos"""
+        from src.utils.lang_id import detect_batch, detect_posts
+        self.assertEqual(
+            detect_batch(["la seguridad en Guayaquil está peor que nunca",
+                          "I don't know what to think about this", "ok"]),
+            ["es", "en", None],
+        )
+        mixed = "Me encanta este lugar, es lo mejor de la ciudad. The food was amazing and the staff were great!"
+        self.assertTrue(detect_posts([mixed])[0][1])
+        self.assertFalse(detect_posts(["Solo español aquí. Y nada más que decir de esto."])[0][1])
+
+    # --- 5. CHECKPOINTS DEL RUNNER ---
+    def test_resume_with_other_worker_count(self):
+        """Reanudar con otro --workers no duplica registros ni deja partes viejas"""
+        import glob, json, os, shutil, tempfile
+        from src.agents.sentiment.sentiment_checkpoint import CheckpointedWriter, iter_jsonl_offsets
+        from src.agents.sentiment.sentiment_runner import _drop_stale_parts, _shard_layout
+
+        def score(writer, inp, end, limit=None):
+            rows = writer.pending(iter_jsonl_offsets(inp, writer.offset, end))
+            for n, (off, rec) in enumerate(rows):
+                if limit is not None and n >= limit:
+                    writer.close(finished=False)  # "muere" a mitad del shard
+                    return
+                writer.write([{"chunk_id": rec["chunk_id"]}], off)
+            writer.close()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            inp, out = os.path.join(tmp, "chunks.jsonl"), os.path.join(tmp, "out.jsonl")
+            with open(inp, "w", encoding="utf-8") as f:
+                for i in range(400):
+                    f.write(json.dumps({"chunk_id": f"c{i}", "text": "x" * (i % 7)}) + "\n")
+
+            for resume, workers, limit in ((False, 4, 55), (True, 2, None)):
+                ranges, reusable = _shard_layout(inp, out, workers, resume)
+                parts = [f"{out}.part{i:03d}" for i in range(len(ranges))]
+                _drop_stale_parts(out, parts)
+                for part, (s, e) in zip(parts, ranges):
+                    w = CheckpointedWriter(part, inp, resume=resume and reusable, start=s, end=e, every=10)
+                    score(w, inp, e, limit)
+                if not resume:
+                    # copia de una parte interrumpida, para probar un checkpoint de otro rango
+                    stale = os.path.join(tmp, "stale.jsonl")
+                    shutil.copy(parts[1], stale)
+                    shutil.copy(parts[1] + ".ckpt", stale + ".ckpt")
+
+            self.assertEqual(len(ranges), 4)  # se reutilizó el reparto original
+            ids = [rec["chunk_id"] for part in parts for _, rec in iter_jsonl_offsets(part)]
+            self.assertEqual(len(ids), 400)
+            self.assertEqual(len(set(ids)), 400)
+
+            # un checkpoint de otro rango descarta la parte en vez de mezclarla
+            w = CheckpointedWriter(stale, inp, resume=True, start=0, end=None)
+            self.assertEqual(w.written, 0)
+            w.close()
+            _drop_stale_parts(out, parts[:1])
+            self.assertEqual(sorted(glob.glob(out + ".part*")), [parts[0]])
+
+    # --- 6. MUESTREO ESTRATIFICADO ---
+    def test_sample_allocation_is_exact(self):
+        """La muestra tiene exactamente el tamaño objetivo aunque haya miles de estratos"""
+        from src.agents.sentiment.sentiment_sampling import MIN_PER_STRATUM, allocate, collapse_strata
+        rows = {f"s{i % 900}|{'es' if i % 3 else 'en'}|2024-W{i % 40:02d}": [0] * (1 + i % 5) for i in range(4000)}
+        strata = collapse_strata(rows, 383)
+        alloc = allocate({h: len(v) for h, v in strata.items()}, 383)
+        self.assertEqual(sum(alloc.values()), 383)
+        self.assertEqual(sum(len(v) for v in strata.values()), sum(len(v) for v in rows.values()))
+        small = [h for h, k in alloc.items() if k < MIN_PER_STRATUM]
+        self.assertLessEqual(len(small), 1)  # solo el estrato residual "*|*|*" puede quedar corto
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,8 +1,12 @@
 # train_sentiment.py
 import os
+import json
+import time
+import hashlib
+import argparse
 import numpy as np
 import evaluate
-from datasets import load_dataset
+from datasets import load_dataset, load_from_disk
 from transformers import (
     AutoTokenizer,
     AutoModelForSequenceClassification,
@@ -11,41 +15,113 @@ from transformers import (
     DataCollatorWithPadding
 )
 
+from src.agents.sentiment.sentiment_hf import _model_revision
+
 # --- CONFIGURACIÓN ---
 MODEL_ID = "pysentimiento/robertuito-sentiment-analysis"
 DATASET_ID = "cardiffnlp/tweet_sentiment_multilingual"
 SUBSET = "spanish"
 OUTPUT_DIR = "./models/robertuito-finetuned" # Donde se guardará tu nuevo modelo
+MAX_LENGTH = 128
+# Dataset tokenizado en disco: no se re-tokeniza en cada corrida
+TOKENIZED_CACHE_DIR = "./data/cache/tokenized"
 # ---------------------
 
-def main():
-    print(f"🚀 Iniciando Fine-Tuning de {MODEL_ID} en {SUBSET}...")
+# Modos:
+#  - "legacy": padding fijo a MAX_LENGTH y Trainer por defecto (como antes)
+#  - "fast":   padding dinámico por lote (DataCollatorWithPadding), lotes agrupados
+#              por longitud, tokenización multi-proceso y cacheada por revisión del tokenizer
+MODES = ("legacy", "fast")
+
+
+class CountingCollator:
+    """Envuelve al collator y cuenta tokens reales vs. tokens con padding que ve el modelo."""
+
+    def __init__(self, collator):
+        self.collator = collator
+        self.real = 0
+        self.padded = 0
+
+    def __call__(self, features):
+        batch = self.collator(features)
+        self.padded += int(batch["input_ids"].numel())
+        self.real += int(batch["attention_mask"].sum())
+        return batch
+
+
+def _tokenized_cache_path(split_ds, tokenizer, mode):
+    ident = {
+        "tokenizer": tokenizer.name_or_path,
+        "revision": _model_revision(tokenizer.name_or_path),
+        "vocab": len(tokenizer),
+        "dataset": split_ds._fingerprint,
+        "max_length": MAX_LENGTH,
+        "mode": mode,
+    }
+    key = hashlib.sha1(json.dumps(ident, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(TOKENIZED_CACHE_DIR, key)
+
+
+def tokenize_split(split_ds, tokenizer, mode, num_proc=1, use_cache=True):
+    # Sin caché tampoco vale el caché por fingerprint de `datasets`: se tokeniza de verdad
+    from_cache = None if use_cache else False
+    if mode == "legacy":
+        def tokenize_function(examples):
+            return tokenizer(examples["text"], truncation=True, padding="max_length", max_length=MAX_LENGTH)
+        return split_ds.map(tokenize_function, batched=True, load_from_cache_file=from_cache)
+
+    path = _tokenized_cache_path(split_ds, tokenizer, mode)
+    if use_cache and os.path.isdir(path):
+        print(f"   ♻️ Tokenizado desde caché: {path}")
+        return load_from_disk(path)
+
+    def tokenize_function(examples):
+        # Sin padding: lo hace el collator por lote. "length" alimenta group_by_length.
+        return tokenizer(examples["text"], truncation=True, max_length=MAX_LENGTH, return_length=True)
+
+    tokenized = split_ds.map(tokenize_function, batched=True, num_proc=num_proc,
+                             remove_columns=[c for c in split_ds.column_names if c != "label"],
+                             load_from_cache_file=from_cache)
+    if use_cache:
+        tmp = f"{path}.tmp{os.getpid()}"
+        tokenized.save_to_disk(tmp)
+        os.replace(tmp, path)
+        tokenized = load_from_disk(path)  # memory-mapped desde el caché
+    return tokenized
+
+
+def run_training(mode="fast", num_proc=None, max_steps=-1, max_train_samples=None,
+                 save=True, use_cache=True):
+    num_proc = num_proc or min(4, os.cpu_count() or 1)
+    print(f"🚀 Iniciando Fine-Tuning de {MODEL_ID} en {SUBSET} (modo {mode})...")
+    t_start = time.perf_counter()
 
     # 1. Cargar Dataset
     # Usamos 'train' para entrenar y 'test' para validar
     print("📥 Cargando dataset...")
     dataset = load_dataset(DATASET_ID, SUBSET, trust_remote_code=True)
-    
+
     # El dataset tiene 'train', 'validation', 'test'. Usaremos train y validation.
     train_ds = dataset["train"]
     eval_ds = dataset["validation"] # O usamos 'test' si validation es muy pequeño
+    if max_train_samples:
+        train_ds = train_ds.select(range(min(max_train_samples, len(train_ds))))
 
     # 2. Tokenizador
     print("📚 Cargando tokenizador...")
     tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
 
-    def tokenize_function(examples):
-        return tokenizer(examples["text"], truncation=True, padding="max_length", max_length=128)
-
     print("⚙️ Tokenizando datos (esto puede tardar un poco)...")
-    tokenized_train = train_ds.map(tokenize_function, batched=True)
-    tokenized_eval = eval_ds.map(tokenize_function, batched=True)
+    t0 = time.perf_counter()
+    tokenized_train = tokenize_split(train_ds, tokenizer, mode, num_proc, use_cache)
+    tokenized_eval = tokenize_split(eval_ds, tokenizer, mode, num_proc, use_cache)
+    tokenize_s = time.perf_counter() - t0
 
     # 3. Modelo
     # Mapeo: 0: negative, 1: neutral, 2: positive
     print("🧠 Cargando modelo base...")
     model = AutoModelForSequenceClassification.from_pretrained(
-        MODEL_ID, 
+        MODEL_ID,
         num_labels=3
     )
 
@@ -64,21 +140,32 @@ def main():
         }
 
     # 5. Configuración del Entrenamiento (Hyperparámetros)
+    evaluating = max_steps < 0
+    fast = {}
+    if mode == "fast":
+        fast = dict(
+            group_by_length=True,         # lotes de longitudes parecidas → menos padding
+            length_column_name="length",  # precalculada al tokenizar
+            dataloader_num_workers=0,     # el collator es barato; evita procesos extra en CPU
+        )
     training_args = TrainingArguments(
         output_dir=OUTPUT_DIR,
         learning_rate=2e-5,           # Tasa de aprendizaje baja para no romper el modelo
         per_device_train_batch_size=16,
         per_device_eval_batch_size=16,
         num_train_epochs=3,           # 3 pasadas completas por los datos
+        max_steps=max_steps,
         weight_decay=0.01,
-        eval_strategy="epoch",  # Evaluar al final de cada época
-        save_strategy="epoch",        # Guardar checkpoint al final de cada época
-        load_best_model_at_end=True,  # Al final, quedarse con el mejor checkpoint
+        eval_strategy="epoch" if evaluating else "no",  # Evaluar al final de cada época
+        save_strategy="epoch" if evaluating else "no",  # Guardar checkpoint al final de cada época
+        load_best_model_at_end=evaluating,  # Al final, quedarse con el mejor checkpoint
         metric_for_best_model="macro_f1",
         push_to_hub=False,
+        report_to=[],
+        **fast,
     )
 
-    data_collator = DataCollatorWithPadding(tokenizer=tokenizer)
+    data_collator = CountingCollator(DataCollatorWithPadding(tokenizer=tokenizer))
 
     trainer = Trainer(
         model=model,
@@ -93,18 +180,85 @@ def main():
     # 6. ¡Entrenar!
     print("\n🔥 ¡EMPEZANDO ENTRENAMIENTO! 🔥")
     print("Ve por un café, esto tomará unos minutos (o más si no tienes GPU)...")
-    trainer.train()
+    train_out = trainer.train()
+    train_s = train_out.metrics.get("train_runtime", 0.0)
+
+    # Tokens vistos por el collator (sin evaluación en --report; en una corrida normal
+    # incluye también los lotes de evaluación de cada época)
+    train_real, train_padded = data_collator.real, data_collator.padded
+    report = {
+        "mode": mode,
+        "num_proc": num_proc if mode == "fast" else 1,
+        "train_samples": len(tokenized_train),
+        "steps": train_out.global_step,
+        "tokenize_s": round(tokenize_s, 2),
+        "train_s": round(train_s, 2),
+        "real_tokens": train_real,
+        "padded_tokens": train_padded,
+        "padding_efficiency": round(train_real / train_padded, 4) if train_padded else 1.0,
+        "real_tokens_per_s": round(train_real / train_s, 1) if train_s else 0.0,
+        "samples_per_s": train_out.metrics.get("train_samples_per_second"),
+    }
+
+    if evaluating:
+        # 7. Evaluar resultado final
+        print("\n📊 Evaluando modelo final...")
+        metrics = trainer.evaluate()
+        print(metrics)
+        report["eval"] = metrics
+
+    if save:
+        # 8. Guardar modelo final
+        print(f"\n💾 Guardando modelo final en: {OUTPUT_DIR}")
+        trainer.save_model(OUTPUT_DIR)
+        tokenizer.save_pretrained(OUTPUT_DIR)
+        print("✅ ¡Listo! Modelo guardado.")
+
+    report["wall_s"] = round(time.perf_counter() - t_start, 2)
+    return report
+
+
+def compare_modes(max_steps, max_train_samples, num_proc):
+    """Mismos pasos en legacy y fast (sin guardar): tiempo total y tokens/s en esta máquina."""
+    runs = {}
+    for mode in MODES:
+        # sin caché en la primera medición de fast: se mide el costo real de tokenizar
+        runs[mode] = run_training(mode, num_proc, max_steps, max_train_samples,
+                                  save=False, use_cache=False)
+    legacy, fast = runs["legacy"], runs["fast"]
+    return {
+        "cpu_count": os.cpu_count(),
+        "runs": runs,
+        "speedup_wall": round(legacy["wall_s"] / fast["wall_s"], 2) if fast["wall_s"] else None,
+        "speedup_train": round(legacy["train_s"] / fast["train_s"], 2) if fast["train_s"] else None,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fine-tuning de RoBERTuito para sentimiento en español")
+    ap.add_argument("--mode", choices=MODES, default="fast")
+    ap.add_argument("--num_proc", type=int, default=None, help="Procesos para tokenizar (default: min(4, CPUs))")
+    ap.add_argument("--no_cache", action="store_true", help="Re-tokeniza aunque exista el caché en disco")
+    ap.add_argument("--report", action="store_true",
+                    help="Compara legacy vs fast con --max_steps pasos (no guarda el modelo)")
+    ap.add_argument("--max_steps", type=int, default=None,
+                    help="Tope de pasos de entrenamiento (en --report, por modo; default 50 ahí, sin tope si no)")
+    ap.add_argument("--max_train_samples", type=int, default=None)
+    ap.add_argument("--report_out", default=None, help="Ruta JSON del reporte")
+    args = ap.parse_args()
 
-    # 7. Evaluar resultado final
-    print("\n📊 Evaluando modelo final...")
-    metrics = trainer.evaluate()
-    print(metrics)
+    if args.report:
+        report = compare_modes(args.max_steps or 50, args.max_train_samples, args.num_proc)
+    else:
+        report = run_training(args.mode, args.num_proc, max_steps=args.max_steps or -1,
+                              max_train_samples=args.max_train_samples, use_cache=not args.no_cache)
 
-    # 8. Guardar modelo final
-    print(f"\n💾 Guardando modelo final en: {OUTPUT_DIR}")
-    trainer.save_model(OUTPUT_DIR)
-    tokenizer.save_pretrained(OUTPUT_DIR)
-    print("✅ ¡Listo! Modelo guardado.")
+    text = json.dumps(report, indent=2, ensure_ascii=False, default=str)
+    print(text)
+    if args.report_out:
+        os.makedirs(os.path.dirname(args.report_out) or ".", exist_ok=True)
+        with open(args.report_out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()